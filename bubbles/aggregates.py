@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""Aggregation kernels.
+
+An *aggregate kernel* describes one aggregation function by four steps: the
+initial state of a group (`init`), update of the state by a value (`update`),
+merge of two partial states of the same group (`merge`) and conversion of
+the state into the aggregated value (`finalize`). Updates and merges are
+Python source templates, all aggregations of a row are compiled into one
+function – the measures are not looked up by name for every row.
+
+Partial states can be merged, therefore groups might be aggregated in
+chunks (for example in spilled hash partitions) and combined later."""
+
+import itertools
+import math
+import textwrap
+from collections import namedtuple
+
+from .errors import *
+from .sketches import HyperLogLog, QuantileSketch
+
+__all__ = (
+    "AggregateKernel",
+    "register_aggregate",
+    "aggregate_kernel",
+    "aggregate_names",
+    "compile_aggregates",
+    "distinct_count_kernel",
+    "quantile_kernel",
+)
+
+
+class AggregateKernel(object):
+    def __init__(self, name, init, update, merge, finalize=None,
+                 storage_type=None, namespace=None, remove=None):
+        """Creates an aggregate kernel `name`.
+
+        * `init` – tuple of initial values of the state slots of a group.
+          Values should be immutable.
+        * `update` – source template that updates the state by a value. The
+          state slots are ``{s0}``, ``{s1}``, …, the value is ``{value}``
+          and ``{tmp}`` is an unique prefix for temporary variables.
+        * `merge` – source template that merges another state ``{o0}``,
+          ``{o1}``, … into the state slots
+        * `finalize` – function that gets the state slots as arguments and
+          returns the aggregated value. Default is value of the first slot.
+        * `storage_type` – storage type of the aggregated field, ``None``
+          means the storage type of the measure
+        * `namespace` – dictionary of global names used in the templates
+        * `remove` – source template that reverts the update by a value,
+          used to slide a window frame. ``None`` if the update can not be
+          reverted.
+
+        Templates are formatted with :meth:`str.format`, braces have to be
+        doubled. ``None`` values should be skipped by the update, as SQL
+        aggregate functions do.
+        """
+
+        self.name = name
+        self.init = tuple(init)
+        self.update = textwrap.dedent(update).strip()
+        self.merge = textwrap.dedent(merge).strip()
+        self.finalize = finalize
+        self.storage_type = storage_type
+        self.namespace = namespace or {}
+        self.remove = textwrap.dedent(remove).strip() if remove else None
+
+    def __repr__(self):
+        return "AggregateKernel(%r)" % self.name
+
+
+_kernels = {}
+
+
+def register_aggregate(kernel):
+    """Registers aggregate `kernel`, replaces a kernel of the same name."""
+    _kernels[kernel.name] = kernel
+
+
+def aggregate_kernel(name):
+    """Returns aggregate kernel `name`. Raises `ArgumentError` when there
+    is no such kernel."""
+    try:
+        return _kernels[name]
+    except KeyError:
+        raise ArgumentError("Unknown aggregation function '%s'" % (name, ))
+
+
+def aggregate_names():
+    """Returns sorted list of names of registered aggregate kernels."""
+    return sorted(_kernels.keys())
+
+
+CompiledAggregates = namedtuple("CompiledAggregates",
+                                ["new", "update", "merge", "finalize",
+                                 "remove"])
+
+
+def compile_aggregates(aggregates):
+    """Compiles `aggregates` – list of tuples (`function`, `index`) where
+    `function` is name of an aggregate kernel and `index` is index of the
+    measure in a row. Returns a named tuple with functions:
+
+    * `new()` – returns state of a new group
+    * `update(state, row)` – aggregates `row` into the `state`
+    * `merge(state, other)` – merges `other` partial state into the `state`
+    * `finalize(state)` – returns list of aggregated values
+    * `remove(state, row)` – removes previously aggregated `row` from the
+      `state`. ``None`` if a kernel has no `remove` template.
+
+    `index` of ``count`` might be ``None``.
+    """
+
+    namespace = {}
+    init = []
+    load = []
+    update = []
+    merge = []
+    remove = []
+    removable = True
+    finals = []
+    values = {}
+
+    for i, (function, index) in enumerate(aggregates):
+        kernel = aggregate_kernel(function)
+        namespace.update(kernel.namespace)
+
+        if index not in values:
+            var = "v%d" % len(values)
+            values[index] = var
+            if index is not None:
+                load.append("%s = row[%d]" % (var, index))
+            else:
+                load.append("%s = None" % (var, ))
+
+        first = len(init)
+        init += kernel.init
+        slots = range(first, len(init))
+
+        names = {"value": values[index], "tmp": "_t%d" % i}
+        for j, slot in enumerate(slots):
+            names["s%d" % j] = "state[%d]" % slot
+            names["o%d" % j] = "other[%d]" % slot
+
+        update += kernel.update.format(**names).splitlines()
+        merge += kernel.merge.format(**names).splitlines()
+        if kernel.remove is not None:
+            remove += kernel.remove.format(**names).splitlines()
+        else:
+            removable = False
+
+        args = ", ".join("state[%d]" % slot for slot in slots)
+        if kernel.finalize:
+            name = "_f%d" % i
+            namespace[name] = kernel.finalize
+            finals.append("%s(%s)" % (name, args))
+        else:
+            finals.append("state[%d]" % first)
+
+    body = ["def update(state, row):"]
+    body += ["    " + line for line in load + update] or ["    pass"]
+    body.append("def merge(state, other):")
+    body += ["    " + line for line in merge] or ["    pass"]
+    body.append("def remove(state, row):")
+    body += ["    " + line for line in load + remove] or ["    pass"]
+    body.append("def finalize(state):")
+    body.append("    return [%s]" % ", ".join(finals))
+
+    source = "\n".join(body)
+    exec(compile(source, "<aggregates>", "exec"), namespace)
+
+    init = tuple(init)
+
+    def new():
+        return list(init)
+
+    return CompiledAggregates(new, namespace["update"], namespace["merge"],
+                              namespace["finalize"],
+                              namespace["remove"] if removable else None)
+
+
+#
+# Kernels
+#
+
+def _average(count, total):
+    return total / count if count else None
+
+def _stddev(count, mean, m2):
+    if count < 2:
+        return None
+    return math.sqrt(m2 / (count - 1))
+
+def _seen_value(seen, value):
+    return value
+
+
+register_aggregate(AggregateKernel("count", (0, ),
+    update="{s0} += 1",
+    merge="{s0} += {o0}",
+    storage_type="integer",
+    remove="{s0} -= 1"))
+
+register_aggregate(AggregateKernel("count_nonnull", (0, ),
+    update="""
+        if {value} is not None:
+            {s0} += 1
+    """,
+    merge="{s0} += {o0}",
+    storage_type="integer",
+    remove="""
+        if {value} is not None:
+            {s0} -= 1
+    """))
+
+register_aggregate(AggregateKernel("sum", (0, ),
+    update="""
+        if {value} is not None:
+            {s0} += {value}
+    """,
+    merge="{s0} += {o0}",
+    remove="""
+        if {value} is not None:
+            {s0} -= {value}
+    """))
+
+register_aggregate(AggregateKernel("min", (None, ),
+    update="""
+        if {value} is not None and ({s0} is None or {value} < {s0}):
+            {s0} = {value}
+    """,
+    merge="""
+        if {o0} is not None and ({s0} is None or {o0} < {s0}):
+            {s0} = {o0}
+    """))
+
+register_aggregate(AggregateKernel("max", (None, ),
+    update="""
+        if {value} is not None and ({s0} is None or {value} > {s0}):
+            {s0} = {value}
+    """,
+    merge="""
+        if {o0} is not None and ({s0} is None or {o0} > {s0}):
+            {s0} = {o0}
+    """))
+
+register_aggregate(AggregateKernel("average", (0, 0),
+    update="""
+        if {value} is not None:
+            {s0} += 1
+            {s1} += {value}
+    """,
+    merge="""
+        {s0} += {o0}
+        {s1} += {o1}
+    """,
+    finalize=_average,
+    storage_type="float",
+    remove="""
+        if {value} is not None:
+            {s0} -= 1
+            {s1} -= {value}
+    """))
+
+# Sample standard deviation. The state is count, mean and sum of squared
+# differences from the mean (Welford), partial states are merged with the
+# pairwise formula of Chan et al.
+register_aggregate(AggregateKernel("stddev", (0, 0.0, 0.0),
+    update="""
+        if {value} is not None:
+            {s0} += 1
+            {tmp}_delta = {value} - {s1}
+            {s1} += {tmp}_delta / {s0}
+            {s2} += {tmp}_delta * ({value} - {s1})
+    """,
+    merge="""
+        if {o0}:
+            {tmp}_count = {s0} + {o0}
+            {tmp}_delta = {o1} - {s1}
+            {s2} += {o2} + {tmp}_delta * {tmp}_delta * {s0} * {o0} / {tmp}_count
+            {s1} += {tmp}_delta * {o0} / {tmp}_count
+            {s0} = {tmp}_count
+    """,
+    finalize=_stddev,
+    storage_type="float"))
+
+# First and last values of a group in the order of rows, including ``None``.
+# Partial states have to be merged in the same order.
+register_aggregate(AggregateKernel("first", (False, None),
+    update="""
+        if not {s0}:
+            {s0} = True
+            {s1} = {value}
+    """,
+    merge="""
+        if not {s0} and {o0}:
+            {s0} = True
+            {s1} = {o1}
+    """,
+    finalize=_seen_value))
+
+register_aggregate(AggregateKernel("last", (False, None),
+    update="""
+        {s0} = True
+        {s1} = {value}
+    """,
+    merge="""
+        if {o0}:
+            {s0} = True
+            {s1} = {o1}
+    """,
+    finalize=_seen_value))
+
+
+#
+# Approximate kernels
+#
+# States are sketches from `bubbles.sketches` created for the first
+# non-None value of a group.
+
+_SKETCH_UPDATE = """
+    if {value} is not None:
+        if {s0} is None:
+            {s0} = %s()
+        {s0}.add({value})
+"""
+
+_SKETCH_MERGE = """
+    if {o0} is not None:
+        if {s0} is None:
+            {s0} = {o0}
+        else:
+            {s0}.merge({o0})
+"""
+
+_sketch_counter = itertools.count()
+
+def _sketch_kernel(name, new, finalize, storage_type=None):
+    """Returns kernel `name` with a sketch created by `new()` as state."""
+    factory = "_sketch%d" % next(_sketch_counter)
+    return AggregateKernel(name, (None, ), _SKETCH_UPDATE % factory,
+                           _SKETCH_MERGE, finalize,
+                           storage_type=storage_type,
+                           namespace={factory: new})
+
+
+def distinct_count_kernel(name, precision=None):
+    """Returns a kernel `name` of approximate count of distinct values with
+    a `HyperLogLog` of `precision`. Register the kernel to use a precision
+    other than the default::
+
+        register_aggregate(distinct_count_kernel("count_distinct_fine",
+                                                 hll_precision(0.005)))
+    """
+
+    def finalize(sketch):
+        return sketch.count() if sketch is not None else 0
+
+    return _sketch_kernel(name, lambda: HyperLogLog(precision), finalize,
+                          storage_type="integer")
+
+
+def quantile_kernel(name, q, k=None):
+    """Returns a kernel `name` of approximate `q`-quantile computed with a
+    `QuantileSketch` of size `k`."""
+
+    def finalize(sketch):
+        return sketch.quantile(q) if sketch is not None else None
+
+    return _sketch_kernel(name, lambda: QuantileSketch(k), finalize)
+
+
+register_aggregate(distinct_count_kernel("count_distinct_approx"))
+register_aggregate(quantile_kernel("median", 0.5))
+register_aggregate(quantile_kernel("p95", 0.95))
+register_aggregate(quantile_kernel("p99", 0.99))
@@ -82,7 +82,7 @@ class MongoDBCollection(DataObject):
     def __init__(self, collection, fields, truncate=False,
                  expand=False,
                  database=None, host='localhsot', port=27017,
-                 store=None):
+                 store=None, limit=None):
         """Creates a MongoDB data object.
 
         Attributes
@@ -93,6 +93,8 @@ class MongoDBCollection(DataObject):
         * `expand`: expand dictionary values and treat children as top-level
           keys with dot '.' separated key path to the child.
         * `store`: MongoDBStore owning the object
+        * `limit`: maximal number of documents to be read, ``None`` means
+          all documents
 
         Specify either store or database, not both.
         """
@@ -121,17 +123,20 @@ class MongoDBCollection(DataObject):
                                       "implemented, please specify them "
                                       "manually")
         self.fields = fields
+        self.limit = limit
 
         if truncate:
             self.truncate()
 
-    def clone(self, fields=None, expand=None):
+    def clone(self, fields=None, expand=None, limit=None):
         fields = fields or self.fields
         if expand is None:
             expand = self.expand
+        if limit is None:
+            limit = self.limit
 
         return MongoDBCollection(collection=self.collection, store=self.store,
-                             fields=fields, expand=expand)
+                             fields=fields, expand=expand, limit=limit)
 
     def representations(self):
         return ["mongo", "records", "rows"]
@@ -143,16 +148,28 @@ class MongoDBCollection(DataObject):
         self.collection.remove()
 
     def __len__(self):
-        return self.collection.count()
+        count = self.collection.count()
+        if self.limit is not None:
+            count = min(count, self.limit)
+        return count
+
+    def _find(self, fields):
+        # pymongo treats limit of 0 as no limit
+        if self.limit == 0:
+            return iter([])
+        cursor = self.collection.find(fields=fields)
+        if self.limit is not None:
+            cursor = cursor.limit(self.limit)
+        return cursor
 
     def rows(self):
         fields = self.fields.names()
-        iterator = self.collection.find(fields=fields)
+        iterator = self._find(fields)
         return MongoDBRowIterator(iterator, fields, self.expand)
 
     def records(self):
-        fields = self.field.names()
-        iterator = self.collection.find(fields=fields)
+        fields = self.fields.names()
+        iterator = self._find(fields)
         return MongoDBRecordIterator(iterator, self.expand)
 
     def append(self, obj):
@@ -5,6 +5,7 @@ from ...metadata import *
 from ...errors import *
 from ...prototypes import *
 from ...objects import *
+from ...operation import RetryOperation
 
 def prepare_mongo_key(key):
     key = prepare_key(key)
@@ -40,6 +41,20 @@ def _(ctx, obj, keep=None, drop=None, rename=None, filter=None):
 # Row Operations
 
 
+@sample.register("mongo")
+def _(ctx, obj, value, discard=False, mode="first", seed=None, key=None):
+    """Returns the first `value` documents with ``cursor.limit()``. Other
+    modes are sampled as rows."""
+
+    if mode != "first" or discard:
+        raise RetryOperation(["rows"], reason="Unhandled mode '%s'" % mode)
+
+    if obj.limit is not None:
+        value = min(value, obj.limit)
+
+    return obj.clone(limit=value)
+
+
 @distinct.register("mongo")
 def _(ctx, obj, key=None):
 
@@ -0,0 +1,3 @@
+from .objects import *
+from .ops import *
+
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Columnar data objects backed by NumPy arrays."""
+
+import itertools
+from ...objects import *
+from ...errors import *
+from ...metadata import FieldFilter
+
+__all__ = (
+        "ColumnsDataObject",
+        "column_dtype",
+    )
+
+try:
+    import numpy
+except ImportError:
+    from ...common import MissingPackage
+    numpy = MissingPackage("numpy", "columnar objects", "http://www.numpy.org/")
+
+"""Storage types that are stored in typed arrays. Values of other types are
+stored as Python objects."""
+_storage_dtypes = {
+    "integer": "int64",
+    "number": "float64",
+    "float": "float64",
+    "boolean": "bool",
+}
+
+"""Number of rows converted to arrays at once."""
+DEFAULT_COLUMNS_CHUNK_SIZE = 65536
+
+
+def column_dtype(field):
+    """Returns name of NumPy data type for values of `field`."""
+    return _storage_dtypes.get(field.storage_type, "object")
+
+
+def _column(values, dtype):
+    """Returns an array with `values` of `dtype`. If there are ``None``
+    values, a masked array is returned where ``None`` values are masked. If
+    the values can not be converted, an array of objects is returned."""
+
+    if dtype != "object":
+        nulls = [value is None for value in values]
+        try:
+            if any(nulls):
+                filled = [0 if null else value
+                          for value, null in zip(values, nulls)]
+                array = numpy.array(filled, dtype=dtype)
+                return numpy.ma.MaskedArray(array, mask=nulls)
+            else:
+                return numpy.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            pass
+
+    array = numpy.empty(len(values), dtype="object")
+    array[:] = values
+    nulls = numpy.equal(array, None)
+
+    if nulls.any():
+        return numpy.ma.MaskedArray(array, mask=nulls)
+    else:
+        return array
+
+
+def _concatenate(chunks):
+    if any(numpy.ma.isMaskedArray(chunk) for chunk in chunks):
+        return numpy.ma.concatenate(chunks)
+    else:
+        return numpy.concatenate(chunks)
+
+
+class ColumnsDataObject(DataObject):
+    """Data held in NumPy arrays – one array per field. Fields with ``None``
+    values are held in masked arrays."""
+
+    __identifier__ = "columns"
+
+    _bubbles_info = {
+        "attributes": [
+            {"name":"columns", "description": "list of arrays"},
+            {"name":"fields", "description":"fields of the columns"}
+        ],
+        "requirements": ["numpy"]
+    }
+
+    def __init__(self, columns, fields):
+        """Creates a columnar object with list of arrays `columns` – one
+        array for each field in `fields`. All arrays should have the same
+        length."""
+
+        if len(columns) != len(fields):
+            raise ArgumentError("Number of columns %s does not match number "
+                                "of fields %s" % (len(columns), len(fields)))
+
+        self.columns = list(columns)
+        self.fields = fields
+
+    @classmethod
+    def from_batches(cls, batches, fields):
+        """Creates a columnar object from an iterable of `batches` of rows
+        with `fields`. Rows are converted to arrays batch by batch."""
+
+        dtypes = [column_dtype(field) for field in fields]
+        chunks = [[] for field in fields]
+
+        for batch in batches:
+            if not batch:
+                continue
+            for i, values in enumerate(zip(*batch)):
+                chunks[i].append(_column(values, dtypes[i]))
+
+        columns = []
+        for dtype, column_chunks in zip(dtypes, chunks):
+            if column_chunks:
+                columns.append(_concatenate(column_chunks))
+            else:
+                columns.append(numpy.array([], dtype=dtype))
+
+        return cls(columns, fields)
+
+    @classmethod
+    def from_rows(cls, rows, fields, chunk_size=None):
+        """Creates a columnar object from an iterable of rows. Rows are
+        converted in chunks of `chunk_size` rows."""
+        batches = iter_batches(rows, chunk_size or DEFAULT_COLUMNS_CHUNK_SIZE)
+        return cls.from_batches(batches, fields)
+
+    def representations(self):
+        return ["columns", "rows", "records"]
+
+    def __len__(self):
+        if self.columns:
+            return len(self.columns[0])
+        else:
+            return 0
+
+    def size_hint(self):
+        return len(self)
+
+    def column(self, field):
+        """Returns array of `field`."""
+        return self.columns[self.fields.index(str(field))]
+
+    def take(self, selector, fields=None):
+        """Returns a new object with rows selected by `selector` – a boolean
+        mask or an array of indexes. If `fields` are specified, only their
+        columns are taken. Rows selected by a mask keep the ordering."""
+
+        if fields is None:
+            fields = self.fields
+            columns = self.columns
+        else:
+            columns = [self.column(field) for field in fields]
+
+        obj = ColumnsDataObject([column[selector] for column in columns],
+                                fields.clone())
+
+        if getattr(selector, "dtype", None) == bool:
+            names = fields.names()
+            obj.ordering = FieldFilter(keep=names) \
+                                .filter_ordering(self.ordering)
+
+        return obj
+
+    def batches(self, size=None):
+        size = size or DEFAULT_BATCH_SIZE
+        for start in range(0, len(self), size):
+            # Masked values are converted to None by tolist()
+            values = [column[start:start + size].tolist()
+                      for column in self.columns]
+            yield list(zip(*values))
+
+    def rows(self):
+        return itertools.chain.from_iterable(self.batches())
+
+    def records(self):
+        names = self.fields.names()
+        for row in self.rows():
+            yield dict(zip(names, row))
+
+    def is_consumable(self):
+        return False
+
+    def retained(self, count=1, budget=None):
+        return self
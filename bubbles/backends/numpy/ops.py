@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""Vectorized operations on columnar objects.
+
+``None`` values (masked values of the arrays) never match a filter
+condition, except `filter_by_value` with value ``None`` and `filter_by_set`
+with ``None`` in the set. Aggregations skip ``None`` values, as SQL does."""
+
+from .objects import ColumnsDataObject
+
+from ...metadata import *
+from ...errors import *
+from ...prototypes import *
+from ...objects import *
+from ...operation import RetryOperation
+
+try:
+    import numpy
+except ImportError:
+    from ...common import MissingPackage
+    numpy = MissingPackage("numpy", "columnar objects", "http://www.numpy.org/")
+
+
+def _unmasked(column):
+    """Returns tuple (`data`, `nulls`) – array of values of `column` and
+    boolean array of ``None`` values."""
+    return (numpy.ma.getdata(column), numpy.ma.getmaskarray(column))
+
+
+def _factorize(data):
+    """Returns ranks of values in array of objects `data`. Objects are
+    compared only once for every distinct value."""
+
+    codes = {}
+    indexes = numpy.fromiter((codes.setdefault(value, len(codes))
+                              for value in data),
+                             dtype="int64", count=len(data))
+
+    # Rank of each distinct value in the order of first occurrence
+    order = sorted(range(len(codes)), key=list(codes).__getitem__)
+    ranks = numpy.empty(len(codes), dtype="int64")
+    ranks[order] = numpy.arange(len(codes))
+
+    return ranks[indexes]
+
+
+def _ranks(column):
+    """Returns array of ranks of values in `column`: equal values have equal
+    rank, smaller values have smaller rank. ``None`` values have rank
+    ``-1``."""
+
+    data, nulls = _unmasked(column)
+
+    if data.dtype == object:
+        rank = _factorize
+    else:
+        rank = lambda values: numpy.unique(values, return_inverse=True)[1]
+
+    if not nulls.any():
+        return rank(data).reshape(-1)
+
+    ranks = numpy.full(len(data), -1, dtype="int64")
+    ranks[~nulls] = rank(data[~nulls]).reshape(-1)
+    return ranks
+
+
+def _group_codes(obj, key):
+    """Returns tuple (`codes`, `first`) where `codes` is an array with group
+    number of each row of `obj` grouped by fields `key` and `first` is array
+    of index of the first row of each group. Groups are ordered by the key
+    values."""
+
+    # Combine ranks of the key fields into one number. Ranks are shifted by
+    # one, because None values have rank -1.
+    combined = numpy.zeros(len(obj), dtype="int64")
+    for field in key:
+        ranks = _ranks(obj.column(field)) + 1
+        combined = combined * (int(ranks.max()) + 1) + ranks
+        # Keep the combined numbers small
+        combined = numpy.unique(combined, return_inverse=True)[1]
+        combined = combined.reshape(-1)
+
+    _, first, codes = numpy.unique(combined, return_index=True,
+                                   return_inverse=True)
+
+    return (codes.reshape(-1), first)
+
+
+#############################################################################
+# Conversions
+
+@as_columns.register("batches")
+def _(ctx, obj, chunk_size=None):
+    """Reads rows of `obj` into NumPy arrays in batches of `chunk_size`
+    rows."""
+    return ColumnsDataObject.from_batches(obj.batches(chunk_size), obj.fields)
+
+@as_columns.register("columns")
+def _(ctx, obj, chunk_size=None):
+    return obj
+
+
+#############################################################################
+# Row Filters
+
+@filter_by_value.register("columns")
+def _(ctx, obj, key, value, discard=False):
+    data, nulls = _unmasked(obj.column(key))
+
+    if value is None:
+        selector = nulls
+    else:
+        selector = numpy.asarray(data == value, dtype="bool") & ~nulls
+
+    if discard:
+        selector = ~selector
+
+    return obj.take(selector)
+
+@filter_by_set.register("columns")
+def _(ctx, obj, field, values, discard=False):
+    data, nulls = _unmasked(obj.column(field))
+    values = set(values)
+    match_nulls = None in values
+    values.discard(None)
+
+    selector = None
+    if data.dtype != object:
+        try:
+            selector = numpy.isin(data, list(values))
+        except TypeError:
+            pass
+
+    if selector is None:
+        contains = numpy.frompyfunc(values.__contains__, 1, 1)
+        selector = contains(data).astype("bool")
+
+    selector &= ~nulls
+    if match_nulls:
+        selector |= nulls
+
+    if discard:
+        selector = ~selector
+
+    return obj.take(selector)
+
+@filter_by_range.register("columns")
+def _(ctx, obj, field, low, high, discard=False):
+    data, nulls = _unmasked(obj.column(field))
+
+    selector = ~nulls
+    if low is not None:
+        selector &= numpy.asarray(low <= data, dtype="bool")
+    if high is not None:
+        selector &= numpy.asarray(data <= high, dtype="bool")
+
+    if discard:
+        selector = ~selector
+
+    return obj.take(selector)
+
+
+#############################################################################
+# Ordering and distinct values
+
+@sort.register("columns")
+def _(ctx, obj, orderby):
+    """Sorts rows by `orderby`. ``None`` is the smallest value."""
+    orderby = prepare_order_list(orderby)
+
+    keys = []
+    for field, order in orderby:
+        ranks = _ranks(obj.column(field))
+
+        if order.startswith("asc"):
+            keys.append(ranks)
+        elif order.startswith("desc"):
+            keys.append(-ranks)
+        else:
+            raise ArgumentError("Unknown order %s for column %s"
+                                % (order, field))
+
+    if not keys:
+        return obj
+
+    # The last key is the primary key of lexsort()
+    result = obj.take(numpy.lexsort(keys[::-1]))
+    result.ordering = prepare_ordering(orderby)
+    return result
+
+@distinct.register("columns")
+def _(ctx, obj, key=None, is_sorted=False):
+    """Returns distinct values of `key` fields in order of their first
+    occurrence."""
+
+    if key:
+        row_filter = FieldFilter(keep=prepare_key(key)).row_filter(obj.fields)
+    else:
+        row_filter = FieldFilter().row_filter(obj.fields)
+
+    # Retain original order of fields
+    fields = FieldList(*row_filter(obj.fields))
+
+    if not len(obj):
+        return obj.take(slice(None), fields)
+
+    _, first = _group_codes(obj, fields.names())
+
+    return obj.take(numpy.sort(first), fields)
+
+
+#############################################################################
+# Aggregate
+
+def _aggregate_column(function, data, nulls, codes, count):
+    """Returns masked array of `function` aggregates of `data` for `count`
+    groups specified by `codes`. ``None`` values are skipped."""
+
+    values = data[~nulls]
+    codes = codes[~nulls]
+    counts = numpy.bincount(codes, minlength=count)
+
+    if function == "sum":
+        if data.dtype.kind == "f":
+            return numpy.bincount(codes, weights=values, minlength=count)
+        result = numpy.zeros(count, dtype=data.dtype)
+        numpy.add.at(result, codes, values)
+        return result
+
+    elif function == "average":
+        sums = numpy.bincount(codes, weights=values, minlength=count)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            result = sums / counts
+
+    elif function in ("min", "max"):
+        if function == "min":
+            ufunc, order = numpy.minimum, 1
+        else:
+            ufunc, order = numpy.maximum, -1
+
+        # Start with a value of every group, so the identity of the
+        # function does not matter
+        result = numpy.zeros(count, dtype=data.dtype)
+        result[codes[::order]] = values[::order]
+        ufunc.at(result, codes, values)
+
+    else:
+        raise RetryOperation(["rows"], reason="Unknown aggregation '%s'"
+                                              % function)
+
+    return numpy.ma.MaskedArray(result, mask=counts == 0)
+
+@aggregate.register("columns")
+def _(ctx, obj, key, measures=None, include_count=True,
+      count_field="record_count"):
+    """Aggregates `measures` grouped by `key` fields. Result is ordered by the
+    key. Numeric measures are aggregated, for other measures the operation
+    is retried with rows."""
+
+    keys = prepare_key(key) if key else []
+    measures = prepare_aggregation_list(measures)
+
+    for name, function in measures:
+        data = numpy.ma.getdata(obj.column(name))
+        if data.dtype == object or data.dtype == bool:
+            raise RetryOperation(["rows"], reason="Measure '%s' is not "
+                                                   "numeric" % name)
+
+    out_fields = FieldList()
+    if keys:
+        out_fields += obj.fields.fields(keys)
+    out_fields += obj.fields.aggregated_fields(measures, include_count,
+                                               count_field)
+
+    if keys and len(obj):
+        codes, first = _group_codes(obj, keys)
+        count = len(first)
+    else:
+        codes = numpy.zeros(len(obj), dtype="int64")
+        first = numpy.zeros(1 if len(obj) else 0, dtype="int64")
+        count = len(first)
+
+    columns = [obj.column(name)[first] for name in keys]
+
+    for name, function in measures:
+        data, nulls = _unmasked(obj.column(name))
+        columns.append(_aggregate_column(function, data, nulls, codes, count))
+
+    if include_count:
+        columns.append(numpy.bincount(codes, minlength=count))
+
+    result = ColumnsDataObject(columns, out_fields)
+    result.ordering = [(name, "asc") for name in keys]
+    return result
@@ -124,6 +124,26 @@ def concrete_storage_type(field, type_map={}, dialect=None):
 """List of default shared stores."""
 _default_stores = {}
 
+# Storage types that a database orders the same way as Python does. Strings
+# are ordered by a collation, which might be case-insensitive or specific to
+# a locale.
+_comparable_types = ("integer", "number", "boolean", "date", "datetime",
+                     "time")
+
+def comparable_ordering(ordering, fields):
+    """Returns the beginning of statement `ordering` that agrees with Python
+    comparison of the values, so it can be used by ``rows`` operations that
+    merge or group sorted rows. The ordering ends at the first field that is
+    not of a comparable type, such as a string."""
+
+    result = []
+    for field, order in ordering:
+        if fields.field(field).storage_type not in _comparable_types:
+            break
+        result.append((field, order))
+
+    return result
+
 def reflect_fields(selectable):
     """Get fields from a table. Field types are normalized to the bubbles
     data types. Analytical type is set according to a default conversion
@@ -278,10 +298,12 @@ class SQLDataStore(DataStore):
 
         return objects
 
-    def get_object(self, name):
-        """Returns a `SQLTable` object for a table with name `name`."""
+    def get_object(self, name, version_query=None):
+        """Returns a `SQLTable` object for a table with name `name`. See
+        :class:`SQLTable` for `version_query`."""
 
-        obj = SQLTable(table=name, schema=self.schema, store=self)
+        obj = SQLTable(table=name, schema=self.schema, store=self,
+                       version_query=version_query)
         return obj
 
     def exists(self, name):
@@ -291,15 +313,18 @@ class SQLDataStore(DataStore):
         except NoSuchObjectError:
             return False
 
-    def statement(self, statement, fields=None):
-        """Returns a statement object belonging to this store"""
+    def statement(self, statement, fields=None, ordering=None):
+        """Returns a statement object belonging to this store. `ordering` is
+        list of tuples (`field`, `order`) of the statement's ``ORDER BY``
+        clause, if there is any."""
         if not fields:
             fields = reflect_fields(statement)
 
         return SQLStatement(statement=statement,
                             store=self,
                             fields=fields,
-                            schema=self.schema)
+                            schema=self.schema,
+                            ordering=ordering)
 
     def create(self, name, fields, replace=False, from_obj=None, schema=None,
                id_column=None):
@@ -451,6 +476,13 @@ class SQLDataObject(DataObject):
         else:
             return False
 
+    def is_thread_bound(self):
+        """Returns `True` if the store keeps one connection per thread, such
+        as SQLite in-memory database, where every thread sees its own
+        database."""
+        pool = self.store.connectable.engine.pool
+        return isinstance(pool, sqlalchemy.pool.SingletonThreadPool)
+
     def records(self):
         # SQLAlchemy result is dict-like object where values can be accessed
         # by field names as well, so we just return the same iterator
@@ -459,12 +491,30 @@ class SQLDataObject(DataObject):
     def __iter__(self):
         return self.rows()
 
+    def batches(self, size=None):
+        """Returns batches of rows fetched from the database with
+        ``fetchmany()``, at most `size` rows at a time."""
+
+        size = size or DEFAULT_BATCH_SIZE
+        result = self.store.execute(self.selectable())
+
+        try:
+            while True:
+                batch = result.fetchmany(size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            result.close()
+
     def is_consumable(self):
         return False
 
-    def clone_statement(self, statement=None, fields=None):
+    def clone_statement(self, statement=None, fields=None, ordering=None):
         """Clone statement representation from the receiver. If `statement` or
         `fields` are not specified, then they are copied from the receiver.
+        `ordering` declares the ``ORDER BY`` of the new statement, it is not
+        copied – an outer statement does not keep order of its sub-query.
 
         Use this method in operations to create derived statements from the
         receiver.
@@ -474,7 +524,7 @@ class SQLDataObject(DataObject):
 
         fields = fields or self.fields.clone()
         obj = SQLStatement(statement, self.store, fields=fields,
-                                    schema=self.schema)
+                                    schema=self.schema, ordering=ordering)
         return obj
 
 class SQLStatement(SQLDataObject):
@@ -490,7 +540,8 @@ class SQLStatement(SQLDataObject):
         "requirements": ["sqlalchemy"]
     }
 
-    def __init__(self, statement, store, fields=None, schema=None):
+    def __init__(self, statement, store, fields=None, schema=None,
+                 ordering=None):
         """Creates a relational database data object.
 
         Attributes:
@@ -501,6 +552,9 @@ class SQLStatement(SQLDataObject):
         * `schema` - database schema, if different than schema of `store`
         * `fields` - list of fields that override automatic field reflection
           from the statement
+        * `ordering` - list of tuples (`field`, `order`) of the statement's
+          ``ORDER BY`` clause. Only its beginning that Python comparison
+          agrees with is declared, see `comparable_ordering()`
 
         If `store` is not provided, then default store is used for given
         connectable or URL. If no store exists, one is created.
@@ -522,6 +576,10 @@ class SQLStatement(SQLDataObject):
         else:
             self.fields = reflect_fields(statement)
 
+        if ordering:
+            self.ordering = comparable_ordering(prepare_ordering(ordering),
+                                                self.fields)
+
     def as_target(self):
         raise DataObjectError("SQL statement (%s) can not be used "
                                 "as target object" % self.name)
@@ -543,7 +601,7 @@ class SQLStatement(SQLDataObject):
 
     def representations(self):
         """Return list of possible object representations"""
-        return ["sql", "rows", "records"]
+        return ["sql", "rows", "batches", "records"]
 
     def columns(self, fields=None):
         """Returns Column objects for `fields`. If no `fields` are specified,
@@ -592,7 +650,7 @@ class SQLTable(SQLDataObject):
 
     def __init__(self, table, store, fields=None, schema=None,
                  create=False, replace=False, truncate=False,
-                 id_key_name=None, buffer_size=1024):
+                 id_key_name=None, buffer_size=1024, version_query=None):
         """Creates a relational database data object.
 
         Attributes:
@@ -612,6 +670,10 @@ class SQLTable(SQLDataObject):
         * `buffer_size`: size of buffer for table INSERTs - how many records
           are collected before they are inserted using multi-insert statement.
           Default is 1000.
+        * `version_query`: SQL query returning a single value that changes
+          whenever the table content changes, such as ``SELECT
+          max(updated_at) FROM orders``. Used as table fingerprint for result
+          caching. Tables without the query are not fingerprinted.
 
         """
 
@@ -639,6 +701,7 @@ class SQLTable(SQLDataObject):
                 self.fields = reflect_fields(self.table)
 
         self.name = self.table.name
+        self.version_query = version_query
 
         if truncate:
             self.table.delete().execute()
@@ -656,7 +719,20 @@ class SQLTable(SQLDataObject):
 
     def representations(self):
         """Return list of possible object representations"""
-        return ["sql_table", "sql", "records", "rows"]
+        return ["sql_table", "sql", "records", "rows", "batches"]
+
+    def fingerprint(self):
+        """Returns fingerprint of the table – result of the `version_query`
+        together with the database URL and the table name. Returns `None` if
+        there is no version query."""
+        if not self.version_query:
+            return None
+
+        version = self.store.connectable.scalar(
+                        sqlalchemy.text(self.version_query))
+
+        return ("sql", str(self.store.connectable.engine.url), self.schema,
+                self.name, str(version), self.fields.names())
 
     def selectable(self):
         return self.table.select()
@@ -669,7 +745,8 @@ class SQLTable(SQLDataObject):
 
     def __len__(self):
         """Returns number of rows in a table"""
-        statement = self.table.count()
+        statement = sql.expression.select([sqlalchemy.sql.func.count(1)],
+                                          from_obj=self.table)
         result = self.store.connectable.scalar(statement)
         return result
 
@@ -687,6 +764,14 @@ class SQLTable(SQLDataObject):
         if len(self._insert_buffer) >= self.buffer_size:
             self.flush()
 
+    def append_batch(self, batch):
+        """Inserts list of rows `batch` with one statement. Rows appended
+        before with `append()` are inserted first."""
+        self.flush()
+        if batch:
+            rows = [dict(zip(self._field_names, row)) for row in batch]
+            self.store.execute(self.insert_statement, rows)
+
     def flush(self):
         if self._insert_buffer:
             self.store.execute(self.insert_statement, self._insert_buffer)
@@ -1,9 +1,15 @@
+import decimal
 import functools
-from ...operation import RetryOperation
+from ...operation import RetryOperation, INFINITE_COST
 from ...prototypes import *
-from ...metadata import Field, FieldList, FieldFilter
+from ...metadata import Field, FieldList, FieldFilter, to_field
 from ...metadata import prepare_aggregation_list, prepare_order_list
-from ...objects import IterableDataSource
+from ...metadata import prepare_window_functions, RANKING_FUNCTIONS
+from ...metadata import OFFSET_FUNCTIONS
+from ...objects import IterableDataSource, estimated_size, prepare_ordering
+from ...objects import iter_batches
+from ...sketches import BloomFilter
+from ...expression import sql_expression
 from ...errors import *
 from .utils import prepare_key, zip_condition, join_on_clause
 
@@ -24,6 +30,36 @@ def _unary(func):
 
     return decorator
 
+#############################################################################
+# Cost estimates
+
+"""Cost of one query round trip to the database in units of rows processed
+in Python."""
+QUERY_COST = 100
+
+def _composition_cost(ctx, obj, others, *args, **kwargs):
+    """Cost of an operation composed into one statement: one query if all
+    the objects are in the same database, otherwise the composition can not
+    be used."""
+
+    if not isinstance(others, (list, tuple)):
+        others = [others]
+
+    if all(obj.can_compose(other) for other in others):
+        return QUERY_COST
+    else:
+        return INFINITE_COST
+
+def _appended_cost(ctx, objects):
+    return _composition_cost(ctx, objects[0], objects[1:])
+
+def _probe_cost(ctx, src, target, *args, **kwargs):
+    """Cost of reading keys of the `target` and of probing rows of `src` in
+    chunks of `PROBE_CHUNK_SIZE`. Always more than a composition."""
+    chunks = estimated_size(src) // PROBE_CHUNK_SIZE + 1
+    return (chunks + 1) * QUERY_COST
+
+
 #############################################################################
 # Metadata Operations
 
@@ -128,6 +164,35 @@ def _(ctx, obj, fields, predicate, discard=False):
     raise RetryOperation(["rows"], reason="Not implemented")
 
 
+def _compile_expression(statement, expression):
+    """Returns SQL clause of `expression` over columns of `statement`.
+    Expressions that can not be compiled into SQL are evaluated as
+    rows."""
+    try:
+        return sql_expression(expression, statement.c)
+    except ExpressionError as e:
+        raise RetryOperation(["rows"], reason=str(e))
+
+
+@filter_by_expression.register("sql")
+def _(ctx, obj, expression, discard=False):
+    """Filters rows by `expression` compiled into a ``WHERE`` clause. As in
+    the ``rows`` version, rows where the expression is ``NULL`` are
+    discarded and kept with `discard`."""
+
+    statement = obj.sql_statement()
+    condition = _compile_expression(statement, expression)
+
+    if discard:
+        condition = sql.expression.or_(sql.expression.not_(condition),
+                                       condition.is_(None))
+
+    statement = sql.expression.select(obj.columns(), from_obj=statement,
+                                      whereclause=condition)
+
+    return obj.clone_statement(statement=statement)
+
+
 @distinct.register("sql")
 def _(ctx, obj, keys=None):
     """Returns a statement that selects distinct values for `keys`"""
@@ -153,22 +218,107 @@ def _(ctx, statement, keys=None):
     # TODO: use prepare_key
     raise RetryOperation(["rows"], reason="Not implemented")
 
+# Functions returning a random number in a dialect
+random_functions = {
+    "sqlite": sql.func.random,
+    "postgresql": sql.func.random,
+    "mysql": sql.func.rand,
+    "mssql": sql.func.newid,
+    "oracle": lambda: sql.literal_column("dbms_random.value"),
+}
+
+# Dialects that can sample a table with ``TABLESAMPLE BERNOULLI``
+tablesample_dialects = ("postgresql", )
+
+"""Tables with less rows are not pre-sampled with ``TABLESAMPLE``"""
+TABLESAMPLE_MIN_ROWS = 100000
+
+def _tablesample(obj, value):
+    """Returns ``TABLESAMPLE BERNOULLI`` of the table of `obj` that selects
+    about twice as many rows as `value` or ``None`` if the table can not or
+    does not have to be sampled. The whole table would be sorted by the
+    random order otherwise."""
+
+    table = getattr(obj, "table", None)
+    if table is None or obj.sql_statement() is not table:
+        return None
+
+    count = len(obj)
+    if count < TABLESAMPLE_MIN_ROWS:
+        return None
+
+    percent = 100.0 * (2 * value + 100) / count
+    if percent >= 100:
+        return None
+
+    return sqlalchemy.tablesample(table, sql.func.bernoulli(percent),
+                                  name="__sample")
+
+
 @sample.register("sql")
-@_unary
-def _(ctx, statement, value, mode="first"):
-    """Returns a sample. `statement` is expected to be ordered."""
+def _(ctx, obj, value, discard=False, mode="first", seed=None, key=None):
+    """Returns a sample. `statement` is expected to be ordered in the
+    ``first`` mode. ``random`` mode selects rows ordered by a random
+    number with a limit, ``TABLESAMPLE`` pre-selects rows of big PostgreSQL
+    tables. Stratified random sample by `key` is selected by
+    ``row_number()`` in partitions of the key. Seeded random samples and
+    the ``nth`` mode are sampled as rows."""
+
+    statement = obj.sql_statement()
 
     if mode == "first":
-        return statement.select(limit=value)
-    else:
+        if discard:
+            statement = statement.select(offset=value)
+        else:
+            statement = statement.select(limit=value)
+        return obj.clone_statement(statement=statement)
+
+    elif mode != "random":
         raise RetryOperation(["rows"], reason="Unhandled mode '%s'" % mode)
 
+    if discard:
+        raise ArgumentError("Random sample can not be discarded")
+
+    dialect = obj.store.connectable.dialect.name
+    random_function = random_functions.get(dialect)
+
+    if random_function is None:
+        raise RetryOperation(["rows"],
+                             reason="Random sample is not supported by %s"
+                                    % (dialect, ))
+    if seed is not None:
+        raise RetryOperation(["rows"], reason="Seeded random sample")
+
+    if key:
+        statement = statement.alias("__sample")
+        partition = [statement.c[str(field)] for field in prepare_key(key)]
+        rank = sql.func.row_number().over(partition_by=partition,
+                                          order_by=random_function())
+        ranked = sql.expression.select(list(statement.columns)
+                                       + [rank.label("__rank")],
+                                       from_obj=statement).alias("__ranked")
+        columns = [ranked.c[str(field)] for field in obj.fields]
+        condition = ranked.c["__rank"] <= value
+        statement = sql.expression.select(columns, from_obj=ranked,
+                                          whereclause=condition)
+    else:
+        if dialect in tablesample_dialects:
+            sampled = _tablesample(obj, value)
+            if sampled is not None:
+                statement = sampled
+        statement = statement.select(order_by=random_function(),
+                                     limit=value)
+
+    return obj.clone_statement(statement=statement)
+
 
 @sort.register("sql")
-@_unary
-def _(ctx, statement, orderby):
+def _(ctx, obj, orderby):
     """Returns a ordered SQL statement. `orders` should be a list of
-    two-element tuples `(field, order)`"""
+    two-element tuples `(field, order)`. The statement declares its
+    ordering."""
+
+    statement = obj.sql_statement()
 
     # Each attribute mentioned in the order should be present in the selection
     # or as some column from joined table. Here we get the list of already
@@ -185,22 +335,79 @@ def _(ctx, statement, orderby):
         elif order.startswith("desc"):
             column = column.desc()
         else:
-            raise ValueError("Unknown order %s for column %s") % (order, column)
+            raise ValueError("Unknown order %s for column %s"
+                             % (order, field))
 
         columns.append(column)
 
     statement = sql.expression.select(statement.columns,
                                    from_obj=statement,
                                    order_by=columns)
-    return statement
 
+    return obj.clone_statement(statement=statement, ordering=orderby)
+
+def _count_distinct(column):
+    return sql.functions.count(sql.func.distinct(column))
+
+# Functions of aggregate kernels (see `bubbles.aggregates`) that have a SQL
+# equivalent. Other kernels are aggregated as rows.
 aggregation_functions = {
     "sum": sql.functions.sum,
     "min": sql.functions.min,
     "max": sql.functions.max,
-    "count": sql.functions.count
+    "average": sql.func.avg,
+    "count": lambda column: sql.functions.count(1),
+    "count_nonnull": sql.functions.count,
+    "stddev": sql.func.stddev_samp,
+    # Exact count if the dialect has no approximate one
+    "count_distinct_approx": _count_distinct
+}
+
+# Dialects without the function
+unsupported_aggregations = {
+    "stddev": ("sqlite", )
+}
+
+def _percentile(q):
+    return lambda column: sql.func.percentile_cont(q).within_group(column)
+
+_approx_count_distinct = lambda column: sql.func.approx_count_distinct(column)
+
+# Functions that are specific to a dialect
+dialect_aggregation_functions = {
+    "postgresql": {
+        "median": _percentile(0.5),
+        "p95": _percentile(0.95),
+        "p99": _percentile(0.99),
+    },
+    "oracle": {
+        "median": _percentile(0.5),
+        "p95": _percentile(0.95),
+        "p99": _percentile(0.99),
+        "count_distinct_approx": _approx_count_distinct,
+    },
+    "snowflake": {
+        "median": _percentile(0.5),
+        "p95": _percentile(0.95),
+        "p99": _percentile(0.99),
+        "count_distinct_approx": _approx_count_distinct,
+    },
+    "bigquery": {
+        "count_distinct_approx": _approx_count_distinct,
+    },
 }
 
+def aggregation_function(name, dialect):
+    """Returns function that creates SQL aggregation `name` of a column in
+    `dialect` or ``None`` if the dialect does not have such function."""
+
+    functions = dialect_aggregation_functions.get(dialect, {})
+    if name in functions:
+        return functions[name]
+    if dialect in unsupported_aggregations.get(name, ()):
+        return None
+    return aggregation_functions.get(name)
+
 
 @aggregate.register("sql")
 def _(ctx, obj, key, measures=None, include_count=True,
@@ -225,13 +432,14 @@ def _(ctx, obj, key, measures=None, include_count=True,
 
     selection = [statement.c[str(key)] for key in keys]
 
+    dialect = obj.store.connectable.dialect.name
+
     for measure, agg_name in measures:
-        try:
-            func = aggregation_functions[agg_name]
-        except KeyError:
-            raise ArgumentError(
-                'Unknown aggregation function %r on measure %r' % (
-                    agg_name, measure))
+        func = aggregation_function(agg_name, dialect)
+        if func is None:
+            raise RetryOperation(["rows"],
+                                 reason="Aggregation '%s' is not supported "
+                                        "by %s" % (agg_name, dialect))
 
         label = "%s_%s" % (str(measure), agg_name)
         aggregation = func(obj.column(measure)).label(label)
@@ -248,6 +456,127 @@ def _(ctx, obj, key, measures=None, include_count=True,
     return obj.clone_statement(statement=statement, fields=out_fields)
 
 
+def _order_columns(columns, ordering):
+    """Returns ``ORDER BY`` columns for `ordering` – list of tuples
+    (`field`, `order`) prepared with `prepare_ordering()`."""
+    result = []
+    for field, order in ordering:
+        column = columns[field]
+        result.append(column.desc() if order == "desc" else column.asc())
+    return result
+
+# Aggregations that can be used as window functions
+window_aggregations = ("sum", "min", "max", "average", "count",
+                       "count_nonnull", "stddev")
+
+@window.register("sql")
+def _(ctx, obj, functions, partition=None, orderby=None, frame=None):
+    """Appends window `functions` as ``OVER (PARTITION BY … ORDER BY …)``
+    columns. Aggregations have frame ``ROWS BETWEEN UNBOUNDED PRECEDING AND
+    CURRENT ROW``, ``ROWS BETWEEN frame-1 PRECEDING AND CURRENT ROW`` or
+    the whole partition if `frame` is ``"partition"``. Result is ordered by
+    the partition and the order."""
+
+    partition = prepare_key(partition) if partition else []
+    ordering = prepare_ordering(orderby) if orderby else []
+    functions = prepare_window_functions(functions)
+
+    if frame is not None and frame != "partition" \
+            and (not isinstance(frame, int) or frame < 1):
+        raise ArgumentError("Window frame should be a number of rows or "
+                            "'partition', not %r" % (frame, ))
+
+    dialect = obj.store.connectable.dialect.name
+    statement = obj.sql_statement().alias("__w")
+
+    partition_by = [statement.c[field] for field in partition]
+    order_by = _order_columns(statement.c, ordering)
+    if frame is None:
+        rows = (None, 0)
+    elif frame == "partition":
+        rows = (None, None)
+    else:
+        rows = (-(frame - 1), 0)
+
+    selection = list(statement.columns)
+
+    for field, function, argument, name in functions:
+        if function in RANKING_FUNCTIONS:
+            column = getattr(sql.func, function)()
+            column = column.over(partition_by=partition_by or None,
+                                 order_by=order_by or None)
+        elif function in OFFSET_FUNCTIONS:
+            column = getattr(sql.func, function)(statement.c[field],
+                                                 argument)
+            column = column.over(partition_by=partition_by or None,
+                                 order_by=order_by or None)
+        else:
+            func = aggregation_function(function, dialect)
+            if function not in window_aggregations or func is None:
+                raise RetryOperation(["rows"],
+                                     reason="Window aggregation '%s' is not "
+                                            "supported by %s"
+                                            % (function, dialect))
+
+            column = func(statement.c[field])
+            column = column.over(partition_by=partition_by or None,
+                                 order_by=order_by or None,
+                                 rows=rows)
+
+        selection.append(column.label(name))
+
+    out_fields = obj.fields.clone()
+    out_fields += obj.fields.window_fields(functions)
+
+    result_ordering = [(field, "asc") for field in partition] + ordering
+    order_by = _order_columns(statement.c, result_ordering)
+    statement = sql.expression.select(selection, from_obj=statement,
+                                      order_by=order_by)
+
+    return obj.clone_statement(statement=statement, fields=out_fields,
+                               ordering=result_ordering)
+
+
+@top.register("sql")
+def _(ctx, obj, orderby, n, partition=None):
+    """Returns first `n` rows by `orderby` with ``ORDER BY … LIMIT``. First
+    `n` rows of every `partition` key are selected by ``row_number()``
+    over the partitions. Result is ordered by the partition and the
+    order."""
+
+    ordering = prepare_ordering(orderby)
+    partition = prepare_key(partition) if partition else []
+
+    if n < 0:
+        raise ArgumentError("Number of top rows should not be negative")
+
+    statement = obj.sql_statement().alias("__top")
+    order_by = _order_columns(statement.c, ordering)
+
+    if not partition:
+        statement = sql.expression.select(list(statement.columns),
+                                          from_obj=statement,
+                                          order_by=order_by, limit=n)
+        return obj.clone_statement(statement=statement, ordering=ordering)
+
+    partition_by = [statement.c[field] for field in partition]
+    rank = sql.func.row_number().over(partition_by=partition_by,
+                                      order_by=order_by)
+    ranked = sql.expression.select(list(statement.columns)
+                                   + [rank.label("__rank")],
+                                   from_obj=statement).alias("__ranked")
+
+    result_ordering = [(field, "asc") for field in partition] + ordering
+    columns = [ranked.c[str(field)] for field in obj.fields]
+    order_by = _order_columns(ranked.c, result_ordering)
+    statement = sql.expression.select(columns, from_obj=ranked,
+                                      whereclause=ranked.c["__rank"] <= n,
+                                      order_by=order_by)
+
+    return obj.clone_statement(statement=statement,
+                               ordering=result_ordering)
+
+
 #############################################################################
 # Field Operations
 
@@ -265,6 +594,20 @@ def _(ctx, obj, fields, values):
 
     return result
 
+@derive.register("sql")
+def _(ctx, obj, field, expression):
+    """Appends `field` with `expression` compiled into a column."""
+    statement = obj.sql_statement()
+
+    field = to_field(field)
+    column = _compile_expression(statement, expression)
+    selection = list(statement.columns)
+    selection.append(column.label(field.name))
+
+    statement = sql.expression.select(selection, from_obj=statement)
+    return obj.clone_statement(statement=statement,
+                               fields=obj.fields + FieldList(field))
+
 @dates_to_dimension.register("sql")
 def _(ctx, obj, fields=None, unknown_date=0):
     """Update all date fields to be date IDs. `unknown_date` is a key to date
@@ -372,7 +715,7 @@ def _(ctx, obj, fields, parts=["year", "month", "day"]):
 #############################################################################
 # Compositions
 
-@append.register("sql[]")
+@append.register("sql[]", cost=_appended_cost)
 def _(ctx, objects):
     """Returns a statement with sequentialy concatenated results of the
     `statements`. Statements are chained using ``UNION``."""
@@ -388,13 +731,17 @@ def _(ctx, objects):
     return first.clone_statement(statement=statement)
 
 
-@join_details.register("sql", "sql")
-def _(ctx, master, detail, master_key, detail_key):
+@join_details.register("sql", "sql", cost=_composition_cost)
+def _(ctx, master, detail, master_key, detail_key, mode="inner"):
     """Creates a master-detail join using simple or composite keys. The
     columns used as a key in the `detail` object are not included in the
-    result.
+    result. `mode` is ``inner``, ``left`` (``LEFT OUTER JOIN``), ``semi``
+    (``EXISTS``) or ``anti`` (``NOT EXISTS``), the last two return only
+    master columns.
     """
-    # TODO: add left inner, left outer
+
+    if mode not in ("inner", "left", "semi", "anti"):
+        raise ArgumentError("Unknown join mode '%s'" % (mode, ))
 
     if not master.can_compose(detail):
         raise RetryOperation(["rows", "rows"], reason="Can not compose")
@@ -408,6 +755,19 @@ def _(ctx, master, detail, master_key, detail_key):
     # Prepare the ON left=right ... clause
     onclause = join_on_clause(master_stat, detail_stat, master_key, detail_key)
 
+    if mode in ("semi", "anti"):
+        exists = sql.expression.exists(
+                    sql.expression.select([1], from_obj=detail_stat,
+                                          whereclause=onclause))
+        if mode == "anti":
+            exists = ~exists
+
+        select = sql.expression.select(list(master_stat.columns),
+                                       from_obj=master_stat,
+                                       whereclause=exists)
+        return master.clone_statement(statement=select,
+                                      fields=master.fields.clone())
+
     # Prepare output fields and columns selection - the selection skips detail
     # columns that are used as key, because they are already present in the
     # master table.
@@ -421,7 +781,8 @@ def _(ctx, master, detail, master_key, detail_key):
 
     joined = sql.expression.join(master_stat,
                                  detail_stat,
-                                 onclause=onclause)
+                                 onclause=onclause,
+                                 isouter=(mode == "left"))
 
     # Alias the output fields to match the field names
     aliased = []
@@ -435,7 +796,8 @@ def _(ctx, master, detail, master_key, detail_key):
     return master.clone_statement(statement=select, fields=out_fields)
 
 # TODO: deprecated
-@join_details.register("sql", "sql[]", name="join_details")
+@join_details.register("sql", "sql[]", name="join_details",
+                       cost=_composition_cost)
 def _(ctx, master, details, joins):
     """Creates left inner master-detail join (star schema) where `master` is an
     iterator if the "bigger" table `details` are details. `joins` is a list of
@@ -501,7 +863,7 @@ def _(ctx, master, details, joins):
     return master.clone_statement(statement=select, fields=out_fields)
 
 
-@added_keys.register("sql", "sql")
+@added_keys.register("sql", "sql", cost=_composition_cost)
 def _(ctx, src, target, src_key, target_key=None):
     """Returns difference between left and right statements"""
 
@@ -526,9 +888,9 @@ def _(ctx, src, target, src_key, target_key=None):
     return src.clone_statement(statement=diff)
 
 
-@added_rows.register("sql", "sql")
+@added_rows.register("sql", "sql", cost=_composition_cost)
 def _(ctx, src, target, src_key, target_key=None):
-    diff = ctx.added_keys(src, target, src_key, target_key)
+    diff = ctx.op.added_keys(src, target, src_key, target_key)
 
     diff_stmt = diff.sql_statement()
     diff_stmt = diff_stmt.alias("__added_keys")
@@ -547,8 +909,57 @@ def _(ctx, src, target, src_key, target_key=None):
     return src.clone_statement(statement=join)
 
 
-@added_rows.register("rows", "sql", name="added_rows")
+"""Targets of rows × SQL `added_rows` with at most this number of rows are
+read into a set of keys."""
+KEY_SET_LIMIT = 1000000
+
+"""Targets with at most this number of rows are read into a Bloom filter,
+keys that might be in the target are confirmed by a query. Keys of larger
+targets are only probed by queries."""
+BLOOM_FILTER_LIMIT = 50000000
+
+"""Number of keys probed by one ``IN`` query."""
+PROBE_CHUNK_SIZE = 500
+
+# Python types of key columns that source key values are converted to
+_key_types = (int, float, decimal.Decimal, str)
+
+
+def _key_converter(column):
+    """Returns function that converts a value to the Python type of
+    `column`, as the database would when comparing them. Values that can
+    not be converted are returned unchanged."""
+
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+
+    if python_type not in _key_types:
+        return lambda value: value
+
+    def convert(value):
+        if value is None or isinstance(value, python_type):
+            return value
+        try:
+            return python_type(value)
+        except (TypeError, ValueError, decimal.InvalidOperation):
+            return value
+
+    return convert
+
+
+@added_rows.register("rows", "sql", name="added_rows",
+                     cost=_probe_cost)
 def _(ctx, src, target, src_key, target_key=None):
+    """Returns rows of `src` with key that is not in the `target`. Keys of a
+    target with up to `KEY_SET_LIMIT` rows are fetched into a set. Keys of
+    targets up to `BLOOM_FILTER_LIMIT` rows are fetched into a Bloom filter
+    and only the source keys that pass the filter are probed. Keys are
+    probed with one ``IN`` query (tuple ``IN`` for compound keys) for every
+    `PROBE_CHUNK_SIZE` source rows. Source key values are converted to the
+    types of the target columns, for example keys read from a CSV file.
+    Order of source rows is kept."""
 
     src_key = prepare_key(src_key)
 
@@ -559,23 +970,64 @@ def _(ctx, src, target, src_key, target_key=None):
 
     statement = target.sql_statement()
     target_cols = target.columns(target_key)
+    src_indexes = src.fields.indexes(src_key)
+    converters = [_key_converter(column) for column in target_cols]
 
-    field_filter = FieldFilter(keep=src_key).row_filter(src.fields)
+    if len(target_cols) == 1:
+        probe_column = target_cols[0]
+        probe_value = lambda key: key[0]
+    else:
+        probe_column = sql.expression.tuple_(*target_cols)
+        probe_value = lambda key: key
+
+    def target_keys():
+        select = sql.expression.select(target_cols, from_obj=statement)
+        for row in target.store.execute(select):
+            key = tuple(row)
+            if None not in key:
+                yield key
+
+    def probe(keys):
+        """Returns set of `keys` that are in the target."""
+        found = set()
+        keys = list(keys)
+        for i in range(0, len(keys), PROBE_CHUNK_SIZE):
+            chunk = [probe_value(key) for key in keys[i:i + PROBE_CHUNK_SIZE]]
+            select = sql.expression.select(target_cols, from_obj=statement,
+                                           whereclause=probe_column.in_(chunk))
+            found.update(tuple(row) for row in target.store.execute(select))
+        return found
 
     def iterator():
-        for row in src.rows():
-            row_key = field_filter(row)
+        target_size = len(target)
 
-            cond = zip_condition(target_cols, row_key)
-
-            select = sql.expression.select([sql.func.count(1)],
-                                           from_obj=statement,
-                                           whereclause=cond)
-
-            result = target.store.execute(select)
-            result = list(result)
-            if len(result) >= 1 and result[0][0] == 0:
-                yield row
+        if target_size <= KEY_SET_LIMIT:
+            key_set = set(target_keys())
+            existing = lambda keys: key_set
+        else:
+            if target_size <= BLOOM_FILTER_LIMIT:
+                bloom = BloomFilter(target_size)
+                for key in target_keys():
+                    bloom.add(key)
+            else:
+                bloom = None
+
+            def existing(keys):
+                candidates = set(key for key in keys if key is not None
+                                 and (bloom is None or key in bloom))
+                return probe(candidates)
+
+        for batch in iter_batches(src.rows(), PROBE_CHUNK_SIZE):
+            keys = []
+            for row in batch:
+                key = tuple(convert(row[i]) for convert, i
+                            in zip(converters, src_indexes))
+                keys.append(None if None in key else key)
+
+            found = existing(keys)
+            for row, key in zip(batch, keys):
+                if key is None or key not in found:
+                    yield row
 
     return IterableDataSource(iterator(), fields=src.fields)
 
@@ -721,8 +1173,10 @@ def _(ctx, obj, fields=None):
     # field, key, key, key, empty_count
 
 @distinct_count.register("sql")
-def _(ctx, obj, fields=None):
-    """Return count of empty fields for the object obj"""
+def _(ctx, obj, fields=None, approximate=False):
+    """Return count of distinct values of `fields` of the object obj.
+    Approximate count is used if `approximate` is ``True`` and the dialect
+    has one."""
 
     # FIXME: add fields
     # FIXME: continue here
@@ -734,11 +1188,14 @@ def _(ctx, obj, fields=None):
         fields = obj.fields
     fields = prepare_key(fields)
 
+    if approximate:
+        dialect = obj.store.connectable.dialect.name
+        func = aggregation_function("count_distinct_approx", dialect)
+    else:
+        func = _count_distinct
+
     cols = [statement.c[f] for f in fields]
-    selection = []
-    for col in cols:
-        c = sqlalchemy.func.count(sqlalchemy.func.distinct(col))
-        selection.append(c)
+    selection = [func(col) for col in cols]
 
     statement = sqlalchemy.sql.expression.select(selection,
                                                   from_obj=statement)
@@ -836,24 +1293,30 @@ def _(ctx, obj):
 #############################################################################
 # Loading
 
-@insert.register("sql", "sql")
+@insert.register("sql", "sql", cost=_composition_cost)
 def _(ctx, source, target):
-    if not target.can_compose(src):
-        raise RetryOperation(["rows"])
+    if not target.can_compose(source):
+        raise RetryOperation(["rows", "sql"])
+
+    # Check the fields
+    _insert_indexes(source, target)
 
     # Flush all data that were added through append() to preserve
     # insertion order (just in case)
     target.flush()
 
     # Prepare INSERT INTO ... SELECT ... statement
-    statement = InsertFromSelect(target.table, source.selectable())
+    names = source.fields.names()
+    select = sql.expression.select(source.columns(names))
+    statement = target.table.insert().from_select(names, select)
 
     target.store.execute(statement)
 
     return target
 
-@insert.register("rows", "sql")
-def _(ctx, source, target):
+def _insert_indexes(source, target):
+    """Returns list of indexes of `source` fields for every `target` field,
+    ``None`` if the target field is not in the source."""
 
     if len(source.fields) > len(target.fields):
          raise OperationError("Number of source fields %s is greater than "
@@ -872,6 +1335,12 @@ def _(ctx, source, target):
         else:
             indexes.append(None)
 
+    return indexes
+
+@insert.register("rows", "sql")
+def _(ctx, source, target):
+    indexes = _insert_indexes(source, target)
+
     target.flush()
     for row in source.rows():
         row = [row[i] if i is not None else None for i in indexes]
@@ -880,3 +1349,17 @@ def _(ctx, source, target):
     target.flush()
 
     return target
+
+@insert.register("batches", "sql")
+def _(ctx, source, target):
+    """Inserts every batch of `source` with one statement."""
+    indexes = _insert_indexes(source, target)
+
+    for batch in source.batches():
+        batch = [[row[i] if i is not None else None for i in indexes]
+                 for row in batch]
+        target.append_batch(batch)
+
+    target.flush()
+
+    return target
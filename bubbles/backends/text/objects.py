@@ -211,7 +211,7 @@ class CSVSource(DataObject):
             self.resource.close()
 
     def representations(self):
-        return ["csv", "rows", "records"]
+        return ["csv", "rows", "batches", "records"]
 
     def rows(self):
         missing_values = [f.missing_value for f in self.fields]
@@ -236,6 +236,24 @@ class CSVSource(DataObject):
                     result.append(value)
             yield result
 
+    def batches(self, size=None):
+        """Returns batches of rows. If no values have to be converted, the
+        batches are taken from the CSV reader directly."""
+
+        if self.converters or any(f.missing_value for f in self.fields):
+            return super().batches(size)
+
+        return self._read_batches(size or DEFAULT_BATCH_SIZE)
+
+    def _read_batches(self, size):
+        while True:
+            batch = list(itertools.islice(self.reader, size))
+            if not batch:
+                return
+            if self.empty_as_null:
+                batch = [[value or None for value in row] for row in batch]
+            yield batch
+
     def csv_stream(self):
         return self.handle
 
@@ -247,13 +265,29 @@ class CSVSource(DataObject):
     def is_consumable(self):
         return True
 
-    def retained(self):
-        """Returns retained copy of the consumable"""
-        # Default implementation is naive: consumes whole CSV into Python
-        # memory
+    def fingerprint(self):
+        """Returns fingerprint of the source file (path, modification time
+        and size) and of the reading options. Returns `None` if the resource
+        is not a local file."""
+        resource = self.resource.fingerprint()
+        # Dialect objects do not have stable representation
+        if resource is None or not isinstance(self.dialect, (str, type(None))):
+            return None
+
+        options = sorted((key, value) for key, value in self.options.items()
+                         if key != "dialect")
+
+        return ("csv", resource, self.fields.names(),
+                [f.storage_type for f in self.fields], self.dialect,
+                options, self.encoding, self.skip_rows, self.empty_as_null)
+
+    def retained(self, count=1, budget=None):
+        """Returns retained copy of the consumable. Rows are read into a
+        buffer that keeps up to `budget` bytes in memory and spills the rest
+        into a temporary file."""
         # TODO: decide whether source is seek-able or not
 
-        return RowListDataObject(list(self.rows()), self.fields)
+        return RowBufferDataObject(self.rows(), self.fields, budget=budget)
 
 
 class CSVTarget(DataObject):
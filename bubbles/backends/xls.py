@@ -4,7 +4,7 @@ from ..errors import *
 from ..common import get_logger
 from ..metadata import Field, FieldList
 from ..stores import DataStore
-from ..resource import Resource
+from ..resource import Resource, local_file_fingerprint
 import datetime
 
 try:
@@ -46,8 +46,11 @@ class XLSStore(DataStore):
         if not self.book:
             self.book = _load_workbook(self.resource, self.encoding)
 
-        return XLSObject(workbook=self.book, sheet=name, skip_rows=skip_rows,
-                            has_header=has_header)
+        obj = XLSObject(workbook=self.book, sheet=name, skip_rows=skip_rows,
+                        has_header=has_header)
+        obj.resource = self.resource
+
+        return obj
 
     def object_names(self):
         if not self.book:
@@ -81,6 +84,8 @@ class XLSObject(DataObject):
         else:
             self.workbook = _load_workbook(resource, encoding)
 
+        self.resource = resource
+
         if isinstance(sheet, int):
             self.sheet = self.workbook.sheet_by_index(sheet)
         else:
@@ -131,6 +136,16 @@ class XLSObject(DataObject):
     def is_consumable(self):
         return False
 
+    def fingerprint(self):
+        """Returns fingerprint of the workbook file and of the sheet. Returns
+        `None` if the workbook is not a local file."""
+        resource = local_file_fingerprint(self.resource)
+        if resource is None:
+            return None
+
+        return ("xls", resource, self.sheet.name, self.first_row,
+                self.fields.names())
+
 class XLSRowIterator(object):
     """
     Iterator that reads XLS spreadsheet
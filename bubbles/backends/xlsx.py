@@ -4,6 +4,7 @@ from bubbles.errors import ArgumentError, BubblesError
 from bubbles.metadata import FieldList, Field
 from bubbles.objects import DataObject
 from bubbles.stores import DataStore
+from bubbles.resource import local_file_fingerprint
 
 try:
     import openpyxl
@@ -42,8 +43,11 @@ class XLSXStore(DataStore):
         return self._book
 
     def get_object(self, name, skip_rows=0, has_header=True):
-        return XLSXObject(self.book, sheet=name, encoding=self.encoding,
-                          skip_rows=skip_rows, has_header=has_header)
+        obj = XLSXObject(self.book, sheet=name, encoding=self.encoding,
+                         skip_rows=skip_rows, has_header=has_header)
+        obj.resource = self.resource
+
+        return obj
 
     def object_names(self):
         return self.book.get_sheet_names()
@@ -68,8 +72,10 @@ class XLSXObject(DataObject):
         """
         if isinstance(resource, openpyxl.Workbook):
             self.workbook = resource
+            self.resource = None
         else:
             self.workbook = _load_workbook(resource)
+            self.resource = resource
 
         if isinstance(sheet, int):
             self.sheet = self.workbook.worksheets[sheet]
@@ -130,3 +136,13 @@ class XLSXObject(DataObject):
 
     def is_consumable(self):
         return False
+
+    def fingerprint(self):
+        """Returns fingerprint of the workbook file and of the sheet. Returns
+        `None` if the workbook is not a local file."""
+        resource = local_file_fingerprint(self.resource)
+        if resource is None:
+            return None
+
+        return ("xlsx", resource, self.sheet.title, self.first_row,
+                self.fields.names())
@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+"""Row buffers with bounded memory footprint.
+
+Rows are serialized in chunks. Chunks are kept in memory until a byte budget
+is reached, the rest is written into a temporary file and read back when the
+buffer is replayed.
+
+:class:`RowQueue` connects a producer and a consumer running in different
+threads with a bounded queue of row batches.
+
+:func:`sorted_rows` sorts rows that do not fit into memory: sorted runs are
+spilled into row buffers and merged. :func:`hash_groups` groups values by a
+key, groups that do not fit into memory are spilled into hash partitions.
+:func:`hash_join` matches rows by a key, a build side that does not fit into
+memory is joined partition by partition."""
+
+import heapq
+import pickle
+import queue
+import tempfile
+import threading
+import struct
+import itertools
+from collections import deque
+from .errors import *
+
+__all__ = (
+    "RowBuffer",
+    "RowTee",
+    "RowQueue",
+    "sorted_rows",
+    "hash_groups",
+    "hash_join",
+    "DEFAULT_BUFFER_BUDGET",
+    "DEFAULT_CHUNK_SIZE",
+    "DEFAULT_TEE_LAG",
+    "DEFAULT_QUEUE_SIZE",
+    "DEFAULT_QUEUE_BATCH_SIZE",
+    "DEFAULT_SORT_RUN_SIZE",
+    "DEFAULT_GROUP_LIMIT",
+    "DEFAULT_PARTITION_COUNT",
+    "DEFAULT_JOIN_BUILD_LIMIT",
+)
+
+"""Default number of bytes of serialized rows kept in memory by a buffer
+before the rows are spilled to a temporary file."""
+DEFAULT_BUFFER_BUDGET = 64 * 1024 * 1024
+
+"""Default number of rows serialized together as one chunk."""
+DEFAULT_CHUNK_SIZE = 1024
+
+"""Default number of rows a tee keeps in memory between its slowest and
+fastest consumer before the rows are spilled."""
+DEFAULT_TEE_LAG = 10000
+
+"""Default number of row batches a row queue holds before the producer
+waits for the consumer."""
+DEFAULT_QUEUE_SIZE = 8
+
+"""Default number of rows passed through a row queue at once."""
+DEFAULT_QUEUE_BATCH_SIZE = 256
+
+"""Default number of rows sorted in memory. Longer inputs are sorted in runs
+of this size that are spilled into temporary files and merged."""
+DEFAULT_SORT_RUN_SIZE = 250000
+
+"""Default number of groups kept in memory by hash grouping before the
+group states are spilled into partitions."""
+DEFAULT_GROUP_LIMIT = 500000
+
+"""Default number of partitions groups are spilled into."""
+DEFAULT_PARTITION_COUNT = 16
+
+"""Default number of rows of the build side of a hash join kept in memory.
+Larger build sides are joined partition by partition."""
+DEFAULT_JOIN_BUILD_LIMIT = 1000000
+
+# Depth of partitioning after which groups are no longer spilled
+_MAX_PARTITION_DEPTH = 8
+
+# Number of rows a tee cursor takes at once
+_TEE_BATCH_SIZE = 256
+
+# Chunk header in the spill file: length of the pickled chunk
+_header = struct.Struct("<Q")
+
+
+class RowBuffer(object):
+    def __init__(self, budget=None, chunk_size=None):
+        """Creates an empty row buffer. `budget` is a number of bytes of
+        serialized rows that are kept in memory, rest is spilled into a
+        temporary file. `chunk_size` is a number of rows serialized
+        together.
+
+        Rows are appended with `append()` or `extend()` and read with
+        `rows()`, which can be called any number of times. Call `release()`
+        to remove the temporary file, if there is any."""
+
+        if budget is None:
+            budget = DEFAULT_BUFFER_BUDGET
+        if chunk_size is None:
+            chunk_size = DEFAULT_CHUNK_SIZE
+        if chunk_size < 1:
+            raise ArgumentError("Buffer chunk size should be at least 1")
+
+        self.budget = budget
+        self.chunk_size = chunk_size
+
+        self.row_count = 0
+        self.memory_size = 0
+
+        # Serialized chunks kept in memory
+        self._chunks = []
+        # List of (offset, length) of chunks in the spill file
+        self._spilled = []
+        # Rows that were not serialized yet
+        self._pending = []
+
+        self._file = None
+        self._file_size = 0
+        # Replays might read from the spill file concurrently
+        self._lock = threading.Lock()
+
+    @property
+    def is_spilled(self):
+        """`True` if at least one chunk was written to the temporary
+        file."""
+        return bool(self._spilled)
+
+    def append(self, row):
+        """Appends a `row` to the buffer."""
+        self._pending.append(row)
+        self.row_count += 1
+        if len(self._pending) >= self.chunk_size:
+            self._store_pending()
+
+    def extend(self, rows):
+        """Appends all `rows` from an iterable to the buffer."""
+        for row in rows:
+            self.append(row)
+
+    def flush(self):
+        """Serializes rows that do not fill a whole chunk yet. No rows should
+        be appended after the flush if the buffer is going to be read with
+        `rows_at()`."""
+        if self._pending:
+            self._store_pending()
+
+    def _store_pending(self):
+        data = pickle.dumps(self._pending, pickle.HIGHEST_PROTOCOL)
+        self._pending = []
+
+        # Once the buffer starts spilling, all following chunks go to the
+        # file to preserve the order of rows.
+        if not self._spilled and self.memory_size + len(data) <= self.budget:
+            self._chunks.append(data)
+            self.memory_size += len(data)
+        else:
+            self._spill(data)
+
+    def _spill(self, data):
+        with self._lock:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(prefix="bubbles-")
+
+            self._file.seek(self._file_size)
+            self._file.write(_header.pack(len(data)))
+            self._file.write(data)
+
+            offset = self._file_size + _header.size
+            self._spilled.append((offset, len(data)))
+            self._file_size = offset + len(data)
+
+    def _read_spilled(self, offset, length):
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def chunks(self):
+        """Returns an iterator of lists of rows in the order they were
+        appended."""
+
+        # Iterate by index – chunks might be appended during the iteration
+        i = 0
+        while i < len(self._chunks):
+            yield pickle.loads(self._chunks[i])
+            i += 1
+
+        i = 0
+        while i < len(self._spilled):
+            offset, length = self._spilled[i]
+            yield pickle.loads(self._read_spilled(offset, length))
+            i += 1
+
+        if self._pending:
+            yield list(self._pending)
+
+    def rows_at(self, index):
+        """Returns list of rows starting at row `index` up to the end of the
+        chunk that contains the row. Returns an empty list if there is no
+        such row."""
+
+        chunk, offset = divmod(index, self.chunk_size)
+
+        if chunk < len(self._chunks):
+            rows = pickle.loads(self._chunks[chunk])
+        elif chunk - len(self._chunks) < len(self._spilled):
+            offset_length = self._spilled[chunk - len(self._chunks)]
+            rows = pickle.loads(self._read_spilled(*offset_length))
+        elif chunk == len(self._chunks) + len(self._spilled):
+            rows = self._pending
+        else:
+            rows = []
+
+        return rows[offset:]
+
+    def rows(self):
+        """Returns an iterator of all rows in the buffer. The buffer might be
+        replayed any number of times."""
+        for chunk in self.chunks():
+            yield from chunk
+
+    def __iter__(self):
+        return self.rows()
+
+    def __len__(self):
+        return self.row_count
+
+    def release(self):
+        """Releases memory and removes the temporary file."""
+        self._chunks = []
+        self._spilled = []
+        self._pending = []
+        self.memory_size = 0
+        self.row_count = 0
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_size = 0
+
+
+class RowTee(object):
+    def __init__(self, iterable, count, max_lag=None, budget=None):
+        """Shares rows of one `iterable` between `count` consumers. Each
+        consumer reads the rows through its own cursor, see `cursor()`.
+
+        Only rows between the slowest and the fastest cursor are kept in
+        memory. If the lag grows over `max_lag` rows, the oldest rows are
+        moved into a :class:`RowBuffer` with `budget`, which spills into a
+        temporary file. Lagging cursors read the rows from there.
+
+        Cursors might be consumed from different threads."""
+
+        self.source = iter(iterable)
+        self.count = count
+        self.max_lag = DEFAULT_TEE_LAG if max_lag is None else max_lag
+        self.budget = budget
+
+        # Rows in memory, first row in the deque has index `_base`
+        self._rows = deque()
+        self._base = 0
+        # Spilled rows have indexes starting at `_spill_start`. Spilled rows
+        # are always directly followed by the rows in memory.
+        self._spill = None
+        self._spill_start = 0
+
+        # Index of the next row for each cursor
+        self._positions = [0] * count
+        self._exhausted = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_spilled(self):
+        """`True` if there are spilled rows of lagging cursors."""
+        return self._spill is not None
+
+    def cursor(self, index):
+        """Returns an iterator of rows for consumer with `index`."""
+        while True:
+            with self._lock:
+                rows = self._fetch(index)
+            if not rows:
+                break
+            yield from rows
+
+    def _fetch(self, index):
+        """Returns next batch of rows for cursor `index` and advances the
+        cursor. Returns an empty list at the end of the source."""
+
+        position = self._positions[index]
+
+        if position < self._base:
+            # Cursor is lagging – read from the spill buffer
+            rows = self._spill.rows_at(position - self._spill_start)
+            rows = rows[:self._base - position]
+
+        elif position < self._base + len(self._rows):
+            offset = position - self._base
+            end = min(offset + _TEE_BATCH_SIZE, len(self._rows))
+            rows = list(itertools.islice(self._rows, offset, end))
+
+        elif not self._exhausted:
+            rows = list(itertools.islice(self.source, _TEE_BATCH_SIZE))
+            if rows:
+                self._rows.extend(rows)
+            else:
+                self._exhausted = True
+        else:
+            rows = []
+
+        self._positions[index] = position + len(rows)
+        self._trim()
+
+        return rows
+
+    def _trim(self):
+        """Removes rows that were read by all cursors and spills rows over
+        the allowed lag."""
+
+        slowest = min(self._positions)
+
+        if self._spill is not None \
+                and slowest >= self._spill_start + len(self._spill):
+            # Nobody reads from the spill buffer anymore
+            self._spill.release()
+            self._spill = None
+
+        while self._rows and self._base < slowest:
+            self._rows.popleft()
+            self._base += 1
+
+        while len(self._rows) > self.max_lag:
+            if self._spill is None:
+                self._spill = RowBuffer(budget=self.budget)
+                self._spill_start = self._base
+
+            self._spill.append(self._rows.popleft())
+            self._base += 1
+
+    def release(self):
+        """Releases buffered rows and removes the temporary file."""
+        with self._lock:
+            self._rows.clear()
+            if self._spill is not None:
+                self._spill.release()
+                self._spill = None
+
+
+# Markers passed through a row queue after the last batch
+_QUEUE_END = object()
+_QUEUE_ERROR = object()
+
+# Seconds a producer waits on a full queue before it checks whether the
+# consumer has not stopped reading
+_QUEUE_POLL_INTERVAL = 0.1
+
+
+class RowQueue(object):
+    def __init__(self, iterable, size=None, batch_size=None):
+        """Reads rows of `iterable` in a worker thread and passes them to the
+        consumer through a queue of at most `size` batches of `batch_size`
+        rows. When the queue is full the worker waits until the consumer
+        reads a batch, therefore at most ``(size + 1) * batch_size`` rows
+        are held in memory.
+
+        The worker is started when the iteration starts. An exception raised
+        in the worker is raised in the consumer. If the consumer stops
+        reading before the end, the worker is stopped as well."""
+
+        self.iterable = iterable
+        self.size = DEFAULT_QUEUE_SIZE if size is None else size
+        self.batch_size = batch_size or DEFAULT_QUEUE_BATCH_SIZE
+
+        if self.size < 1:
+            raise ArgumentError("Row queue size should be at least 1")
+
+        self._queue = queue.Queue(self.size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __iter__(self):
+        if self._thread is not None:
+            raise BubblesError("Row queue can be iterated only once")
+
+        self._thread = threading.Thread(target=self._produce,
+                                        name="bubbles-row-queue",
+                                        daemon=True)
+        self._thread.start()
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _QUEUE_END:
+                    break
+                elif isinstance(item, tuple) and item[0] is _QUEUE_ERROR:
+                    raise item[1]
+                yield from item
+        finally:
+            self.close()
+
+    def _put(self, item):
+        """Puts `item` into the queue. Returns `False` if the consumer has
+        stopped reading."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=_QUEUE_POLL_INTERVAL)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def _produce(self):
+        try:
+            rows = iter(self.iterable)
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                if not self._put(batch):
+                    return
+        except BaseException as e:
+            self._put((_QUEUE_ERROR, e))
+        else:
+            self._put(_QUEUE_END)
+
+    def close(self):
+        """Stops the worker and waits until it finishes."""
+        self._stop.set()
+        if self._thread is not None \
+                and self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+def sorted_rows(rows, key=None, reverse=False, run_size=None):
+    """Returns an iterator of `rows` sorted by `key`. At most `run_size`
+    rows are held in memory for sorting. Longer inputs are sorted in runs of
+    `run_size` rows, the runs are written into temporary files and merged
+    when the rows are read. The sort is stable, as `sorted()` is. Default
+    run size is `DEFAULT_SORT_RUN_SIZE`."""
+
+    run_size = run_size or DEFAULT_SORT_RUN_SIZE
+    if run_size < 1:
+        raise ArgumentError("Sort run size should be at least 1")
+
+    return _sorted_runs(iter(rows), key, reverse, run_size)
+
+
+def _sorted_runs(iterator, key, reverse, run_size):
+    run = list(itertools.islice(iterator, run_size))
+    run.sort(key=key, reverse=reverse)
+
+    if len(run) < run_size:
+        yield from run
+        return
+
+    runs = []
+    try:
+        while run:
+            buffer = RowBuffer(budget=0)
+            buffer.extend(run)
+            buffer.flush()
+            runs.append(buffer)
+
+            run = list(itertools.islice(iterator, run_size))
+            run.sort(key=key, reverse=reverse)
+
+        # Merge is stable: equal rows are taken from the earlier runs first
+        yield from heapq.merge(*(buffer.rows() for buffer in runs),
+                               key=key, reverse=reverse)
+    finally:
+        for buffer in runs:
+            buffer.release()
+
+
+def hash_groups(items, new, update, merge, max_groups=None,
+                partition_count=None):
+    """Returns an iterator of tuples (`key`, `state`) of groups of `items` –
+    tuples (`key`, `value`). State of a group is created with `new()`,
+    `update(state, value)` adds a value to the state and `merge(state,
+    other)` adds other partial state of the same group. Both functions
+    change the `state` in place.
+
+    At most `max_groups` groups are kept in memory. When there are more
+    groups, the states are spilled into `partition_count` partitions by hash
+    of the key and every partition is merged separately. States have to be
+    picklable. The result does not depend on spilling, only the order of the
+    groups does: it is the order of first occurrence if nothing was spilled.
+
+    Defaults are `DEFAULT_GROUP_LIMIT` and `DEFAULT_PARTITION_COUNT`."""
+
+    max_groups = max_groups or DEFAULT_GROUP_LIMIT
+    partition_count = partition_count or DEFAULT_PARTITION_COUNT
+
+    if max_groups < 1 or partition_count < 2:
+        raise ArgumentError("Group limit should be at least 1 and "
+                            "partition count at least 2")
+
+    return _hash_groups(iter(items), new, update, merge, max_groups,
+                        partition_count, 0)
+
+
+def _spill_groups(groups, partitions, depth):
+    count = len(partitions)
+    for key, state in groups.items():
+        partitions[hash((depth, key)) % count].append((key, state))
+
+
+def _hash_groups(items, new, update, merge, max_groups, partition_count,
+                 depth):
+    # Partitions are merged with the first partial state as the group state
+    groups = {}
+    partitions = None
+
+    try:
+        for key, value in items:
+            try:
+                state = groups[key]
+            except KeyError:
+                if len(groups) >= max_groups \
+                        and depth < _MAX_PARTITION_DEPTH:
+                    if partitions is None:
+                        partitions = [RowBuffer(budget=0)
+                                      for i in range(partition_count)]
+                    _spill_groups(groups, partitions, depth)
+                    groups = {}
+
+                if new is None:
+                    groups[key] = value
+                    continue
+
+                state = groups[key] = new()
+
+            update(state, value)
+
+        if partitions is None:
+            yield from groups.items()
+            return
+
+        _spill_groups(groups, partitions, depth)
+        groups = None
+
+        for partition in partitions:
+            partition.flush()
+            yield from _hash_groups(partition.rows(), None, merge, merge,
+                                    max_groups, partition_count, depth + 1)
+            partition.release()
+
+    finally:
+        if partitions is not None:
+            for partition in partitions:
+                partition.release()
+
+
+def hash_join(build, probe, max_rows=None, partition_count=None):
+    """Returns an iterator of tuples (`value`, `matches`) for every item of
+    `probe` – tuples (`key`, `value`) – in the order of `probe`. `matches`
+    is a list of values of `build` items with the same key. Items with
+    ``None`` key are not matched.
+
+    At most `max_rows` build items are kept in memory. When the build side
+    is larger, both sides are spilled into `partition_count` partitions by
+    hash of the key and the partitions are joined one at a time (grace hash
+    join). Results of the partitions are spilled and merged to restore the
+    order of `probe`. Values have to be picklable.
+
+    Defaults are `DEFAULT_JOIN_BUILD_LIMIT` and `DEFAULT_PARTITION_COUNT`."""
+
+    max_rows = max_rows or DEFAULT_JOIN_BUILD_LIMIT
+    partition_count = partition_count or DEFAULT_PARTITION_COUNT
+
+    if max_rows < 1 or partition_count < 2:
+        raise ArgumentError("Build limit should be at least 1 and "
+                            "partition count at least 2")
+
+    return _hash_join(iter(build), iter(probe), max_rows, partition_count, 0)
+
+
+def _hash_join(build, probe, max_rows, partition_count, depth):
+    table = {}
+    count = 0
+
+    for key, value in build:
+        if key is None:
+            continue
+
+        try:
+            table[key].append(value)
+        except KeyError:
+            table[key] = [value]
+
+        count += 1
+        if count > max_rows and depth < _MAX_PARTITION_DEPTH:
+            yield from _grace_join(table, build, probe, max_rows,
+                                   partition_count, depth)
+            return
+
+    empty = ()
+    for key, value in probe:
+        if key is None:
+            yield (value, empty)
+        else:
+            yield (value, table.get(key, empty))
+
+
+def _grace_join(table, build, probe, max_rows, partition_count, depth):
+    builds = [RowBuffer(budget=0) for i in range(partition_count)]
+    probes = [RowBuffer(budget=0) for i in range(partition_count)]
+    results = []
+
+    try:
+        for key, values in table.items():
+            partition = builds[hash((depth, key)) % partition_count]
+            for value in values:
+                partition.append((key, value))
+        table.clear()
+
+        for key, value in build:
+            if key is not None:
+                builds[hash((depth, key)) % partition_count].append(
+                                                                (key, value))
+
+        # Probe items are numbered to restore their order
+        for number, (key, value) in enumerate(probe):
+            if key is None:
+                index = number % partition_count
+            else:
+                index = hash((depth, key)) % partition_count
+            probes[index].append((number, key, value))
+
+        for build_part, probe_part in zip(builds, probes):
+            build_part.flush()
+            probe_part.flush()
+
+            items = ((key, (number, value))
+                     for number, key, value in probe_part.rows())
+            result = RowBuffer(budget=0)
+            for (number, value), matches in _hash_join(build_part.rows(),
+                                                       items, max_rows,
+                                                       partition_count,
+                                                       depth + 1):
+                result.append((number, value, matches))
+            result.flush()
+            results.append(result)
+
+            build_part.release()
+            probe_part.release()
+
+        merged = heapq.merge(*[result.rows() for result in results],
+                             key=lambda item: item[0])
+        for number, value, matches in merged:
+            yield (value, matches)
+
+    finally:
+        for buffer in builds + probes + results:
+            buffer.release()
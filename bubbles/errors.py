@@ -33,6 +33,11 @@ class ArgumentError(BubblesError):
     """Raised when wrong argument is passed to a function"""
     pass
 
+class ExpressionError(ArgumentError):
+    """Raised when an expression can not be compiled: unknown variable or
+    function, or an operator not supported by the target"""
+    pass
+
 class ProbeAssertionError(BubblesError):
     """Raised when probe assertion fails"""
     def __init__(self, reason=None):
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Result cache for incremental re-execution of graphs.
+
+Each node gets a fingerprint – a digest of the operation name, arguments and
+fingerprints of the node's inputs. Source nodes are fingerprinted by their
+data objects, see :meth:`DataObject.fingerprint`. If any input of a node can
+not be fingerprinted, the node can not be fingerprinted either.
+
+Results of operations are written to a local disk under their fingerprint
+while their consumers read them. When the graph is run again, nodes with a
+cached result are not evaluated and only the nodes that depend on changed
+sources are computed."""
+
+import os
+import pickle
+import hashlib
+import tempfile
+import types
+from ..objects import DataObject, IterableDataSource
+from ..metadata import Field, FieldList, FieldFilter
+from ..errors import *
+from .graph import Node
+
+__all__ = (
+    "ResultCache",
+    "CachedDataObject",
+    "node_fingerprint",
+)
+
+# Operations with side effects. Their results are not cached and they are
+# evaluated every time.
+_uncached_ops = set([
+    "insert",
+    "load_versioned_dimension",
+    "pretty_print",
+    "debug_fields",
+    "assert_unique",
+    "assert_contains",
+    "assert_missing",
+])
+
+# Number of rows pickled together in a cache file
+_CACHE_CHUNK_SIZE = 1024
+
+
+class _NotCanonical(Exception):
+    pass
+
+
+def _canonical(value):
+    """Returns a structure of basic types that represents `value` and that
+    has stable `repr()`. Raises `_NotCanonical` if the value can not be
+    represented."""
+
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    elif isinstance(value, (list, tuple)):
+        return tuple(_canonical(item) for item in value)
+    elif isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted(repr(_canonical(item))
+                                    for item in value)))
+    elif isinstance(value, dict):
+        items = ((repr(_canonical(k)), _canonical(v))
+                 for k, v in value.items())
+        return ("dict", tuple(sorted(items)))
+    elif isinstance(value, Field):
+        return ("field", _canonical(value.to_dict()))
+    elif isinstance(value, FieldList):
+        return ("fields", tuple(_canonical(field) for field in value))
+    elif isinstance(value, FieldFilter):
+        return ("filter", _canonical(value.keep), _canonical(value.drop),
+                _canonical(value.rename))
+    elif isinstance(value, types.FunctionType):
+        # Functions with closures, default arguments or references to
+        # global names depend on values we can not see
+        if value.__closure__ or value.__defaults__ or value.__kwdefaults__ \
+                or _uses_globals(value.__code__, value.__globals__):
+            raise _NotCanonical
+        return ("function", value.__module__, value.__qualname__,
+                _canonical(value.__code__))
+    elif isinstance(value, types.CodeType):
+        return ("code", value.co_code, _canonical(value.co_names),
+                _canonical(value.co_consts))
+    else:
+        raise _NotCanonical
+
+
+def _uses_globals(code, namespace):
+    """Returns ``True`` if `code` or code nested in it refers to a name from
+    the global `namespace`. Built-in names are not considered."""
+    if any(name in namespace for name in code.co_names):
+        return True
+    return any(_uses_globals(const, namespace) for const in code.co_consts
+               if isinstance(const, types.CodeType))
+
+
+def _digest(value):
+    """Returns hex digest of `value` or ``None`` if the value can not be
+    fingerprinted."""
+    try:
+        text = repr(_canonical(value))
+    except _NotCanonical:
+        return None
+
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def node_fingerprint(node, inputs, result=None):
+    """Returns fingerprint of `node`. `inputs` is a list of fingerprints of
+    node's inputs. `result` is an evaluated data object of a source node.
+    Returns ``None`` if the node can not be fingerprinted."""
+
+    if isinstance(node, Node):
+        if node.opname in _uncached_ops or None in inputs:
+            return None
+
+        return _digest(("operation", node.opname, node.args, node.kwargs,
+                        inputs))
+
+    elif node.is_source() and isinstance(result, DataObject):
+        fingerprint = result.fingerprint()
+        if fingerprint is None:
+            return None
+
+        return _digest(("source", fingerprint))
+
+    else:
+        return None
+
+
+class ResultCache(object):
+    def __init__(self, path):
+        """Creates a cache of results in directory `path`. The directory is
+        created if it does not exist."""
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, fingerprint):
+        return os.path.join(self.path, fingerprint + ".rows")
+
+    def __contains__(self, fingerprint):
+        return os.path.exists(self._file(fingerprint))
+
+    def get(self, fingerprint):
+        """Returns a cached object for `fingerprint` or ``None`` if there is
+        no such object."""
+
+        path = self._file(fingerprint)
+
+        if not os.path.exists(path):
+            return None
+
+        return CachedDataObject(path, fingerprint)
+
+    def write_through(self, fingerprint, obj):
+        """Returns a consumable object with rows of `obj` that are written
+        into the cache under `fingerprint` as they are read. The cached
+        object exists only after all rows were read – a result that was
+        not read to the end is not cached."""
+
+        rows = self._write_rows(fingerprint, obj.fields, obj.ordering,
+                                obj.rows())
+        result = IterableDataSource(rows, obj.fields)
+        result.ordering = obj.ordering
+        return result
+
+    def _write_rows(self, fingerprint, fields, ordering, rows):
+        handle, temp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                header = (fields, list(ordering or ()))
+                pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+
+                chunk = []
+                for row in rows:
+                    chunk.append(list(row))
+                    if len(chunk) >= _CACHE_CHUNK_SIZE:
+                        pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                        chunk = []
+                    yield row
+
+                if chunk:
+                    pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temp_path, self._file(fingerprint))
+        finally:
+            # Not read to the end or failed
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def remove(self, fingerprint):
+        """Removes cached object with `fingerprint`, if it exists."""
+        try:
+            os.remove(self._file(fingerprint))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Removes all cached objects."""
+        for name in os.listdir(self.path):
+            if name.endswith(".rows"):
+                os.remove(os.path.join(self.path, name))
+
+
+class CachedDataObject(DataObject):
+    def __init__(self, path, fingerprint=None):
+        """Data object with rows materialized in a cache file at `path`. The
+        file starts with fields and ordering of the rows."""
+
+        self.path = path
+        self._fingerprint = fingerprint
+
+        with open(path, "rb") as f:
+            self.fields, self.ordering = pickle.load(f)
+
+    def representations(self):
+        return ["rows", "records"]
+
+    def rows(self):
+        with open(self.path, "rb") as f:
+            # Skip the header
+            pickle.load(f)
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+                yield from chunk
+
+    def records(self):
+        names = self.fields.names()
+        for row in self.rows():
+            yield dict(zip(names, row))
+
+    def is_consumable(self):
+        return False
+
+    def fingerprint(self):
+        return self._fingerprint
@@ -4,6 +4,7 @@ from collections import defaultdict
 from ..errors import *
 from ..dev import is_experimental
 from ..operation import Operation, Signature, get_representations
+from ..operation import _with_conversions
 from ..common import get_logger
 from ..threadlocal import LocalProxy
 
@@ -14,14 +15,20 @@ __all__ = (
             "CollectingContextObserver",
         )
 
-"""List of modules with operations to be loaded for the default contex."""
+"""List of modules with operations of the default context. The modules are
+not imported when the context is created, they are imported when an
+operation is dispatched to one of their signatures. See
+`bubbles.execution.manifest` – the manifest has to be regenerated when the
+list changes."""
 
-# FIXME: make this more intelligent and lazy
 _default_op_modules = (
             "bubbles.backends.sql.ops",
             "bubbles.backends.mongo.ops",
+            "bubbles.backends.numpy.ops",
             "bubbles.ops.rows",
+            "bubbles.ops.batches",
             "bubbles.ops.generic",
+            "bubbles.ops.audit",
         )
 
 
@@ -37,7 +44,7 @@ class _OperationReference(object):
 
 class OperationContext(object):
     # TODO: add parent_context
-    def __init__(self):
+    def __init__(self, manifest=None):
         """Creates an operation context.
 
         Use:
@@ -50,6 +57,11 @@ class OperationContext(object):
         Context uses multiple dispatch based on operation arguments. The
         `k.duplicates()` operation might be different, based on available
         representations of `table` object.
+
+        `manifest` is a dictionary of operation implementations that are
+        loaded on demand: keys are operation names, values are lists of
+        tuples (`signature`, `module`). Module is imported when an operation
+        is dispatched to a signature of the module.
         """
 
         super().__init__()
@@ -63,6 +75,13 @@ class OperationContext(object):
         self.retry_allow = []
         self.retry_deny = []
 
+        # (operation name, representations) -> (operation, operation version,
+        # resolution order)
+        self._dispatch_cache = {}
+
+        self.manifest = manifest or {}
+        self._loaded_modules = set()
+
     def operation(self, name):
         """Get operation by `name`. If operatin does not exist, then
         `operation_not_found()` is called and the lookup is retried."""
@@ -87,6 +106,7 @@ class OperationContext(object):
         context's method and would receive the context as first argument."""
 
         self.operations[op.name] = op
+        self._dispatch_cache.clear()
 
     def remove_operation(self, name):
         """Removes all operations with `name` and `signature`. If no
@@ -94,6 +114,60 @@ class OperationContext(object):
         removed, regardles of the signature."""
 
         del self.operations[name]
+        self._dispatch_cache.clear()
+
+    def load_module(self, modname):
+        """Imports operation module `modname` and adds its operations that
+        are not yet in the context."""
+
+        module = _load_module(modname)
+        self._loaded_modules.add(modname)
+
+        for name in dir(module):
+            op = getattr(module, name)
+            if isinstance(op, Operation) and op.name not in self.operations:
+                self.add_operation(op)
+
+        # Module registered new functions to existing operations
+        self._dispatch_cache.clear()
+
+    def load_implementations(self, op, representations):
+        """Imports modules from the manifest that implement operation `op`
+        for operands with `representations` – list of lists of
+        representations, one list per operand. Modules with generic
+        signatures are imported as well."""
+
+        entries = self.manifest.get(op.name)
+        if not entries:
+            return
+
+        converted = [_with_conversions(reps) for reps in representations]
+        modules = []
+
+        for signature, modname in entries:
+            if modname in self._loaded_modules or modname in modules:
+                continue
+
+            signature = Signature(*signature)
+            if signature.has_any() \
+                    or any(signature.matches(*repsig)
+                           for repsig in itertools.product(*converted)):
+                modules.append(modname)
+
+        for modname in modules:
+            self.load_module(modname)
+
+    def load_operations(self):
+        """Imports all modules from the manifest."""
+
+        modules = []
+        for entries in self.manifest.values():
+            modules += [modname for _, modname in entries
+                        if modname not in modules]
+
+        for modname in modules:
+            if modname not in self._loaded_modules:
+                self.load_module(modname)
 
     def operation_not_found(self, name):
         """Subclasses might override this method to load necessary modules and
@@ -143,20 +217,49 @@ class OperationContext(object):
 
         return True
 
+    def resolution_order(self, op, representations):
+        """Returns a list of signatures of operation `op` to be tried for
+        operands with `representations`. Modules implementing the matching
+        signatures are loaded from the manifest. The order is cached until
+        the operation registers a new function or the context's operations
+        are changed."""
+
+        key = (op.name, tuple(tuple(reps) for reps in representations))
+
+        try:
+            cached_op, version, order = self._dispatch_cache[key]
+        except KeyError:
+            pass
+        else:
+            if cached_op is op and version == op.version:
+                return list(order)
+
+        self.load_implementations(op, representations)
+        order = op.resolution_order(representations)
+        self._dispatch_cache[key] = (op, op.version, tuple(order))
+
+        return order
+
     def call(self, op_name, *args, **kwargs):
         """Dispatch and call operation with `name`. Arguments are passed to the
         operation, If the operation raises `RetryOperation` then another
         function with signature from the exception is tried. If no signature
-        is provided in the exception, then next matching signature is used."""
+        is provided in the exception, then next matching signature is used.
+
+        Matching signatures with cost estimators are tried in the order of
+        their estimated cost, see `Operation.register()`."""
 
         op = self.operation(op_name)
         operands = args[:op.opcount]
 
         reps = get_representations(*operands)
-        resolution_order = op.resolution_order(reps)
+        resolution_order = self.resolution_order(op, reps)
+        if op.costs:
+            resolution_order = op.order_by_cost(resolution_order, self,
+                                                *args, **kwargs)
         first_signature = resolution_order[0]
 
-        self.logger.debug("op %s(%s)" % (op_name, reps))
+        self.logger.debug("op %s(%s)", op_name, reps)
 
         if self.observer:
             self.observer.will_call_operation(self, op, first_signature)
@@ -175,6 +278,13 @@ class OperationContext(object):
             sig = resolution_order.pop(0)
             visited.add(sig)
 
+            try:
+                function = op.function(sig)
+            except KeyError:
+                # Signature requested by a retry might be implemented in a
+                # module that is not loaded yet
+                self.load_implementations(op, [[rep] for rep in sig])
+
             try:
                 function = op.function(sig)
             except KeyError:
@@ -183,8 +293,7 @@ class OperationContext(object):
 
             try:
                 if op.experimental:
-                    self.logger.warn("operation %s is experimental" % \
-                                        op_name)
+                    self.logger.warn("operation %s is experimental", op_name)
                 result = function(self, *args, **kwargs)
 
             except RetryOperation as e:
@@ -230,21 +339,20 @@ class LoggingContextObserver(object):
 
     def will_call_operation(self, ctx, op, signature):
         logger = self.logger or ctx.logger
-        logger.info("calling %s(%s)" % (op, signature))
+        logger.info("calling %s(%s)", op, signature)
 
     def did_call_operation(self, ctx, op, signature, first):
         logger = self.logger or ctx.logger
 
         if first == signature:
-            logger.debug("called %s(%s)" % (op, signature))
+            logger.debug("called %s(%s)", op, signature)
         else:
-            logger.debug("called %s(%s) as %s" % \
-                                (op, signature, first))
+            logger.debug("called %s(%s) as %s", op, signature, first)
 
     def will_retry_operation(self, ctx, op, signature, first, reason):
         logger = self.logger or ctx.logger
-        logger.info("retry %s(%s) as %s, reason: %s" %
-                                        (op, first, signature, reason))
+        logger.info("retry %s(%s) as %s, reason: %s",
+                    op, first, signature, reason)
 
 class CollectingContextObserver(object):
     def __init__(self):
@@ -286,12 +394,18 @@ class _OperationGetter(object):
 
 
 def create_default_context():
-    """Creates a ExecutionContext with default operations."""
-    context = OperationContext()
-
-    for modname in _default_op_modules:
-        mod = _load_module(modname)
-        context.add_operations_from(mod)
+    """Creates a ExecutionContext with default operations. Implementations
+    of the operations are loaded on demand using the precomputed manifest."""
+    from .. import prototypes
+    from .manifest import load_manifest
+
+    context = OperationContext(manifest=load_manifest())
+
+    # Same operations as the operation modules import with `import *`
+    for name in dir(prototypes):
+        op = getattr(prototypes, name)
+        if isinstance(op, Operation) and not name.startswith("_"):
+            context.add_operation(op)
 
     return context
 
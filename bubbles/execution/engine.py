@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
-from collections import namedtuple, Counter
+from collections import namedtuple, Counter, defaultdict
+from concurrent import futures
 from ..errors import *
+from ..operation import Signature
+from ..threadlocal import LocalProxy
+from ..objects import DataObject, IterableDataSource
+from ..buffers import RowTee, RowQueue
+from ..fusion import get_row_kernel
+from .graph import Node, FusedNode
+from .optimizer import optimize_graph
+from .cache import ResultCache, node_fingerprint
+from .profile import Profiler
 
 __all__ = (
     "ExecutionEngine",
@@ -12,10 +22,12 @@ __all__ = (
 
 
 class ExecutionStep(object):
-    def __init__(self, node, outlets=None, result=None):
+    def __init__(self, node, outlets=None, result=None, name=None):
         self.node = node
         self.outlets = outlets or []
         self.result = result
+        # Name of the node in the graph
+        self.name = name
 
     def evaluate(self, engine, context, operands):
         """Evaluates the wrapped node within `context` and with `operands`.
@@ -36,6 +48,10 @@ class ExecutionStep(object):
 # 2. prepare execution node for each node and connects them by outlets
 # 3. execute in the topological order and set result to the execution node
 #    – result is used as input for other nodes
+#
+# When an executor is set, step 3 is replaced by a scheduler: every step is
+# submitted to the executor as soon as all steps in its outlets are
+# evaluated, so independent branches of the graph run at the same time.
 
 # TODO: allow use of lists of objects, such as rows[] or sql[]. Currently
 # there is no way how to specify this kind of connections in the graph.
@@ -54,13 +70,81 @@ ExecutionPlan = namedtuple("ExecutionPlan", ["steps", "consumption"])
 
 class ExecutionEngine(object):
 
-    def __init__(self, context, stores=None):
+    def __init__(self, context, stores=None, executor=None,
+                 max_workers=None, retention_budget=None, retention=None,
+                 max_lag=None, fuse=False, optimize=False, cache=None,
+                 cache_nodes=None, profile=False, threaded=None, queue_size=None,
+                 queue_sizes=None):
         """Creates an instance of execution engine within an execution
         `context`.
 
         `stores` is a mapping of store names and opened data stores. Stores
         are used when resolving data sources by reference.
 
+        `executor` specifies how the independent steps of the execution plan
+        are run. If it is ``None`` (default) the steps are evaluated one by
+        one in the topological order. If it is ``"thread"`` then a thread
+        pool with `max_workers` threads is created for each run and steps
+        that do not depend on each other are evaluated concurrently. An
+        instance of `concurrent.futures.Executor` might be passed as well –
+        it is not shut down after the run.
+
+        .. note::
+
+            Step results are usually lazy objects – iterators or SQL
+            statements bound to a connection – that are consumed by
+            dependent steps. They can not be passed between processes,
+            therefore only executors sharing the address space, such as
+            thread pools, are supported. Source steps and steps depending
+            on objects bound to a thread, such as tables of an in-memory
+            SQLite database, are evaluated in the calling thread.
+
+        `retention` specifies how consumable results used by more than one
+        node are shared:
+
+        * ``"retain"`` (default) – the object is replaced by its retained
+          version, as provided by the backend. `retention_budget` is a number
+          of bytes of rows that retained objects keep in memory before they
+          spill to a temporary file. If not set, backend's default is used.
+        * ``"tee"`` – every consumer gets its own cursor over one shared
+          stream of rows. Only the rows between the slowest and the fastest
+          consumer are kept in memory, at most `max_lag` rows. Older rows are
+          spilled to a temporary file. Use this when the consumers read at
+          similar speed, for example with the ``"thread"`` executor.
+
+        If `optimize` is ``True`` then the graph is rewritten before the
+        execution plan is prepared: row filters and field projections are
+        moved as close to the sources as possible. See
+        :mod:`bubbles.execution.optimizer` for the rules.
+
+        If `fuse` is ``True`` then chains of fusable unary row operations,
+        such as `field_filter`, `retype` or `filter_by_value`, are evaluated
+        as one compiled function over rows. See :meth:`fuse_plan`.
+
+        `cache` is a :class:`ResultCache` or a path to a cache directory.
+        If set, results of operations are written into the cache as their
+        consumers read them and reused when the graph is run again with the
+        same sources. `cache_nodes` is a list of names of nodes whose
+        results are stored, by default results of all operations that can
+        be fingerprinted are stored. See :meth:`apply_cache`.
+
+        If `profile` is ``True`` then every run is profiled and `run()`
+        returns an :class:`ExecutionProfile` with evaluation and consumption
+        times, row counts, signatures, retries and peak memory of every step
+        of the execution plan. The last profile is also available as
+        `last_profile`.
+
+        `threaded` specifies steps that produce their rows in a worker
+        thread. It is a list of node names or ``"io"`` for all sources and
+        sinks (nodes without consumers). The rows are passed from a threaded
+        node to its consumers through a bounded queue of row batches, so
+        reading of a source, transformations and writing into a target
+        overlap. For a sink the rows of its inputs are produced in worker
+        threads. `queue_size` is the maximal number of batches in a queue –
+        the producer waits when the queue is full. `queue_sizes` is a
+        dictionary of queue sizes for particular node names. Results that
+        can be composed, such as SQL statements, are not threaded.
+
         Execution engine is also used in :class:`Pipeline` objects to run the
         pipelines.
         """
@@ -69,6 +153,50 @@ class ExecutionEngine(object):
         self.context = context
         self.logger = context.logger
 
+        if executor not in (None, "thread") \
+                and not isinstance(executor, futures.Executor):
+            raise ArgumentError("Unknown executor '%s'" % (executor, ))
+
+        self.executor = executor
+        self.max_workers = max_workers
+        self.retention_budget = retention_budget
+
+        if retention not in (None, "retain", "tee"):
+            raise ArgumentError("Unknown retention '%s'" % (retention, ))
+
+        self.retention = retention or "retain"
+        self.max_lag = max_lag
+
+        self.fuse = fuse
+        self.optimize = optimize
+
+        if isinstance(cache, str):
+            cache = ResultCache(cache)
+        self.cache = cache
+        self.cache_nodes = set(cache_nodes) if cache_nodes is not None \
+                            else None
+
+        # step -> fingerprint of a result to be stored in the cache
+        self._cache_keys = {}
+
+        self.profile = profile
+        self.last_profile = None
+        self._profiler = None
+
+        # node -> (tee, number of cursors already used)
+        self._tees = {}
+
+        if threaded is not None and threaded != "io" \
+                and isinstance(threaded, str):
+            raise ArgumentError("Unknown threading mode '%s'" % (threaded, ))
+
+        self.threaded = threaded
+        self.queue_size = queue_size
+        self.queue_sizes = queue_sizes or {}
+
+        # step -> size of the queue its rows are passed through
+        self._queues = {}
+
     def execution_plan(self, graph):
         """Returns a list of topologically sorted `ExecutionSteps`, ready to
         be used for execution.
@@ -80,11 +208,15 @@ class ExecutionEngine(object):
 
         # TODO: this method will be customizable in subclasses in the future
 
+        if self.optimize:
+            graph = optimize_graph(graph, self.context)
+
         # Operation -> Node -> Execution Step
         # Node is an operation with parameters set (configured operation)
         # Execution Node is Node in execution context with bound outlets
 
         sorted_nodes = graph.sorted_nodes()
+        names = dict((node, name) for name, node in graph.nodes.items())
 
         node_steps = {}
         steps = []
@@ -115,15 +247,80 @@ class ExecutionEngine(object):
                 # Count the consumption (see note before the outer loop)
                 consumption[outlet_node] += 1
 
-            step = ExecutionStep(node, outlets=outlet_nodes)
+            step = ExecutionStep(node, outlets=outlet_nodes,
+                                 name=names.get(node))
 
             node_steps[node] = step
             steps.append(step)
 
         plan = ExecutionPlan(steps, consumption)
 
+        if self.fuse:
+            plan = self.fuse_plan(plan)
+
         return plan
 
+    def fuse_plan(self, plan):
+        """Replaces chains of steps with fusable operations by one step with
+        a :class:`FusedNode`. A step is merged into its consumer only if the
+        consumer is the step's only consumer. Returns a new plan, the steps
+        are modified in place.
+
+        Whether the chain is really fused is decided during evaluation –
+        operations dispatched to other than ``rows`` implementation, for
+        example SQL statements, are evaluated one by one as usual."""
+
+        # Steps that are merged into their consumer
+        merged = set()
+
+        for step in plan.steps:
+            if self._is_fusable(step):
+                outlet = step.outlets[0]
+                if self._is_fusable(outlet) \
+                        and plan.consumption[outlet.node] == 1:
+                    merged.add(outlet)
+
+        steps = []
+        consumption = Counter(plan.consumption)
+
+        for step in plan.steps:
+            if step in merged:
+                continue
+
+            if self._is_fusable(step) and step.outlets[0] in merged:
+                chain = [step]
+                while chain[0].outlets[0] in merged:
+                    chain.insert(0, chain[0].outlets[0])
+
+                node = FusedNode([s.node for s in chain])
+                self.logger.debug("fusing steps: %s" % node)
+
+                for merged_step in chain[:-1]:
+                    del consumption[merged_step.node]
+                consumption[node] = consumption.pop(step.node, 0)
+
+                step.node = node
+                step.outlets = chain[0].outlets
+
+            steps.append(step)
+
+        return ExecutionPlan(steps, consumption)
+
+    def _is_fusable(self, step):
+        """Returns `True` if the `step` is an operation with one operand that
+        has a row kernel."""
+        if not isinstance(step.node, Node) or len(step.outlets) != 1:
+            return False
+
+        op = self.context.operation(step.node.opname)
+        self.context.load_implementations(op, [["rows"]])
+        try:
+            function = op.function(Signature("rows"))
+        except KeyError:
+            return False
+
+        return get_row_kernel(function) is not None
+
     def run(self, graph):
         """Runs the `graph` nodes. First an execution plan is prepared, then
         the nodes are executed according to the plan. See
@@ -145,32 +342,346 @@ class ExecutionEngine(object):
         plan = self.execution_plan(graph)
         # FIXME: TO HERE ^^^^^^^
 
+        self._tees = {}
+        self._cache_keys = {}
+        self._queues = self.threaded_steps(plan)
+
+        if self.cache is not None:
+            plan = self.apply_cache(plan)
+
+        if self.profile:
+            self._profiler = Profiler(plan, self.context,
+                                      step_memory=not self.executor)
+            self._profiler.start()
+
+        try:
+            if self.executor:
+                self._run_concurrently(plan)
+            else:
+                self._run_sequentially(plan)
+        finally:
+            if self._profiler:
+                self.last_profile = self._profiler.stop()
+                self._profiler = None
+
+        return self.last_profile if self.profile else None
+
+    def apply_cache(self, plan):
+        """Returns a plan with steps that have to be evaluated when results
+        from the engine's cache are reused.
+
+        Every step is fingerprinted (see
+        :func:`bubbles.execution.cache.node_fingerprint`). Source steps are
+        evaluated to get fingerprints of their objects. Steps with a cached
+        result get the cached object as their result and are not evaluated.
+        Steps whose results are needed only by such steps are not evaluated
+        either. Results of the remaining fingerprinted steps (only those in
+        `cache_nodes`, if set) are stored in the cache while they are read.
+        Results that can be composed, such as SQL statements, are not
+        stored, so their consumers can still compose them."""
+
+        fingerprints = {}
+        evaluated = set()
+        consumers = defaultdict(list)
+
+        for step in plan.steps:
+            for outlet in step.outlets:
+                consumers[outlet].append(step)
+
+            result = None
+            if step.node.is_source():
+                result = step.evaluate(self, self.context, [])
+                evaluated.add(step)
+
+            inputs = [fingerprints[outlet] for outlet in step.outlets]
+            fingerprint = node_fingerprint(step.node, inputs, result)
+            fingerprints[step] = fingerprint
+
+            if fingerprint is None or step in evaluated:
+                continue
+
+            cached = self.cache.get(fingerprint)
+            if cached is not None:
+                self.logger.debug("using cached result of step: %s"
+                                  % str(step))
+                step.result = cached
+                evaluated.add(step)
+            elif self.cache_nodes is None or step.name in self.cache_nodes:
+                self._cache_keys[step] = fingerprint
+
+        needed = set()
+        for step in reversed(plan.steps):
+            if step in evaluated:
+                continue
+            if not consumers[step] \
+                    or any(c in needed for c in consumers[step]):
+                needed.add(step)
+
+        steps = [step for step in plan.steps if step in needed]
+
+        return ExecutionPlan(steps, plan.consumption)
+
+    def threaded_steps(self, plan):
+        """Returns a dictionary of steps of `plan` that produce their rows in
+        a worker thread and sizes of their queues. See the `threaded`
+        option."""
+
+        if not self.threaded:
+            return {}
+
+        if self.threaded == "io":
+            consumed = set()
+            for step in plan.steps:
+                consumed.update(step.outlets)
+
+            threaded = set()
+            for step in plan.steps:
+                if step.node.is_source():
+                    threaded.add(step)
+                elif step not in consumed:
+                    threaded.update(step.outlets)
+        else:
+            names = set(self.threaded)
+            threaded = set(step for step in plan.steps if step.name in names)
+
+            unknown = names - set(step.name for step in plan.steps)
+            if unknown:
+                raise ArgumentError("Unknown threaded nodes: %s"
+                                    % ", ".join(sorted(unknown)))
+
+        return dict((step, self.queue_sizes.get(step.name, self.queue_size))
+                    for step in threaded)
+
+    def _evaluate(self, step, context, operands):
+        """Evaluates `step`, profiles the evaluation and stores the result in
+        the cache if requested."""
+
+        if self._profiler:
+            evaluate = lambda: self._evaluate_step(step, context, operands)
+            return self._profiler.evaluate(step, evaluate)
+        else:
+            return self._evaluate_step(step, context, operands)
+
+    def _evaluate_step(self, step, context, operands):
+        result = step.evaluate(self, context, operands)
+
+        fingerprint = self._cache_keys.get(step)
+        if fingerprint is not None and self._cacheable(result):
+            self.logger.debug("caching result of step: %s" % str(step))
+            step.result = self.cache.write_through(fingerprint, result)
+
+        return step.result
+
+    def _cacheable(self, obj):
+        """Returns ``True`` if rows of `obj` are written into the cache.
+        Objects that can be composed, such as SQL statements, are left to
+        their consumers."""
+
+        if not isinstance(obj, DataObject):
+            return False
+
+        representations = obj.representations()
+        return "rows" in representations and "sql" not in representations
+
+    def _run_sequentially(self, plan):
+        """Evaluates steps of the `plan` one by one in the plan order."""
+
         # Set of already consumed nodes
         consumed = set()
 
         for i, step in enumerate(plan.steps):
             self.logger.debug("step %s: %s" % (i, str(step)))
 
-            operands = []
-
-            for outlet in step.outlets:
-
-                # Check how many times the outlet node that is about to be
-                # used is going to be consumed. If it is consumable and will
-                # be consumed more than once, then a retained version of the
-                # object is created. Retention policy is defined by the
-                # backend. In most of the cases it is just python list wrapper
-                # over consumed iterator of rows, which might be quite costly.
-
-                consume_times = plan.consumption[outlet.node]
-                if outlet.result.is_consumable() and consume_times > 1:
-                    if outlet.node not in consumed:
-                        self.logger.debug("retaining consumable %s. it will "
-                                          "be consumed %s times" % \
-                                                 (outlet.node, consume_times))
-                        outlet.result = outlet.result.retained()
-
-                consumed.add(outlet.node)
-                operands.append(outlet.result)
-
-            step.evaluate(self, self.context, operands)
+            operands = self._prepare_operands(plan, step, consumed)
+            self._evaluate(step, self.context, operands)
+
+    def _run_concurrently(self, plan):
+        """Evaluates steps of the `plan` in the engine's executor. A step is
+        submitted once all steps in its outlets are evaluated. Operands are
+        prepared (and retained if necessary) in the calling thread, therefore
+        retention does not have to be thread safe.
+
+        Source steps are evaluated in the calling thread. So are steps with
+        a thread bound operand (see :meth:`DataObject.is_thread_bound`) and
+        all steps that depend on them, as their results might read the
+        operand lazily."""
+
+        # The default context is a thread local object – workers should use
+        # the same context as the thread that runs the graph.
+        context = self.context
+        if isinstance(context, LocalProxy):
+            context = context._represented_local_object()
+
+        if isinstance(self.executor, futures.Executor):
+            executor = self.executor
+        else:
+            executor = futures.ThreadPoolExecutor(self.max_workers)
+
+        # step -> number of outlet steps that were not yet evaluated
+        waiting = {}
+        # step -> steps that consume the step's result
+        dependants = defaultdict(list)
+
+        # Steps that are not in the plan are already evaluated, for example
+        # because they were read from the cache
+        planned = set(plan.steps)
+
+        for step in plan.steps:
+            outlets = set(step.outlets) & planned
+            waiting[step] = len(outlets)
+            for outlet in outlets:
+                dependants[outlet].append(step)
+
+        ready = [step for step in plan.steps if not waiting[step]]
+        order = dict((step, i) for i, step in enumerate(plan.steps))
+        running = {}
+        consumed = set()
+        # Steps evaluated in the calling thread because of thread bound
+        # objects
+        bound = set()
+
+        def evaluated(step):
+            for dependant in dependants[step]:
+                waiting[dependant] -= 1
+                if not waiting[dependant]:
+                    ready.append(dependant)
+
+            # Keep the plan order for steps that became ready together
+            ready.sort(key=order.__getitem__)
+
+        try:
+            while ready or running:
+                while ready:
+                    step = ready.pop(0)
+                    operands = self._prepare_operands(plan, step, consumed)
+
+                    is_bound = any(outlet in bound
+                                   for outlet in step.outlets) \
+                               or any(self._thread_bound(operand)
+                                      for operand in operands)
+
+                    if is_bound or step.node.is_source():
+                        self.logger.debug("evaluating step in the calling "
+                                          "thread: %s" % str(step))
+                        result = self._evaluate(step, context, operands)
+                        if is_bound or self._thread_bound(result):
+                            bound.add(step)
+                        evaluated(step)
+                    else:
+                        self.logger.debug("submitting step: %s" % str(step))
+                        future = executor.submit(self._evaluate, step,
+                                                 context, operands)
+                        running[future] = step
+
+                if not running:
+                    continue
+
+                done, _ = futures.wait(running,
+                                       return_when=futures.FIRST_COMPLETED)
+
+                for future in done:
+                    step = running.pop(future)
+                    # Re-raises an exception from the step evaluation
+                    future.result()
+                    evaluated(step)
+
+        except BaseException:
+            for future in running:
+                future.cancel()
+            # Do not leave steps running behind the caller's back
+            futures.wait(running)
+            raise
+
+        finally:
+            if executor is not self.executor:
+                executor.shutdown()
+
+    def _thread_bound(self, obj):
+        return isinstance(obj, DataObject) and obj.is_thread_bound()
+
+    def _prepare_operands(self, plan, step, consumed):
+        """Returns list of operands for `step` – results of the step's
+        outlets. `consumed` is a set of already consumed nodes."""
+
+        operands = []
+
+        for outlet in step.outlets:
+
+            # Check how many times the outlet node that is about to be
+            # used is going to be consumed. If it is consumable and will
+            # be consumed more than once, then a retained version of the
+            # object is created. Retention policy is defined by the
+            # backend. In most of the cases it is a buffer of rows that
+            # spills to a temporary file when it grows over the budget.
+
+            consume_times = plan.consumption[outlet.node]
+            result = outlet.result
+
+            if result.is_consumable() and consume_times > 1:
+                if self.retention == "tee" \
+                        and "rows" in result.representations():
+                    result = self._tee_cursor(outlet.node, result,
+                                              consume_times)
+
+                elif outlet.node not in consumed:
+                    self.logger.debug("retaining consumable %s. it will "
+                                      "be consumed %s times" % \
+                                             (outlet.node, consume_times))
+                    outlet.result = self._retain(outlet.result)
+                    result = outlet.result
+
+            if outlet in self._queues:
+                result = self._queued(outlet, result)
+
+            consumed.add(outlet.node)
+            operands.append(result)
+
+        return operands
+
+    def _queued(self, step, obj):
+        """Returns an object with rows of `obj` produced in a worker thread.
+        Objects without rows and objects that can be composed are returned
+        as they are."""
+
+        if not isinstance(obj, DataObject):
+            return obj
+
+        representations = obj.representations()
+        if "rows" not in representations or "sql" in representations:
+            return obj
+
+        self.logger.debug("reading %s through a queue" % step.node)
+        rows = RowQueue(obj.rows(), size=self._queues[step])
+
+        result = IterableDataSource(rows, obj.fields)
+        result.ordering = obj.ordering
+        return result
+
+    def _tee_cursor(self, node, obj, count):
+        """Returns an object reading the next cursor of the tee over rows of
+        `obj`. The tee is created on first use."""
+
+        try:
+            tee, used = self._tees[node]
+        except KeyError:
+            self.logger.debug("sharing consumable %s between %s consumers"
+                              % (node, count))
+            tee = RowTee(obj.rows(), count, max_lag=self.max_lag,
+                         budget=self.retention_budget)
+            used = 0
+
+        self._tees[node] = (tee, used + 1)
+
+        result = IterableDataSource(tee.cursor(used), obj.fields)
+        result.ordering = obj.ordering
+        return result
+
+    def _retain(self, obj):
+        """Returns retained version of consumable `obj`."""
+        if self.retention_budget is not None:
+            retained = obj.retained(budget=self.retention_budget)
+        else:
+            retained = obj.retained()
+
+        retained.ordering = obj.ordering
+        return retained
@@ -1,5 +1,7 @@
 from collections import OrderedDict, namedtuple, Counter
-from ..objects import data_object
+from ..objects import data_object, IterableDataSource
+from ..operation import Signature, get_representations
+from ..fusion import get_row_kernel, fuse_kernels
 from ..common import get_logger
 from ..errors import *
 
@@ -13,7 +15,8 @@ __all__ = (
     "StoreObjectNode",
     "ObjectNode",
     "CreateObjectNode",
-    "ObjectFactoryNode"
+    "ObjectFactoryNode",
+    "FusedNode"
 )
 
 class NodeBase(object):
@@ -47,6 +50,76 @@ class Node(NodeBase):
         return prototype.operands
 
 
+class FusedNode(NodeBase):
+    def __init__(self, nodes):
+        """Creates a node that evaluates a chain of unary operation `nodes`
+        as one function over rows. Each node consumes result of the previous
+        node. Created by the execution engine, see
+        :meth:`ExecutionEngine.fuse_plan`."""
+
+        self.nodes = nodes
+
+    def is_source(self):
+        return False
+
+    def kernels(self, context, obj):
+        """Returns list of row kernels with node arguments for the chain
+        evaluated with operand `obj`. Returns ``None`` if any of the
+        operations would not be dispatched to a fusable ``rows`` (or
+        ``batches``) implementation, for example because the operand is
+        composable SQL statement."""
+
+        rows = Signature("rows")
+        # Batch implementations are equivalent to the row implementations,
+        # the fused function replaces them as well
+        batches = Signature("batches")
+        reps = get_representations(obj)
+        kernels = []
+
+        for node in self.nodes:
+            op = context.operation(node.opname)
+            signature = context.resolution_order(op, reps)[0]
+
+            if signature != rows and signature != batches:
+                return None
+
+            try:
+                kernel = get_row_kernel(op.function(rows))
+            except KeyError:
+                return None
+            if kernel is None:
+                return None
+
+            kernels.append((kernel, node.args, node.kwargs))
+            # Fusable implementations return an IterableDataSource
+            reps = [["rows", "batches", "records"]]
+
+        return kernels
+
+    def evaluate(self, engine, context, operands=None):
+        obj = operands[0]
+        kernels = self.kernels(context, obj)
+
+        if kernels is None:
+            for node in self.nodes:
+                obj = node.evaluate(engine, context, [obj])
+            return obj
+
+        compiler = fuse_kernels(obj.fields, kernels)
+        function = compiler.compile()
+        result = IterableDataSource(function(obj.rows()), compiler.fields)
+        # Values passed through unchanged keep their order
+        result.ordering = compiler.ordering(obj.ordering)
+        return result
+
+    def outlets(self, context):
+        return self.nodes[0].outlets(context)
+
+    def __str__(self):
+        names = ", ".join(node.opname for node in self.nodes)
+        return "fused operations %s" % names
+
+
 class ObjectFactoryNode(NodeBase):
     def __init__(self, factory, *args, **kwargs):
 
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Manifest of operation implementations.
+
+The manifest maps operation names to signatures and to modules that register
+functions for the signatures. It is precomputed from the sources of the
+modules – the modules are parsed, not imported – and stored in the
+`op_manifest` module. A context with a manifest imports an operation module
+only when a call is dispatched to one of the module's signatures, so
+backends that are not used are never loaded.
+
+Regenerate the manifest after adding or removing operation implementations::
+
+    python -c "from bubbles.execution.manifest import write_manifest; write_manifest()"
+"""
+
+import ast
+import os.path
+import pprint
+from ..errors import *
+
+__all__ = (
+    "build_manifest",
+    "load_manifest",
+    "write_manifest",
+)
+
+
+# Path to the bubbles package
+_package_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_manifest_path = os.path.join(_package_path, "execution", "op_manifest.py")
+
+_manifest_header = '''\
+# -*- coding: utf-8 -*-
+"""Manifest of operation implementations: operation name -> list of
+(signature, module). Generated by `bubbles.execution.manifest.write_manifest()`,
+do not edit."""
+
+OPERATIONS = '''
+
+
+def _module_path(modname):
+    """Returns path to the source of bubbles module `modname`."""
+    parts = modname.split(".")
+    if parts[0] != "bubbles":
+        raise ArgumentError("Only bubbles modules can be in the manifest, "
+                            "not '%s'" % modname)
+
+    return os.path.join(_package_path, *parts[1:]) + ".py"
+
+
+def _registration(node):
+    """Returns tuple (`operation`, `signature`) if `node` is a call
+    ``operation.register("rep", ...)``, otherwise ``None``."""
+
+    if not isinstance(node, ast.Call) \
+            or not isinstance(node.func, ast.Attribute) \
+            or node.func.attr != "register" \
+            or not isinstance(node.func.value, ast.Name):
+        return None
+
+    signature = []
+    for arg in node.args:
+        if not isinstance(arg, ast.Constant) or not isinstance(arg.value, str):
+            return None
+        signature.append(arg.value)
+
+    return (node.func.value.id, tuple(signature))
+
+
+def module_registrations(modname):
+    """Returns list of tuples (`operation`, `signature`) registered at the
+    top level of module `modname`. Both the decorator form and the call form
+    ``op.register("rows")(function)`` are recognized."""
+
+    with open(_module_path(modname), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    registrations = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            calls = node.decorator_list
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            calls = [node.value.func]
+        else:
+            continue
+
+        for call in calls:
+            registration = _registration(call)
+            if registration:
+                registrations.append(registration)
+
+    return registrations
+
+
+def build_manifest(modules=None):
+    """Returns manifest of operation `modules` – a dictionary where keys are
+    operation names and values are lists of tuples (`signature`, `module`).
+    Default modules are those of the default context."""
+
+    if modules is None:
+        from .context import _default_op_modules
+        modules = _default_op_modules
+
+    manifest = {}
+    for modname in modules:
+        for opname, signature in module_registrations(modname):
+            entries = manifest.setdefault(opname, [])
+            entry = (signature, modname)
+            if entry not in entries:
+                entries.append(entry)
+
+    return manifest
+
+
+def write_manifest(path=None, modules=None):
+    """Writes the manifest of `modules` as a Python module into `path`.
+    Default path is the `op_manifest` module of this package."""
+
+    manifest = build_manifest(modules)
+    text = _manifest_header + pprint.pformat(manifest, width=76) + "\n"
+
+    with open(path or _manifest_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def load_manifest():
+    """Returns the precomputed manifest."""
+    from .op_manifest import OPERATIONS
+    return OPERATIONS
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Manifest of operation implementations: operation name -> list of
+(signature, module). Generated by `bubbles.execution.manifest.write_manifest()`,
+do not edit."""
+
+OPERATIONS = {'added_keys': [(('sql', 'sql'), 'bubbles.backends.sql.ops')],
+ 'added_rows': [(('sql', 'sql'), 'bubbles.backends.sql.ops'),
+                (('rows', 'sql'), 'bubbles.backends.sql.ops')],
+ 'aggregate': [(('sql',), 'bubbles.backends.sql.ops'),
+               (('columns',), 'bubbles.backends.numpy.ops'),
+               (('rows',), 'bubbles.ops.rows')],
+ 'append': [(('sql[]',), 'bubbles.backends.sql.ops'),
+            (('rows[]',), 'bubbles.ops.rows')],
+ 'append_constant_fields': [(('sql',), 'bubbles.backends.sql.ops'),
+                            (('rows',), 'bubbles.ops.rows'),
+                            (('batches',), 'bubbles.ops.batches')],
+ 'as_batches': [(('batches',), 'bubbles.ops.batches')],
+ 'as_columns': [(('batches',), 'bubbles.backends.numpy.ops'),
+                (('columns',), 'bubbles.backends.numpy.ops')],
+ 'as_dict': [(('rows',), 'bubbles.ops.rows')],
+ 'as_records': [(('sql',), 'bubbles.backends.sql.ops'),
+                (('rows',), 'bubbles.ops.rows')],
+ 'assert_contains': [(('sql',), 'bubbles.backends.sql.ops')],
+ 'assert_missing': [(('sql',), 'bubbles.backends.sql.ops')],
+ 'assert_unique': [(('sql',), 'bubbles.backends.sql.ops')],
+ 'basic_audit': [(('rows',), 'bubbles.ops.audit')],
+ 'changed_rows': [(('sql', 'sql'), 'bubbles.backends.sql.ops')],
+ 'count_duplicates': [(('sql',), 'bubbles.backends.sql.ops')],
+ 'dates_to_dimension': [(('sql',), 'bubbles.backends.sql.ops'),
+                        (('rows',), 'bubbles.ops.rows')],
+ 'debug_fields': [(('*',), 'bubbles.ops.generic')],
+ 'derive': [(('sql',), 'bubbles.backends.sql.ops'),
+            (('rows',), 'bubbles.ops.rows')],
+ 'discard_nth': [(('rows',), 'bubbles.ops.rows'),
+                 (('records',), 'bubbles.ops.rows')],
+ 'distinct': [(('sql',), 'bubbles.backends.sql.ops'),
+              (('mongo',), 'bubbles.backends.mongo.ops'),
+              (('columns',), 'bubbles.backends.numpy.ops'),
+              (('rows',), 'bubbles.ops.rows')],
+ 'distinct_count': [(('sql',), 'bubbles.backends.sql.ops'),
+                    (('rows',), 'bubbles.ops.audit')],
+ 'distinct_rows': [(('rows',), 'bubbles.ops.rows')],
+ 'drop_fields': [(('*',), 'bubbles.ops.generic')],
+ 'duplicate_stats': [(('sql_statement',), 'bubbles.backends.sql.ops')],
+ 'empty_to_missing': [(('rows',), 'bubbles.ops.rows')],
+ 'fetch_all': [(('rows',), 'bubbles.ops.rows'),
+               (('batches',), 'bubbles.ops.batches')],
+ 'field_filter': [(('sql',), 'bubbles.backends.sql.ops'),
+                  (('mongo',), 'bubbles.backends.mongo.ops'),
+                  (('rows',), 'bubbles.ops.rows'),
+                  (('batches',), 'bubbles.ops.batches')],
+ 'filter_by_expression': [(('sql',), 'bubbles.backends.sql.ops'),
+                          (('rows',), 'bubbles.ops.rows')],
+ 'filter_by_predicate': [(('sql',), 'bubbles.backends.sql.ops'),
+                         (('rows',), 'bubbles.ops.rows'),
+                         (('records',), 'bubbles.ops.rows')],
+ 'filter_by_range': [(('sql',), 'bubbles.backends.sql.ops'),
+                     (('columns',), 'bubbles.backends.numpy.ops'),
+                     (('rows',), 'bubbles.ops.rows'),
+                     (('batches',), 'bubbles.ops.batches')],
+ 'filter_by_set': [(('sql',), 'bubbles.backends.sql.ops'),
+                   (('columns',), 'bubbles.backends.numpy.ops'),
+                   (('rows',), 'bubbles.ops.rows'),
+                   (('batches',), 'bubbles.ops.batches')],
+ 'filter_by_value': [(('sql',), 'bubbles.backends.sql.ops'),
+                     (('columns',), 'bubbles.backends.numpy.ops'),
+                     (('rows',), 'bubbles.ops.rows'),
+                     (('batches',), 'bubbles.ops.batches')],
+ 'filter_empty': [(('rows',), 'bubbles.ops.rows'),
+                  (('batches',), 'bubbles.ops.batches')],
+ 'filter_not_empty': [(('sql',), 'bubbles.backends.sql.ops'),
+                      (('rows',), 'bubbles.ops.rows'),
+                      (('batches',), 'bubbles.ops.batches')],
+ 'first_unique': [(('sql',), 'bubbles.backends.sql.ops'),
+                  (('rows',), 'bubbles.ops.rows')],
+ 'infer_types': [(('rows',), 'bubbles.ops.audit')],
+ 'insert': [(('sql', 'sql'), 'bubbles.backends.sql.ops'),
+            (('rows', 'sql'), 'bubbles.backends.sql.ops'),
+            (('batches', 'sql'), 'bubbles.backends.sql.ops')],
+ 'join_details': [(('sql', 'sql'), 'bubbles.backends.sql.ops'),
+                  (('sql', 'sql[]'), 'bubbles.backends.sql.ops'),
+                  (('rows', 'rows'), 'bubbles.ops.rows')],
+ 'keep_fields': [(('*',), 'bubbles.ops.generic')],
+ 'load_versioned_dimension': [(('sql_table', 'sql'),
+                               'bubbles.backends.sql.ops')],
+ 'nonempty_count': [(('sql',), 'bubbles.backends.sql.ops')],
+ 'pretty_print': [(('records',), 'bubbles.ops.rows')],
+ 'rename_fields': [(('*',), 'bubbles.ops.generic')],
+ 'retype': [(('rows',), 'bubbles.ops.rows')],
+ 'sample': [(('sql',), 'bubbles.backends.sql.ops'),
+            (('mongo',), 'bubbles.backends.mongo.ops'),
+            (('rows',), 'bubbles.ops.rows')],
+ 'sort': [(('sql',), 'bubbles.backends.sql.ops'),
+          (('columns',), 'bubbles.backends.numpy.ops'),
+          (('rows',), 'bubbles.ops.rows')],
+ 'split_date': [(('sql',), 'bubbles.backends.sql.ops'),
+                (('rows',), 'bubbles.ops.rows')],
+ 'string_split_fixed': [(('rows',), 'bubbles.ops.rows')],
+ 'string_strip': [(('rows',), 'bubbles.ops.rows')],
+ 'string_to_date': [(('rows',), 'bubbles.ops.rows')],
+ 'text_substitute': [(('rows',), 'bubbles.ops.rows')],
+ 'top': [(('sql',), 'bubbles.backends.sql.ops'),
+         (('rows',), 'bubbles.ops.rows')],
+ 'transpose_by': [(('rows',), 'bubbles.ops.rows')],
+ 'window': [(('sql',), 'bubbles.backends.sql.ops'),
+            (('rows',), 'bubbles.ops.rows')]}
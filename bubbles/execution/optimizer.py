@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""Graph rewrites applied before an execution plan is prepared.
+
+The optimizer moves row filters and field projections as close to the
+sources as possible, so they are evaluated on smaller data and, if they reach
+a composable source such as an SQL table, they are evaluated by the backend.
+
+Rules:
+
+* a filter moves above `retype` if the filtered field is not retyped, above
+  `append_constant_fields` if the field is not appended, above a projection
+  (the field is renamed back) and onto the master side of `join_details` if
+  the field comes from the master
+* a projection (`field_filter`, `keep_fields`, `drop_fields`,
+  `rename_fields`) moves above `retype` and above `append_constant_fields`
+  if it does not touch the appended fields
+* a limit – `sample` in the ``first`` mode – moves above operations that
+  map every row to one row (projections, `retype`, `string_strip`,
+  `empty_to_missing`, `append_constant_fields` and `derive`), so sources
+  read only the first rows (SQL ``LIMIT``). A limit below `sort` replaces
+  both with `top`. `pretty_print` with a `limit` gets a limit above it
+
+A node moves only above a node that has no other consumer. Filters never
+move above other filters, projections never move above filters and limits
+move only above row maps, which guarantees that the rewriting ends."""
+
+from collections import OrderedDict
+from ..metadata import FieldList, FieldFilter, prepare_key
+from ..common import get_logger
+from ..errors import *
+from .graph import Graph, Node, ObjectNode, Connection
+
+__all__ = (
+    "optimize_graph",
+)
+
+
+# Filter operation -> name of the filtered field parameter
+_filter_fields = {
+    "filter_by_value": "key",
+    "filter_by_set": "field",
+    "filter_by_range": "field",
+    "filter_not_empty": "field",
+    "filter_empty": "field",
+}
+
+# Operations that do not change field names
+_preserving_ops = set(_filter_fields) | set(["retype", "string_strip",
+                                             "empty_to_missing", "sample",
+                                             "sort", "filter_by_expression",
+                                             "top"])
+
+_projection_ops = set(["field_filter", "keep_fields", "drop_fields",
+                       "rename_fields"])
+
+# Operations that produce exactly one row for every input row, in the same
+# order
+_row_map_ops = _projection_ops | set(["retype", "string_strip",
+                                      "empty_to_missing",
+                                      "append_constant_fields", "derive"])
+
+
+def optimize_graph(graph, context):
+    """Returns an optimized copy of `graph`. Operation parameters are
+    resolved with operation prototypes from `context`. See the module
+    documentation for the list of applied rules."""
+
+    return GraphOptimizer(graph, context).optimize()
+
+
+class GraphOptimizer(object):
+    def __init__(self, graph, context):
+        """Creates an optimizer of a copy of `graph`."""
+
+        self.graph = Graph()
+        self.graph.nodes = OrderedDict(graph.nodes)
+        self.graph.connections = set(graph.connections)
+        self.context = context
+        self.logger = get_logger()
+
+    def optimize(self):
+        """Applies the rules until no rule can be applied. Returns the
+        optimized graph."""
+
+        changed = True
+        while changed:
+            changed = False
+            for node in list(self.graph.nodes.values()):
+                if self.push_down(node):
+                    changed = True
+
+        return self.graph
+
+    def push_down(self, node):
+        """Moves `node` above its input if possible. Returns `True` if the
+        graph was changed."""
+
+        if not isinstance(node, Node):
+            return False
+
+        if node.opname in _filter_fields:
+            rule = self.filter_above
+        elif node.opname in _projection_ops:
+            rule = self.projection_above
+        elif node.opname == "sample":
+            rule = self.limit_above
+        elif node.opname == "pretty_print":
+            return self.limit_output(node)
+        else:
+            return False
+
+        inputs = self.inputs(node)
+        if len(inputs) != 1:
+            return False
+
+        upstream = inputs[0].source
+        if not isinstance(upstream, Node) or len(self.outputs(upstream)) != 1:
+            return False
+
+        # The rule returns the new node and the input connection of the
+        # upstream node the new node is moved to, or `True` if it rewrote
+        # the graph itself
+        result = rule(node, upstream)
+        if result is None:
+            return False
+        elif result is True:
+            return True
+
+        new_node, through = result
+        self.logger.debug("moving %s above %s" % (node, upstream))
+        self.move_above(node, new_node, upstream, through)
+
+        return True
+
+    def filter_above(self, node, upstream):
+        params = self.parameters(node)
+        param = _filter_fields[node.opname]
+        field = str(params[param])
+        upstream_params = self.parameters(upstream)
+
+        through = self.inputs(upstream)
+        if upstream.opname == "join_details":
+            master_key = prepare_key(upstream_params["master_key"])
+            master = [conn for conn in through
+                      if conn.outlet in ("master", "default")]
+            if not master:
+                return None
+
+            names = self.field_names(master[0].source)
+            if field not in master_key \
+                    and (names is None or field not in names):
+                return None
+
+            through = master
+
+        elif len(through) != 1:
+            return None
+
+        elif upstream.opname == "retype":
+            if field in upstream_params["typemap"]:
+                return None
+
+        elif upstream.opname == "append_constant_fields":
+            if field in FieldList(*upstream_params["fields"]).names():
+                return None
+
+        elif upstream.opname in _projection_ops:
+            field_filter = self.field_filter(upstream)
+            renamed = dict((new, old) for old, new
+                           in field_filter.rename.items())
+            field = renamed.get(field, field)
+
+        else:
+            return None
+
+        params[param] = field
+        return (self.node(node.opname, params), through[0])
+
+    def projection_above(self, node, upstream):
+        through = self.inputs(upstream)
+        if len(through) != 1:
+            return None
+
+        field_filter = self.field_filter(node)
+        keep, drop, rename = (field_filter.keep, field_filter.drop,
+                              field_filter.rename)
+        params = self.parameters(upstream)
+
+        if upstream.opname == "retype":
+            if keep:
+                selected = lambda name: name in keep
+            else:
+                selected = lambda name: name not in drop
+
+            typemap = dict((rename.get(name, name), storage_type)
+                           for name, storage_type in params["typemap"].items()
+                           if selected(name))
+            new_upstream = self.node("retype", {"typemap": typemap})
+
+        elif upstream.opname == "append_constant_fields":
+            appended = FieldList(*params["fields"]).names()
+            if keep or any(name in appended for name in drop) \
+                    or any(name in appended for name in rename):
+                return None
+            new_upstream = upstream
+
+        else:
+            return None
+
+        self.replace(upstream, new_upstream)
+        through = self.inputs(new_upstream)
+
+        params = {}
+        if keep:
+            params["keep"] = keep
+        if drop:
+            params["drop"] = drop
+        if rename:
+            params["rename"] = rename
+
+        return (Node("field_filter", **params), through[0])
+
+    def limit(self, node):
+        """Returns number of rows of a `sample` node that selects the first
+        rows, otherwise ``None``."""
+        params = self.parameters(node)
+        if params.get("mode", "first") != "first" or params.get("discard"):
+            return None
+        return params["value"]
+
+    def limit_above(self, node, upstream):
+        value = self.limit(node)
+        if value is None:
+            return None
+
+        through = self.inputs(upstream)
+        if len(through) != 1:
+            return None
+
+        if upstream.opname in _row_map_ops:
+            return (node, through[0])
+
+        elif upstream.opname == "sort":
+            orderby = self.parameters(upstream)["orderby"]
+            top = self.node("top", {"orderby": orderby, "n": value})
+            self.logger.debug("replacing %s and %s with %s"
+                              % (upstream, node, top))
+            self.replace(upstream, top)
+            self.bypass(node)
+            return True
+
+        return None
+
+    def limit_output(self, node):
+        """Puts a limit above `pretty_print` `node` with a `limit`. Returns
+        `True` if the graph was changed."""
+
+        limit = self.parameters(node).get("limit")
+        inputs = self.inputs(node)
+        if limit is None or len(inputs) != 1:
+            return False
+
+        link = inputs[0]
+        upstream = link.source
+
+        # The input might be already limited, possibly above row maps
+        source = upstream
+        while isinstance(source, Node):
+            if source.opname == "sample":
+                value = self.limit(source)
+                if value is not None and value <= limit:
+                    return False
+                break
+            source_inputs = self.inputs(source)
+            if source.opname not in _row_map_ops or len(source_inputs) != 1:
+                break
+            source = source_inputs[0].source
+
+        sample = Node("sample", limit)
+        self.graph.add(sample)
+        self.logger.debug("limiting input of %s to %s rows" % (node, limit))
+
+        connections = self.graph.connections
+        connections.discard(link)
+        connections.add(Connection(upstream, sample, "default"))
+        connections.add(Connection(sample, node, link.outlet))
+
+        return True
+
+    def bypass(self, node):
+        """Removes unary `node`, its consumers consume its input instead."""
+        link = self.inputs(node)[0]
+        connections = self.graph.connections
+        connections.discard(link)
+        for conn in self.outputs(node):
+            connections.discard(conn)
+            connections.add(Connection(link.source, conn.target, conn.outlet))
+
+        del self.graph.nodes[self.graph.node_name(node)]
+
+    def parameters(self, node):
+        """Returns dictionary of parameters of operation `node`."""
+        op = self.context.operation(node.opname)
+        params = dict(zip(op.parameters, node.args))
+        params.update(node.kwargs)
+        return params
+
+    def node(self, opname, params):
+        """Returns a new operation node with `params`. Parameters are passed
+        as positional arguments in the order of the prototype, because
+        implementations might name them differently."""
+
+        op = self.context.operation(opname)
+        params = dict(params)
+        args = []
+        for name in op.parameters:
+            if name not in params:
+                break
+            args.append(params.pop(name))
+
+        return Node(opname, *args, **params)
+
+    def field_filter(self, node):
+        """Returns a `FieldFilter` of a projection `node`."""
+        params = self.parameters(node)
+
+        if node.opname == "field_filter":
+            if params.get("filter"):
+                return params["filter"]
+            return FieldFilter(keep=params.get("keep"),
+                               drop=params.get("drop"),
+                               rename=params.get("rename"))
+        elif node.opname == "keep_fields":
+            return FieldFilter(keep=params["keep"])
+        elif node.opname == "drop_fields":
+            return FieldFilter(drop=params["drop"])
+        else:
+            return FieldFilter(rename=params["rename"])
+
+    def field_names(self, node):
+        """Returns list of names of fields produced by `node` if they can be
+        determined without evaluating the graph, otherwise ``None``."""
+
+        if isinstance(node, ObjectNode):
+            try:
+                return node.obj.fields.names()
+            except AttributeError:
+                return None
+
+        if not isinstance(node, Node):
+            return None
+
+        inputs = dict((conn.outlet, conn.source) for conn in self.inputs(node))
+
+        if node.opname == "join_details":
+            master = inputs.get("master") or inputs.get("default")
+            detail = inputs.get("detail")
+            if master is None or detail is None:
+                return None
+
+            params = self.parameters(node)
+            master_names = self.field_names(master)
+            if params.get("mode") in ("semi", "anti"):
+                return master_names
+
+            detail_names = self.field_names(detail)
+            if master_names is None or detail_names is None:
+                return None
+
+            detail_key = prepare_key(params["detail_key"])
+            return master_names + [name for name in detail_names
+                                   if name not in detail_key]
+
+        if len(inputs) != 1:
+            return None
+
+        names = self.field_names(list(inputs.values())[0])
+        if names is None:
+            return None
+
+        if node.opname in _preserving_ops:
+            return names
+        elif node.opname in _projection_ops:
+            field_filter = self.field_filter(node)
+            try:
+                return field_filter.filter(FieldList(*names)).names()
+            except NoSuchFieldError:
+                return None
+        elif node.opname == "append_constant_fields":
+            fields = self.parameters(node)["fields"]
+            return names + FieldList(*fields).names()
+        else:
+            return None
+
+    def inputs(self, node):
+        return [conn for conn in self.graph.connections if conn.target == node]
+
+    def outputs(self, node):
+        return [conn for conn in self.graph.connections if conn.source == node]
+
+    def replace(self, node, new_node):
+        """Replaces `node` with `new_node` keeping the connections."""
+        if node is new_node:
+            return
+
+        name = self.graph.node_name(node)
+        self.graph.nodes[name] = new_node
+
+        connections = set()
+        for conn in self.graph.connections:
+            source = new_node if conn.source == node else conn.source
+            target = new_node if conn.target == node else conn.target
+            connections.add(Connection(source, target, conn.outlet))
+
+        self.graph.connections = connections
+
+    def move_above(self, node, new_node, upstream, through):
+        """Moves `node` from below the `upstream` node into the `through`
+        connection of the upstream node and replaces it with `new_node`.
+        Consumers of `node` consume the `upstream` node instead."""
+
+        # The upstream might have been replaced by the rule
+        upstream = through.target
+        link = self.inputs(node)[0]
+        outputs = self.outputs(node)
+
+        connections = self.graph.connections
+        connections.discard(through)
+        connections.discard(link)
+        for conn in outputs:
+            connections.discard(conn)
+
+        connections.add(Connection(through.source, new_node, link.outlet))
+        connections.add(Connection(new_node, upstream, through.outlet))
+        for conn in outputs:
+            connections.add(Connection(upstream, conn.target, conn.outlet))
+
+        name = self.graph.node_name(node)
+        self.graph.nodes[name] = new_node
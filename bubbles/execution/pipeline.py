@@ -41,7 +41,9 @@ class Pipeline(object):
         .. note::
 
             You can set the `engine_class` variable to your own custom
-            execution engine class with custom execution policy.
+            execution engine class with custom execution policy. Additional
+            engine arguments, such as `executor`, can be set in the
+            `engine_options` dictionary.
 
         """
         # We need the context to get number of operads for every argument
@@ -54,6 +56,7 @@ class Pipeline(object):
 
         # Set default execution engine
         self.engine_class = ExecutionEngine
+        self.engine_options = {}
 
         # Current node
         self.node = None
@@ -205,6 +208,9 @@ class Pipeline(object):
         the data. The second one *"if satisfied"* tests whether the pipeline
         will be able to run successfuly.
 
+        Returns result of the engine's run, for example an execution profile
+        if the engine is created with ``profile=True`` option (see
+        `engine_options`).
         """
 
         engine = self._get_engine(context)
@@ -253,7 +259,8 @@ class Pipeline(object):
         """Return a fresh engine instance that uses either target's context or
         explicitly specified other `context`."""
         context = context or self.context
-        engine = self.engine_class(context=context, stores=self.stores)
+        engine = self.engine_class(context=context, stores=self.stores,
+                                   **self.engine_options)
         return engine
 
     def test_if_needed(self):
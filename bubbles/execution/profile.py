@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""Profiling of graph execution.
+
+Results of most operations are lazy – an operation returns an iterator and
+the work is done when a consumer reads the rows. Therefore the time of every
+step is reported in two parts:
+
+* *evaluation time* – time spent in the operation call itself
+* *consumption time* – time spent producing rows of the step's result when
+  they were read by consumers
+
+Both times are exclusive: time spent in producing rows of upstream steps is
+not included, it is reported by the upstream steps. For example an
+operation that fetches all rows during its call has evaluation time of
+storing the rows, not of reading them.
+
+Rows are counted and timed by wrapping the `rows()` and `batches()` methods
+of step results. Results that are not read as rows, such as composed SQL statements, have no
+row counts."""
+
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+__all__ = (
+    "ExecutionProfile",
+    "StepProfile",
+    "ProfilingContextObserver",
+)
+
+
+class StepProfile(object):
+    def __init__(self, index, step):
+        """Profile of a step at `index` in an execution plan."""
+
+        self.index = index
+        self.node = str(step.node)
+
+        # Signature that finished the operation call and number of retries
+        self.signature = None
+        self.retries = 0
+
+        self.evaluation_time = 0.0
+        # Time spent in reading result rows, including and excluding time of
+        # upstream steps
+        self.inclusive_time = 0.0
+        self.consumption_time = 0.0
+
+        self.rows_in = None
+        self.rows_out = None
+        self.peak_memory = None
+
+        # Depth of nested operation calls
+        self._depth = 0
+
+    @property
+    def wall_time(self):
+        """Total time attributed to the step: evaluation and exclusive
+        consumption time."""
+        return self.evaluation_time + self.consumption_time
+
+    def as_dict(self):
+        """Returns a dictionary with profile values."""
+        return OrderedDict([
+            ("index", self.index),
+            ("node", self.node),
+            ("signature", self.signature),
+            ("retries", self.retries),
+            ("wall_time", self.wall_time),
+            ("evaluation_time", self.evaluation_time),
+            ("consumption_time", self.consumption_time),
+            ("rows_in", self.rows_in),
+            ("rows_out", self.rows_out),
+            ("peak_memory", self.peak_memory),
+        ])
+
+
+class ExecutionProfile(object):
+    def __init__(self, steps=None):
+        """Report of a profiled run. `steps` is a list of `StepProfile`
+        objects in the order of the execution plan."""
+
+        self.steps = steps or []
+        self.wall_time = None
+        self.peak_memory = None
+
+    def as_dict(self):
+        """Returns a dictionary with the run totals and list of step
+        dictionaries."""
+        return OrderedDict([
+            ("wall_time", self.wall_time),
+            ("peak_memory", self.peak_memory),
+            ("steps", [step.as_dict() for step in self.steps]),
+        ])
+
+    def slowest(self, count=1):
+        """Returns list of `count` steps with the largest wall time."""
+        steps = sorted(self.steps, key=lambda step: step.wall_time,
+                       reverse=True)
+        return steps[:count]
+
+    def __str__(self):
+        header = ("step", "eval s", "consume s", "rows in", "rows out",
+                  "peak KiB", "retries", "node")
+        lines = ["%4s %10s %10s %10s %10s %10s %7s  %s" % header]
+
+        def number(value):
+            return "-" if value is None else str(value)
+
+        for step in self.steps:
+            memory = None if step.peak_memory is None \
+                        else step.peak_memory // 1024
+            signature = " (%s)" % step.signature if step.signature else ""
+            lines.append("%4d %10.4f %10.4f %10s %10s %10s %7d  %s%s"
+                         % (step.index, step.evaluation_time,
+                            step.consumption_time, number(step.rows_in),
+                            number(step.rows_out), number(memory),
+                            step.retries, step.node, signature))
+
+        lines.append("total %.4f s, peak memory %s KiB"
+                     % (self.wall_time or 0.0,
+                        number(None if self.peak_memory is None
+                               else self.peak_memory // 1024)))
+
+        return "\n".join(lines)
+
+
+class ProfilingContextObserver(object):
+    def __init__(self, observer=None):
+        """Context observer that records signatures and retries of calls
+        into the profile of the step being evaluated in the current thread.
+        Events are passed to the original `observer` as well."""
+
+        self.observer = observer
+        self._local = threading.local()
+
+    @property
+    def current(self):
+        """Profile of the step evaluated in the current thread."""
+        return getattr(self._local, "current", None)
+
+    @current.setter
+    def current(self, profile):
+        self._local.current = profile
+
+    def will_call_operation(self, ctx, op, signature):
+        if self.current:
+            self.current._depth += 1
+        if self.observer:
+            self.observer.will_call_operation(ctx, op, signature)
+
+    def did_call_operation(self, ctx, op, signature, first):
+        profile = self.current
+        if profile:
+            profile._depth -= 1
+            # Only the outermost call is the step's operation
+            if profile._depth == 0:
+                profile.signature = str(signature)
+        if self.observer:
+            self.observer.did_call_operation(ctx, op, signature, first)
+
+    def will_retry_operation(self, ctx, op, signature, first, reason):
+        if self.current:
+            self.current.retries += 1
+        if self.observer:
+            self.observer.will_retry_operation(ctx, op, signature, first,
+                                               reason)
+
+
+class Profiler(object):
+    def __init__(self, plan, context, step_memory=True):
+        """Collects profile of a run of `plan` within `context`. If
+        `step_memory` is ``True`` then peak memory is measured for each step
+        evaluation – this makes sense only if steps are not evaluated
+        concurrently."""
+
+        self.steps = OrderedDict((step, StepProfile(i, step))
+                                 for i, step in enumerate(plan.steps))
+        self.profile = ExecutionProfile(list(self.steps.values()))
+
+        self.context = context
+        self.observer = None
+        self.step_memory = step_memory and hasattr(tracemalloc, "reset_peak")
+
+        # Stack of evaluated steps and row iterators that are being read, for
+        # each thread
+        self._local = threading.local()
+        self._started = None
+        self._tracing = False
+        # Tuples (object, original instance attributes) of wrapped results
+        self._wrapped = []
+
+    def start(self):
+        """Starts the profiling: installs the profiling observer into the
+        context and starts tracing of memory allocations."""
+        self.observer = ProfilingContextObserver(self.context.observer)
+        self.context.observer = self.observer
+
+        self._started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def stop(self):
+        """Stops the profiling and returns the `ExecutionProfile`."""
+        self.profile.wall_time = time.perf_counter() - self._started
+        self.profile.peak_memory = tracemalloc.get_traced_memory()[1]
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+        self.context.observer = self.observer.observer
+        self.unwrap_rows()
+
+        for step, profile in self.steps.items():
+            counts = [self.steps[outlet].rows_out for outlet in step.outlets
+                      if outlet in self.steps]
+            if counts and None not in counts:
+                profile.rows_in = sum(counts)
+
+        return self.profile
+
+    def evaluate(self, step, evaluate):
+        """Evaluates `step` with function `evaluate` and records evaluation
+        time and peak memory. If the result has rows, they are wrapped so
+        their consumption is recorded as well."""
+
+        profile = self.steps[step]
+        self.observer.current = profile
+        if self.step_memory:
+            tracemalloc.reset_peak()
+
+        stack = self._stack()
+        frame = [profile, 0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            result = evaluate()
+        finally:
+            stack.pop()
+            profile.evaluation_time = time.perf_counter() - start - frame[1]
+            if self.step_memory:
+                profile.peak_memory = tracemalloc.get_traced_memory()[1]
+            self.observer.current = None
+
+        if hasattr(result, "representations") \
+                and "rows" in result.representations():
+            self.wrap_rows(result, profile)
+
+        return result
+
+    def wrap_rows(self, obj, profile):
+        """Replaces `rows()` and `batches()` of `obj` with functions that
+        count and time the rows. The original methods are restored by
+        `unwrap_rows()`, as the object might be a source owned by the
+        caller."""
+
+        rows = obj.rows
+        batches = getattr(obj, "batches", None)
+        profiler = self
+
+        names = ["rows"] if batches is None else ["rows", "batches"]
+        attributes = vars(obj)
+        self._wrapped.append((obj, dict((name, attributes.get(name))
+                                        for name in names)))
+
+        def profiled_rows(*args, **kwargs):
+            if profile.rows_out is None:
+                profile.rows_out = 0
+            return profiler._timed(rows(*args, **kwargs), profile)
+
+        def profiled_batches(*args, **kwargs):
+            if profile.rows_out is None:
+                profile.rows_out = 0
+            return profiler._timed(batches(*args, **kwargs), profile,
+                                   batched=True)
+
+        obj.rows = profiled_rows
+        if batches is not None:
+            obj.batches = profiled_batches
+
+    def unwrap_rows(self):
+        """Restores methods of the objects replaced by `wrap_rows()`."""
+        while self._wrapped:
+            obj, attributes = self._wrapped.pop()
+            for name, value in attributes.items():
+                if value is None:
+                    delattr(obj, name)
+                else:
+                    setattr(obj, name, value)
+
+    def _stack(self):
+        """Returns stack of frames ``[profile, time in nested frames]`` of
+        the current thread."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _timed(self, iterable, profile, batched=False):
+        stack = self._stack()
+
+        iterator = iter(iterable)
+        while True:
+            if stack and stack[-1][0] is profile:
+                # Batches read from the rows of the same result (or the
+                # other way around) are counted only once
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                yield item
+                continue
+
+            frame = [profile, 0.0]
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                profile.inclusive_time += elapsed
+                profile.consumption_time += elapsed - frame[1]
+                if stack:
+                    stack[-1][1] += elapsed
+
+            profile.rows_out += len(item) if batched else 1
+            yield item
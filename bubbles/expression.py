@@ -1,89 +1,264 @@
-from expressions import Compiler, ExpressionError, default_dialect
-
-class bubbles_dialect(default_dialect):
-    operators = {
-        # "^": (1000, RIGHT, BINARY),
-        "~": (1000, None, UNARY),
-        "¬": (1000, None, UNARY),
-        "*": (900, LEFT, BINARY),
-        "/": (900, LEFT, BINARY),
-        "%": (900, LEFT, BINARY),
-
-        "+":  (500, LEFT, BINARY),
-        "-":  (500, LEFT, UNARY | BINARY),
-
-        "<<": (350, LEFT, BINARY),
-        ">>": (350, LEFT, BINARY),
-
-        "&":  (300, LEFT, BINARY),
-        "|":  (300, LEFT, BINARY),
-
-        "<":  (200, LEFT, BINARY),
-        "≤": (200, LEFT, BINARY),
-        "<=": (200, LEFT, BINARY),
-        ">":  (200, LEFT, BINARY),
-        "≥": (200, LEFT, BINARY),
-        ">=": (200, LEFT, BINARY),
-        "≠": (200, LEFT, BINARY),
-        "!=": (200, LEFT, BINARY),
-        "=":  (200, LEFT, BINARY),
-
-        "not": (120, None, UNARY),
-        "and": (110, LEFT, BINARY),
-        "or":  (100, LEFT, BINARY),
-    }
-    case_sensitive = False
-
-    # TODO: future function list (unused now)
-    functions = (
-            "min", "max",
-            )
-
-# IS blank
-# IS null
+# -*- coding: utf-8 -*-
+"""Compilers of arithmetic expressions, such as ``amount * 2 > limit and
+not name = 'none'``, into Python source of row functions and into
+SQLAlchemy clauses. One expression can be evaluated natively by a database
+or as Python bytecode.
+
+Expressions are parsed by the `expressions` package. Variables are field
+names, ``null`` is the ``None`` value. Supported functions are listed in
+`expression_functions`.
+
+.. note::
+
+    Python and SQL differ in handling of ``None`` values: comparison of
+    ``None`` with a number raises `TypeError` in Python. Exclude the
+    ``None`` values first, for example ``not amount is null and amount >
+    0``.
+"""
+
+import functools
+
+from .errors import *
+
+try:
+    import expressions
+    from expressions import Compiler
+except ImportError:
+    from .common import MissingPackage
+    expressions = MissingPackage("expressions", "Expression filters",
+                                 "https://pypi.python.org/pypi/expressions")
+
+    class Compiler(object):
+        def __init__(self, context=None):
+            # Raises MissingPackageError
+            expressions.Compiler
+
+try:
+    from sqlalchemy import sql
+except ImportError:
+    from .common import MissingPackage
+    sql = MissingPackage("sqlalchemy", "SQL streams",
+                         "http://www.sqlalchemy.org/")
+
+__all__ = (
+    "PythonExpressionCompiler",
+    "PythonLambdaCompiler",
+    "SQLExpressionCompiler",
+    "expression_variables",
+    "expression_functions",
+    "row_function",
+    "lambda_from_predicate",
+    "sql_expression",
+)
+
+
+def _none_safe(function):
+    """Returns `function` that returns ``None`` for ``None``, as SQL
+    functions do."""
+    @functools.wraps(function)
+    def wrapper(value, *args):
+        return function(value, *args) if value is not None else None
+    return wrapper
+
+def _coalesce(*values):
+    for value in values:
+        if value is not None:
+            return value
+    return None
+
+# Function name -> Python function
+expression_functions = {
+    "abs": _none_safe(abs),
+    "round": _none_safe(round),
+    "lower": _none_safe(str.lower),
+    "upper": _none_safe(str.upper),
+    "length": _none_safe(len),
+    "coalesce": _coalesce,
+}
 
 # Translate bubbles operator to Python operator
 _python_operators = {
-    "=": "=="
+    "=": "==",
+    "^": "**",
 }
 
 
+def _variable_name(variable):
+    """Returns name of a variable, ``None`` for the ``null`` constant."""
+    name = str(variable)
+    return None if name.lower() == "null" else name
+
+
+def expression_variables(expression):
+    """Returns set of names of fields used in `expression`."""
+    names = expressions.inspect_variables(expression)
+    return set(name for name in names if name.lower() != "null")
+
+
 class PythonExpressionCompiler(Compiler):
+    def __init__(self, variables, constant=None):
+        """Creates a compiler of expressions into Python source.
+        `variables` is a dictionary of variable names and Python expressions
+        of their values. Functions are referred by names from `namespace`,
+        which has to be used to evaluate the compiled source. `constant` is
+        an optional function that returns the name for a value instead,
+        such as `RowFunctionCompiler.constant()`."""
+
+        super(PythonExpressionCompiler, self).__init__(variables)
+        self.namespace = {}
+        if constant is not None:
+            self.constant = constant
+
+    def constant(self, value):
+        """Returns name that refers to `value` in the `namespace`."""
+        name = "_c%d" % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
     def compile_literal(self, context, literal):
-        # TODO: support string literals (quote them properely)
-        if isinstance(literal, str):
-            raise NotImplementedError("String literals are not yet supported")
-        else:
-            return str(literal)
+        # repr() quotes and escapes strings
+        return repr(literal)
 
     def compile_variable(self, context, variable):
-        if variable in context:
-            return variable
-        else:
-            raise ExpressionError("Unknown variable %s" % variable)
+        name = _variable_name(variable)
+        if name is None:
+            return "None"
+        try:
+            return context[name]
+        except KeyError:
+            raise ExpressionError("Unknown variable '%s'" % (name, ))
 
-    def compile_operator(self, context, operator, op1, op2):
+    def compile_binary(self, context, operator, left, right):
         operator = _python_operators.get(operator, operator)
-        return "(%s%s%s)" % (op1, operator, op2)
+        return "(%s %s %s)" % (left, operator, right)
 
     def compile_unary(self, context, operator, operand):
         operator = _python_operators.get(operator, operator)
-        return "(%s%s)" % (operand, operator)
+        if operator == "not":
+            return "(not %s)" % (operand, )
+        return "(%s%s)" % (operator, operand)
 
     def compile_function(self, context, function, args):
-        # TODO: support functions
-        raise NotImplementedError("Functions are not yet implemented")
+        name = str(function).lower()
+        try:
+            func = expression_functions[name]
+        except KeyError:
+            raise ExpressionError("Unknown function '%s'" % (function, ))
+        return "%s(%s)" % (self.constant(func), ", ".join(args))
+
+
+class PythonLambdaCompiler(PythonExpressionCompiler):
+    def __init__(self, names):
+        """Creates a compiler of an expression into a function that takes
+        values of variables `names` as positional arguments."""
 
+        variables = dict((name, "_v%d" % i) for i, name in enumerate(names))
+        super(PythonLambdaCompiler, self).__init__(variables)
+        self.names = list(names)
 
-def PythonLambdaCompiler(PythonExpressionCompiler):
-    def finalize(self, context):
-        # TODO: sanitize field names in context
-        field_list = ", ".join(context)
-        lambda_str = "lambda %s: %s" % (context, expression)
-        return lambda_str
+    def finalize(self, context, obj):
+        args = ", ".join("_v%d" % i for i in range(len(self.names)))
+        source = "lambda %s: %s" % (args, obj)
+        return eval(compile(source, "<expression>", "eval"), self.namespace)
 
 
 def lambda_from_predicate(predicate, key):
-    compiler = PythonLambdaCompiler()
-    expression = compiler.compile(predicate, context=key)
-    return expression
+    """Returns a function of values of fields `key` (positional arguments)
+    that evaluates expression `predicate`. The function can be used with
+    `filter_by_predicate`."""
+    compiler = PythonLambdaCompiler(key)
+    return compiler.compile(predicate)
+
+
+@functools.lru_cache(maxsize=256)
+def _row_function(expression, names):
+    variables = dict((name, "row[%d]" % i) for i, name in enumerate(names))
+    compiler = PythonExpressionCompiler(variables)
+    source = "lambda row: %s" % compiler.compile(expression)
+    return eval(compile(source, "<expression>", "eval"), compiler.namespace)
+
+
+def row_function(expression, fields):
+    """Returns a function of a row with `fields` that evaluates
+    `expression`. Functions are cached by the expression and field
+    names."""
+    return _row_function(expression, tuple(fields.names()))
+
+
+class SQLExpressionCompiler(Compiler):
+    def __init__(self, columns):
+        """Creates a compiler of expressions into SQLAlchemy clauses.
+        `columns` is a column collection of a statement, variables are
+        column names. Division is a true division, as in Python. Raises
+        `ExpressionError` for operators and functions that have no SQL
+        equivalent."""
+        super(SQLExpressionCompiler, self).__init__(columns)
+
+    def compile_literal(self, context, literal):
+        return sql.literal(literal)
+
+    def compile_variable(self, context, variable):
+        name = _variable_name(variable)
+        if name is None:
+            return sql.null()
+        try:
+            return context[name]
+        except KeyError:
+            raise ExpressionError("Unknown variable '%s'" % (name, ))
+
+    def compile_binary(self, context, operator, left, right):
+        if operator == "and":
+            return sql.and_(left, right)
+        elif operator == "or":
+            return sql.or_(left, right)
+        elif operator == "=":
+            return left == right
+        elif operator == "!=":
+            return left != right
+        elif operator == "<":
+            return left < right
+        elif operator == "<=":
+            return left <= right
+        elif operator == ">":
+            return left > right
+        elif operator == ">=":
+            return left >= right
+        elif operator == "is":
+            return left.is_(right)
+        elif operator == "+":
+            return left + right
+        elif operator == "-":
+            return left - right
+        elif operator == "*":
+            return left * right
+        elif operator == "/":
+            # True division, as in Python
+            return sql.expression.cast(left, sql.sqltypes.Float) / right
+        elif operator == "%":
+            return left % right
+        else:
+            raise ExpressionError("Operator '%s' is not supported in SQL"
+                                  % (operator, ))
+
+    def compile_unary(self, context, operator, operand):
+        if operator == "not":
+            return sql.not_(operand)
+        elif operator == "-":
+            return -operand
+        elif operator == "+":
+            return operand
+        else:
+            raise ExpressionError("Operator '%s' is not supported in SQL"
+                                  % (operator, ))
+
+    def compile_function(self, context, function, args):
+        name = str(function).lower()
+        if name not in expression_functions:
+            raise ExpressionError("Unknown function '%s'" % (function, ))
+        return getattr(sql.func, name)(*args)
+
+
+def sql_expression(expression, columns):
+    """Returns SQLAlchemy clause of `expression` with variables from
+    `columns` – column collection of a statement."""
+    return SQLExpressionCompiler(columns).compile(expression)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Fusion of unary row operations.
+
+Row operations that only transform or filter one row at a time can provide a
+*row kernel* – a function that describes the operation to a
+:class:`RowFunctionCompiler`. Kernels of consecutive operations are compiled
+into one Python generator, which avoids a generator layer, a row copy and
+index lookups for each of the operations."""
+
+from .errors import *
+
+__all__ = (
+    "row_kernel",
+    "get_row_kernel",
+    "RowFunctionCompiler",
+    "fuse_kernels",
+    "compile_kernels",
+)
+
+
+def row_kernel(kernel):
+    """Decorator that marks a ``rows`` implementation of an operation as
+    fusable. `kernel` has signature ``kernel(compiler, *args, **kwargs)``
+    with the operation's parameters, describes the operation to the
+    `compiler` and returns fields of the result. Fields of the operand are
+    in `compiler.fields`."""
+
+    def decorator(fn):
+        fn._bubbles_row_kernel = kernel
+        return fn
+
+    return decorator
+
+
+def get_row_kernel(fn):
+    """Returns row kernel of function `fn` or ``None`` if the function is
+    not fusable."""
+    return getattr(fn, "_bubbles_row_kernel", None)
+
+
+class RowFunctionCompiler(object):
+    def __init__(self, fields):
+        """Creates a compiler of a row function for rows with `fields`.
+        `fields` are updated after each compiled kernel.
+
+        Values of the row are tracked as Python expressions. Kernels replace
+        the expressions (`assign()`), add new ones (`append()`), reorder
+        them (`project()`) or add
+        conditions a row has to satisfy (`require()`). The output row is
+        created only once, at the end of the function."""
+
+        self.fields = fields
+        self.source_fields = fields
+        self.values = ["row[%d]" % i for i in range(len(fields))]
+        self.lines = []
+        self.namespace = {}
+        self._counter = 0
+
+    def _name(self, prefix):
+        self._counter += 1
+        return "%s%d" % (prefix, self._counter)
+
+    def constant(self, value):
+        """Returns name of a variable that refers to `value` in the compiled
+        function."""
+        name = self._name("_c")
+        self.namespace[name] = value
+        return name
+
+    def value(self, index):
+        """Returns an expression for current value at `index`."""
+        return self.values[index]
+
+    def assign(self, index, expression):
+        """Evaluates `expression` and uses the result as the value at
+        `index`. Returns name of the local variable that holds the value."""
+        var = self._name("v")
+        self.lines.append("%s = %s" % (var, expression))
+        self.values[index] = var
+        return var
+
+    def append(self, expression):
+        """Appends a value computed by `expression` to the row. Returns
+        name of the local variable that holds the value."""
+        var = self._name("v")
+        self.lines.append("%s = %s" % (var, expression))
+        self.values.append(var)
+        return var
+
+    def statement(self, line):
+        """Appends a single line statement to the function body."""
+        self.lines.append(line)
+
+    def require(self, condition):
+        """Discards rows that do not satisfy `condition` expression."""
+        self.lines.append("if not (%s): continue" % condition)
+
+    def project(self, indexes):
+        """Keeps only values at `indexes`, in that order."""
+        self.values = [self.values[i] for i in indexes]
+
+    def ordering(self, ordering):
+        """Returns `ordering` of the input rows as an ordering of the
+        output rows. Fields are renamed, the ordering ends at the first
+        field that is not passed unchanged to the output."""
+
+        names = self.source_fields.names()
+        result = []
+        for field, order in ordering or ():
+            try:
+                value = "row[%d]" % names.index(field)
+                index = self.values.index(value)
+            except ValueError:
+                break
+            result.append((self.fields[index].name, order))
+
+        return result
+
+    def source(self):
+        """Returns source code of the compiled generator."""
+        body = ["def fused(iterator):",
+                "    for row in iterator:"]
+        body += ["        " + line for line in self.lines]
+        body.append("        yield [%s]" % ", ".join(self.values))
+
+        return "\n".join(body)
+
+    def compile(self):
+        """Returns a generator function that takes an iterator of rows."""
+        namespace = dict(self.namespace)
+        exec(compile(self.source(), "<fused rows>", "exec"), namespace)
+        return namespace["fused"]
+
+
+def fuse_kernels(fields, kernels):
+    """Describes list of `kernels` for rows with `fields` to a new
+    `RowFunctionCompiler` and returns the compiler. `kernels` is a list of
+    tuples ``(kernel, args, kwargs)``."""
+
+    compiler = RowFunctionCompiler(fields)
+
+    for kernel, args, kwargs in kernels:
+        fields = kernel(compiler, *args, **kwargs)
+        if len(fields) != len(compiler.values):
+            raise InternalError("Row kernel %s returned %d fields, but "
+                                "produces %d values"
+                                % (kernel.__name__, len(fields),
+                                   len(compiler.values)))
+        compiler.fields = fields
+
+    return compiler
+
+
+def compile_kernels(fields, kernels):
+    """Compiles list of `kernels` for rows with `fields`. Returns a tuple
+    ``(function, fields)`` where `function` is a generator function that
+    takes an iterator of rows and `fields` are fields of the generated rows.
+    See `fuse_kernels()`."""
+
+    compiler = fuse_kernels(fields, kernels)
+    return (compiler.compile(), compiler.fields)
@@ -7,6 +7,7 @@ import inspect
 import warnings
 from .common import get_logger, IgnoringDictionary
 from .errors import *
+from .aggregates import aggregate_kernel
 
 # from collections import OrderedDict
 
@@ -20,6 +21,9 @@ __all__ = [
     "distill_aggregate_measures",
     "prepare_key",
     "prepare_aggregation_list",
+    "prepare_window_functions",
+    "RANKING_FUNCTIONS",
+    "OFFSET_FUNCTIONS",
     "prepare_order_list",
     "DEFAULT_ANALYTICAL_TYPES"
 ]
@@ -380,7 +384,9 @@ class FieldList(object):
         the :func:`prepare_aggregation_list` function.
 
         Resulting fields are cloned from the original fields and will have
-        analytical type set to ``measure``.
+        analytical type set to ``measure``. Storage type is changed if the
+        aggregate kernel of the function specifies it, for example
+        ``count``.
 
         Example:
 
@@ -406,6 +412,15 @@ class FieldList(object):
             field = self.field(field)
             field = field.clone(name="%s_%s" % (str(field), aggregate),
                                 analytical_type="measure")
+
+            try:
+                storage_type = aggregate_kernel(aggregate).storage_type
+            except ArgumentError:
+                storage_type = None
+
+            if storage_type:
+                field = field.clone(storage_type=storage_type,
+                                    concrete_storage_type=None)
             agg_fields.append(field)
 
         if include_count:
@@ -414,6 +429,28 @@ class FieldList(object):
 
         return agg_fields
 
+    def window_fields(self, functions):
+        """Returns a `FieldList` containing fields of window `functions` –
+        list of tuples from :func:`prepare_window_functions`. Ranking
+        functions are integers, ``lag`` and ``lead`` are clones of the
+        original fields, aggregations are as in :meth:`aggregated_fields`.
+        """
+
+        fields = FieldList()
+
+        for field, function, argument, name in functions:
+            if function in RANKING_FUNCTIONS:
+                fields.append(Field(name, storage_type="integer",
+                                    analytical_type="ordinal"))
+            elif function in OFFSET_FUNCTIONS:
+                fields.append(self.field(field).clone(name=name))
+            else:
+                agg = self.aggregated_fields([(field, function)],
+                                             include_count=False)
+                fields += agg
+
+        return fields
+
     def field(self, ref):
         """Return a field with name `ref` if `ref` is a string, or if it is an
         integer, returns a field at that index."""
@@ -576,6 +613,32 @@ class FieldFilter(object):
         """
         return RowFieldFilter(self.field_mask(fields))
 
+    def filter_ordering(self, ordering):
+        """Returns `ordering` – list of tuples (`field`, `order`) – of rows
+        filtered by the receiver. Fields are renamed, the ordering ends at
+        the first field that is not kept."""
+
+        result = []
+        for field, order in ordering:
+            if (self.keep and field not in self.keep) or field in self.drop:
+                break
+            result.append((self.rename.get(field, field), order))
+
+        return result
+
+    def field_indexes(self, fields):
+        """Returns list of indexes of `fields` that are selected, in the order
+        of fields returned by `filter()`."""
+
+        mask = self.field_mask(fields)
+        indexes = [i for i, flag in enumerate(mask) if flag]
+
+        if len(self.keep) > 0:
+            names = [field.name for field in fields]
+            indexes.sort(key=lambda i: self.keep.index(names[i]))
+
+        return indexes
+
     def field_mask(self, fields):
         """Returns a list where ``True`` value is set for field that is selected
         and ``False`` for field that has to be ignored. Selectors of fields can
@@ -676,6 +739,50 @@ def prepare_aggregation_list(measures):
 
     return prepare_tuple_list(measures, "sum")
 
+# Window functions that are not aggregations
+RANKING_FUNCTIONS = ("row_number", "rank", "dense_rank")
+OFFSET_FUNCTIONS = ("lag", "lead")
+
+def prepare_window_functions(functions):
+    """Coalesces list of window functions. Accepts list of: names of ranking
+    functions (``row_number``, ``rank``, ``dense_rank``), tuples `(field,
+    function)` or tuples `(field, function, argument)` where `argument` is
+    offset of ``lag`` and ``lead`` (default is 1). Other functions are
+    aggregations. Returns list of tuples `(field, function, argument,
+    name)` where `name` is the name of the output field – the function for
+    ranking functions, `field_function` otherwise."""
+
+    if not isinstance(functions, (list, tuple)):
+        functions = [functions]
+
+    result = []
+    for spec in functions:
+        if isinstance(spec, str):
+            spec = (None, spec)
+
+        field, function = spec[0], spec[1]
+        argument = spec[2] if len(spec) > 2 else None
+
+        if function in RANKING_FUNCTIONS:
+            field = None
+            name = function
+        else:
+            if field is None:
+                raise ArgumentError("Window function '%s' requires a field"
+                                    % (function, ))
+            field = str(field)
+            name = "%s_%s" % (field, function)
+
+        if function in OFFSET_FUNCTIONS:
+            argument = 1 if argument is None else argument
+            if argument < 1:
+                raise ArgumentError("Offset of '%s' should be at least 1"
+                                    % (function, ))
+
+        result.append( (field, function, argument, name) )
+
+    return result
+
 def prepare_order_list(fields):
     """Coalesces list of fields for ordering. Accepts: a string, list of
     strings, list of tuples `(field, order)`. Default order is ``asc``."""
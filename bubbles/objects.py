@@ -8,17 +8,35 @@ from .errors import *
 from .extensions import Extensible, extensions
 from .metadata import *
 from .dev import required, experimental
+from .buffers import RowBuffer
+import itertools
 
 __all__ = [
         "DataObject",
         "IterableDataSource",
         "RowListDataObject",
+        "RowBufferDataObject",
         "IterableRecordsDataSource",
+        "IterableBatchesDataSource",
 
         "shared_representations",
         "data_object",
+        "iter_batches",
+        "estimated_size",
+        "is_sorted_by",
+        "prepare_ordering",
+
+        "DEFAULT_BATCH_SIZE",
+        "DEFAULT_SIZE_ESTIMATE",
         ]
 
+"""Default number of rows in a batch of the `batches` representation."""
+DEFAULT_BATCH_SIZE = 1024
+
+"""Number of rows assumed by operation cost estimators for objects that do
+not know their size."""
+DEFAULT_SIZE_ESTIMATE = 10000
+
 def data_object(type_, *args, **kwargs):
     """Returns a data object of specified `type_`. Arguments are passed to
     respective data object factory.
@@ -37,6 +55,61 @@ def data_object(type_, *args, **kwargs):
     return extensions.object(type_, *args, **kwargs)
 
 
+def estimated_size(obj):
+    """Returns number of rows of `obj` from `size_hint()` or
+    `DEFAULT_SIZE_ESTIMATE` if the size is not known."""
+    size = obj.size_hint() if hasattr(obj, "size_hint") else None
+    return DEFAULT_SIZE_ESTIMATE if size is None else size
+
+
+def prepare_ordering(orderby):
+    """Returns ordering of rows sorted by `orderby` (see
+    `prepare_order_list()`) as a list of tuples (`field`, `order`) where
+    `order` is ``asc`` or ``desc``."""
+
+    ordering = []
+    for field, order in prepare_order_list(orderby):
+        order = order.lower()
+        if order.startswith("asc"):
+            order = "asc"
+        elif order.startswith("desc"):
+            order = "desc"
+        else:
+            raise ArgumentError("Unknown order %s for column %s"
+                                % (order, field))
+        ordering.append((str(field), order))
+
+    return ordering
+
+
+def is_sorted_by(obj, key):
+    """Returns `True` if rows of `obj` with equal values of `key` fields are
+    adjacent – that is, if the `ordering` of `obj` starts with the `key`
+    fields, in any order and direction."""
+
+    key = [str(field) for field in key]
+    ordering = getattr(obj, "ordering", None) or ()
+
+    if not key or len(ordering) < len(key):
+        return False
+
+    return set(key) == set(field for field, order in ordering[:len(key)])
+
+
+def iter_batches(iterable, size=None):
+    """Returns an iterator of lists of at most `size` rows from `iterable`.
+    Default size is `DEFAULT_BATCH_SIZE`."""
+
+    size = size or DEFAULT_BATCH_SIZE
+    iterator = iter(iterable)
+
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 def iterator_object(iterator, fields):
     """Returns a data object wrapping an `iterator` with rows of `fields`."""
     return IterableDataSource(iterator, fields)
@@ -46,6 +119,12 @@ class DataObject(Extensible):
     __extension_type__ = "object"
     __extension_suffix__ = "Object"
 
+    # List of tuples (`field`, `order`) the rows are known to be sorted by,
+    # `order` is ``asc`` or ``desc``. Set by the `sort` operation and kept
+    # by operations that preserve order of rows, such as filters. Empty if
+    # the order is not known.
+    ordering = ()
+
     def representations(self):
         """Returns list of representation names of this data object. Default
         implementation raises an exception, as subclasses are required to
@@ -107,13 +186,21 @@ class DataObject(Extensible):
         raise NotImplementedError("Data objects are required to implement "
                                   "is_consumable() method")
 
-    def retained(self, count=1):
+    def is_thread_bound(self):
+        """Returns `True` if the object can be used only in the thread where
+        it was created, for example a table in an in-memory database with a
+        connection per thread. The execution engine evaluates steps with
+        such operands in the thread that runs the graph. Default
+        implementation returns `False`."""
+        return False
+
+    def retained(self, count=1, budget=None):
         """Returns object's replacement which can be consumed `count` times.
         Implementation of object retention depends on the backend.
 
-        For example default iterable data object consumes the rows into a list
-        and provides data object which wraps the list and deletes the list
-        after `count` number of uses.
+        For example default iterable data object consumes the rows into a
+        :class:`RowBufferDataObject` which keeps up to `budget` bytes of
+        serialized rows in memory and spills the rest into a temporary file.
 
         .. note::
 
@@ -141,9 +228,35 @@ class DataObject(Extensible):
             #
             # return RowListDataSource(self.rows(), self.fields)
 
+    def fingerprint(self):
+        """Returns a value that changes whenever content of the object
+        changes, for example modification time of a source file. The value
+        should consist of basic Python types (strings, numbers, tuples). It is
+        used by the execution engine to reuse cached results of unchanged
+        parts of a graph.
+
+        Default implementation returns ``None`` – content of the object can
+        not be fingerprinted and results depending on the object are never
+        reused."""
+        return None
+
+    def size_hint(self):
+        """Returns number of rows of the object if it is known without
+        reading the rows or querying a database, otherwise ``None``. Used by
+        operation cost estimators."""
+        return None
+
     def __iter__(self):
         return self.rows()
 
+    def batches(self, size=None):
+        """Returns an iterator of batches – lists of at most `size` rows.
+        Objects that have the ``rows`` representation can always be read as
+        batches, the operation dispatch adds the ``batches`` representation
+        to such objects. Default implementation groups rows from `rows()`,
+        subclasses might read the batches directly from the source."""
+        return iter_batches(self.rows(), size)
+
     def records(self):
         """Returns an iterator of records - dictionary-like objects that can
         be acessed by field names. Default implementation returns
@@ -240,9 +353,10 @@ class IterableDataSource(DataObject):
         self.iterable = iterable
 
     def representations(self):
-        """Returns the only representation of iterable object, which is
-        `rows`"""
-        return ["rows", "records"]
+        """Returns representations of iterable object: `rows`, `batches` and
+        `records`. Batches follow rows, operations are dispatched to batch
+        implementations only for objects converted with `as_batches`."""
+        return ["rows", "batches", "records"]
 
     def rows(self):
         return iter(self.iterable)
@@ -253,15 +367,16 @@ class IterableDataSource(DataObject):
     def is_consumable(self):
         return True
 
-    def retained(self, retain_count=1):
+    def retained(self, retain_count=1, budget=None):
         """Returns retained replacement of the receiver. Default
-        implementation consumes the iterator into a list and returns a data
-        object wrapping the list, which might leave big memory footprint on
-        larger datasets. In this case it is recommended to explicitly cache
-        the consumable object using other means.
+        implementation consumes the iterator into a
+        :class:`RowBufferDataObject`. Up to `budget` bytes of serialized rows
+        are kept in memory, the rest is spilled into a temporary file.
         """
 
-        return RowListDataObject(list(self.iterable), self.fields)
+        obj = RowBufferDataObject(self.rows(), self.fields, budget=budget)
+        obj.ordering = self.ordering
+        return obj
 
     def filter(self, keep=None, drop=None, rename=None):
         """Returns another iterable data source with filtered fields"""
@@ -304,6 +419,59 @@ class IterableRecordsDataSource(IterableDataSource):
         return True
 
 
+class IterableBatchesDataSource(IterableDataSource):
+    """Wrapped Python iterator that serves as data source. The iterator should
+    yield "batches" – lists of rows according to `fields`. Rows of the
+    batches are available as the `rows` representation as well."""
+
+    __identifier__ = "iterable_batches"
+
+    _bubbles_info = {
+        "attributes": [
+            {"name":"iterable", "description": "Python iterable of batches"},
+            {"name":"fields", "description":"fields of the rows"}
+        ]
+    }
+
+    def representations(self):
+        """Returns representations of batches object: `batches`, `rows` and
+        `records`."""
+        return ["batches", "rows", "records"]
+
+    def rows(self):
+        return itertools.chain.from_iterable(self.iterable)
+
+    def records(self):
+        names = [str(field) for field in self.fields]
+        for row in self.rows():
+            yield dict(zip(names, row))
+
+    def batches(self, size=None):
+        """Returns the wrapped batches. If `size` is specified, the rows are
+        grouped into batches of that size instead."""
+        if size:
+            return iter_batches(self.rows(), size)
+        else:
+            return iter(self.iterable)
+
+    def retained(self, retain_count=1, budget=None):
+        obj = RowBufferDataObject(self.rows(), self.fields, budget=budget)
+        obj.ordering = self.ordering
+        return obj
+
+    def filter(self, keep=None, drop=None, rename=None):
+        """Returns another batches data source with filtered fields"""
+
+        ffilter = FieldFilter(keep=keep, drop=drop, rename=rename)
+        fields = ffilter.filter(self.fields)
+        indexes = ffilter.field_indexes(self.fields)
+
+        batches = ([[row[i] for i in indexes] for row in batch]
+                   for batch in self.iterable)
+
+        return IterableBatchesDataSource(batches, fields)
+
+
 class RowListDataObject(DataObject):
     """Wrapped Python list that serves as data source or data target. The list
     content are "rows" – lists of values corresponding to `fields`.
@@ -346,6 +514,9 @@ class RowListDataObject(DataObject):
     def is_consumable(self):
         return False
 
+    def size_hint(self):
+        return len(self.data)
+
     def append(self, row):
         self.data.append(row)
 
@@ -353,6 +524,67 @@ class RowListDataObject(DataObject):
         self.data = []
 
 
+class RowBufferDataObject(DataObject):
+    """Rows stored in a :class:`RowBuffer` – serialized chunks of rows kept
+    in memory up to a byte budget and spilled into a temporary file
+    afterwards. The object can be read any number of times. Used as the
+    default retention of consumable row iterators."""
+
+    __identifier__ = "row_buffer"
+
+    _bubbles_info = {
+        "attributes": [
+            {"name":"iterable", "description": "Python iterable of rows"},
+            {"name":"fields", "description":"fields of the rows"},
+            {
+                "name":"budget",
+                "description":"number of bytes of rows kept in memory"
+            }
+        ]
+    }
+
+    def __init__(self, iterable=None, fields=None, budget=None):
+        """Creates a buffered data object and consumes rows from `iterable`
+        into it, if provided. `budget` is a number of bytes of serialized rows
+        that are kept in memory."""
+
+        self.fields = fields
+        self.buffer = RowBuffer(budget=budget)
+
+        if iterable is not None:
+            self.buffer.extend(iterable)
+            self.buffer.flush()
+
+    def representations(self):
+        return ["rows", "records"]
+
+    def rows(self):
+        return self.buffer.rows()
+
+    def records(self):
+        names = [str(field) for field in self.fields]
+        for row in self.rows():
+            yield dict(zip(names, row))
+
+    def is_consumable(self):
+        return False
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def size_hint(self):
+        return len(self.buffer)
+
+    def append(self, row):
+        self.buffer.append(row)
+
+    def truncate(self):
+        self.buffer.release()
+
+    def finalize(self):
+        self.buffer.release()
+
+
 class RowToRecordConverter(object):
     def __init__(self, fields, ignore_empty=False):
         """Creates a converter from rows (list) to a record (dictionary). If
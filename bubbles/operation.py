@@ -16,9 +16,14 @@ __all__ = (
             "Operation",
             "operation",
             "common_representations",
-            "get_representations"
+            "get_representations",
+            "INFINITE_COST",
         )
 
+"""Cost of a function that can not be used for given arguments, for example
+of an SQL composition of objects from different databases."""
+INFINITE_COST = float("inf")
+
 Operand = namedtuple("Operand", ["rep", "islist", "isany"])
 
 def rep_to_operand(rep):
@@ -147,6 +152,19 @@ def common_representations(*objects):
 
     return common
 
+def _with_conversions(reps):
+    """Returns list of representations `reps` extended with representations
+    that every object with one of `reps` provides as well: objects with
+    ``rows`` can be read as ``batches``. The implicit representations are
+    added at the end, therefore they are the least preferred."""
+
+    if "rows" in reps and "batches" not in reps:
+        reps = list(reps) + ["batches"]
+    if "rows[]" in reps and "batches[]" not in reps:
+        reps = list(reps) + ["batches[]"]
+
+    return reps
+
 def get_representations(*operands):
     """For every operand get list of it's representations. Returns list of
     lists."""
@@ -188,6 +206,11 @@ class Operation(object):
         self.parameters = parameters
 
         self.registry = OrderedDict()
+        # Cost estimators of signatures, see `register()`
+        self.costs = {}
+        # Incremented on every change of the registry. Used to invalidate
+        # cached resolution orders.
+        self.version = 0
 
         self.experimental = False
 
@@ -208,7 +231,9 @@ class Operation(object):
     def resolution_order(self, representations):
         """Returns ordered list of signatures for `operands`. The generic
         signatures (those containing at least one ``*``/`any` type are placed
-        at the end of the list.
+        at the end of the list. Signatures that match only an implicit
+        representation – ``batches`` of an object with ``rows`` – are placed
+        after the directly matching ones.
 
         Note: The order of the generics is undefined."""
 
@@ -229,6 +254,13 @@ class Operation(object):
             matches += [sig for sig in signatures if sig.matches(*repsig)]
             gen_matches += [sig for sig in generics if sig.matches(*repsig)]
 
+        # Signatures matching only through implicit conversions, such as
+        # rows read as batches, follow the directly matching ones
+        converted = [_with_conversions(reps) for reps in representations]
+        for repsig in itertools.product(*converted):
+            matches += [sig for sig in signatures if sig.matches(*repsig)
+                        and sig not in matches]
+
         matches += gen_matches
 
         if not matches:
@@ -238,7 +270,46 @@ class Operation(object):
         return matches
 
 
-    def register(self, *signature, name=None):
+    def order_by_cost(self, signatures, *args, **kwargs):
+        """Returns list of `signatures` ordered by cost estimated for
+        operation arguments `args` and `kwargs` (including the context).
+        Signatures without an estimator or with unknown cost keep their
+        position, signatures with equal cost keep their order. Signatures
+        with infinite cost – functions that can not be used for the
+        arguments – are moved to the end."""
+
+        costs = OrderedDict()
+        for sig in signatures:
+            estimator = self.costs.get(sig)
+            if estimator is not None:
+                cost = estimator(*args, **kwargs)
+                if cost is not None:
+                    costs[sig] = cost
+
+        if not costs:
+            return list(signatures)
+
+        ranked = iter(sorted(costs, key=costs.__getitem__))
+        ordered = [next(ranked) if sig in costs else sig
+                   for sig in signatures]
+
+        unusable = [sig for sig in ordered if costs.get(sig) == INFINITE_COST]
+        if unusable:
+            ordered = [sig for sig in ordered if sig not in unusable]
+            ordered += unusable
+
+        return ordered
+
+    def register(self, *signature, name=None, cost=None):
+        """Registers a function for `signature`. Used as a decorator.
+
+        `cost` is an optional estimator of cost of the function call: it is
+        called with the same arguments as the function and returns a number
+        – estimated cost in units of rows processed in Python – or ``None``
+        if the cost is unknown. Estimators should be cheap: they should use
+        `DataObject.size_hint()` and avoid reading the data. The context
+        tries the cheapest of matching signatures first."""
+
         sig = None
 
         def register_function(func):
@@ -253,6 +324,11 @@ class Operation(object):
                                     % (self.opcount + 1, func.__name__))
 
             self.registry[sig] = func
+            if cost is not None:
+                self.costs[sig] = cost
+            else:
+                self.costs.pop(sig, None)
+            self.version += 1
             func.__name__ = self.name
             return func
 
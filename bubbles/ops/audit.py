@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from ..metadata import *
+from ..objects import *
 from ..operation import operation
 from ..prototypes import *
 from ..datautil import guess_type
+from ..sketches import HyperLogLog
 
 class BasicAuditProbe(object):
     def __init__(self, key=None, distinct_threshold=10):
@@ -14,6 +16,8 @@ class BasicAuditProbe(object):
 
         self.distinct_values = set()
         self.distinct_overflow = False
+        # Estimates the distinct count after the overflow
+        self.distinct_sketch = HyperLogLog()
         self.storage_types = set()
 
         self.null_count = 0
@@ -57,6 +61,11 @@ class BasicAuditProbe(object):
 
     def _probe_distinct(self, value):
         """"""
+        try:
+            self.distinct_sketch.add(value)
+        except TypeError:
+            pass
+
         if self.distinct_overflow:
             return
 
@@ -107,16 +116,20 @@ class BasicAuditProbe(object):
         }
 
         d["distinct_overflow"] = self.distinct_overflow
-        d["distinct_count"] = len(self.distinct_values)
         if self.distinct_overflow:
+            d["distinct_count"] = self.distinct_sketch.count()
             d["distinct_values"] = []
         else:
+            d["distinct_count"] = len(self.distinct_values)
             d["distinct_values"] = list(self.distinct_values)
 
         return d
 
 @basic_audit.register("rows")
 def _(ctx, obj, distinct_threshold=100):
+    """Returns statistics of every field. Distinct values are kept up to
+    `distinct_threshold`, over the threshold the distinct count is
+    estimated with a `HyperLogLog`."""
 
     fields = obj.fields
     out_fields= FieldList(
@@ -145,15 +158,39 @@ def _(ctx, obj, distinct_threshold=100):
     result = []
     for stat in stats:
         stat.finalize()
-        if stat.distinct_overflow:
-            dist_count = None
-        else:
-            dist_count = len(stat.distinct_values)
-
         result.append(stat.to_dict())
 
     return IterableRecordsDataSource(result, out_fields)
 
+@distinct_count.register("rows")
+def _(ctx, obj, fields=None, approximate=False):
+    """Returns one row with count of distinct values of every field in
+    `fields` (all fields by default). If `approximate` is ``True`` the
+    counts are estimated with a `HyperLogLog` in bounded memory instead of
+    keeping sets of the values. ``None`` is not counted, as in SQL."""
+
+    if fields:
+        fields = prepare_key(fields)
+    else:
+        fields = obj.fields.names()
+
+    indexes = obj.fields.indexes(fields)
+    if approximate:
+        counters = [HyperLogLog() for index in indexes]
+    else:
+        counters = [set() for index in indexes]
+
+    for row in obj.rows():
+        for counter, index in zip(counters, indexes):
+            value = row[index]
+            if value is not None:
+                counter.add(value)
+
+    out_fields = FieldList(*[Field(name, "integer") for name in fields])
+    row = [len(counter) for counter in counters]
+
+    return IterableDataSource([row], out_fields)
+
 @infer_types.register("rows")
 def _(ctx, obj, date_format=None):
     rownum = 0
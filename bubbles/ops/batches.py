@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Operations on batches of rows.
+
+Batch implementations process lists of rows at once with list comprehensions
+instead of calling a function for every row. They are used when the operand
+is read as batches, for example an iterable, a CSV source or a SQL query
+result. Objects with rows are converted to batches automatically."""
+
+import functools
+import operator
+from ..metadata import *
+from ..errors import *
+from ..objects import *
+from ..prototypes import *
+
+__all__ = ()
+
+def unary_batches(func):
+    """Wraps a function that provides an operation returning an iterator of
+    batches. Assumes return fields are the same fields as first argument
+    object. Empty batches are not passed on, ordering of the object is
+    kept."""
+    @functools.wraps(func)
+    def decorator(ctx, obj, *args, **kwargs):
+        result = func(ctx, obj, *args, **kwargs)
+        batches = (batch for batch in result if batch)
+        result = IterableBatchesDataSource(batches, obj.fields.clone())
+        result.ordering = obj.ordering
+        return result
+
+    return decorator
+
+#############################################################################
+# Conversions
+
+@as_batches.register("batches")
+def _(ctx, obj, size=None):
+    """Returns an object with batches of `size` rows."""
+    return IterableBatchesDataSource(obj.batches(size), obj.fields)
+
+
+@fetch_all.register("batches")
+def _(ctx, obj):
+    data = []
+    for batch in obj.batches():
+        data += batch
+
+    return RowListDataObject(data, fields=obj.fields)
+
+
+#############################################################################
+# Metadata Operations
+
+def _row_getter(indexes):
+    """Returns a function that returns a tuple of values at `indexes`."""
+    if len(indexes) == 1:
+        index = indexes[0]
+        return lambda row: (row[index], )
+    elif indexes:
+        return operator.itemgetter(*indexes)
+    else:
+        return lambda row: ()
+
+@field_filter.register("batches")
+def _(ctx, obj, keep=None, drop=None, rename=None, filter=None):
+    if filter:
+        if keep or drop or rename:
+            raise OperationError("Either filter or keep, drop, rename should "
+                                 "be used")
+        field_filter = filter
+    else:
+        field_filter = FieldFilter(keep=keep, drop=drop, rename=rename)
+
+    getter = _row_getter(field_filter.field_indexes(obj.fields))
+    batches = (list(map(getter, batch)) for batch in obj.batches())
+
+    result = IterableBatchesDataSource(batches,
+                                       field_filter.filter(obj.fields))
+    result.ordering = field_filter.filter_ordering(obj.ordering)
+    return result
+
+
+#############################################################################
+# Row Filters
+
+@filter_by_value.register("batches")
+@unary_batches
+def _(ctx, obj, key, value, discard=False):
+    index = obj.fields.index(str(key))
+
+    for batch in obj.batches():
+        if discard:
+            yield [row for row in batch if row[index] != value]
+        else:
+            yield [row for row in batch if row[index] == value]
+
+@filter_by_set.register("batches")
+@unary_batches
+def _(ctx, obj, field, values, discard=False):
+    index = obj.fields.index(field)
+    values = set(values)
+
+    for batch in obj.batches():
+        if discard:
+            yield [row for row in batch if row[index] not in values]
+        else:
+            yield [row for row in batch if row[index] in values]
+
+@filter_by_range.register("batches")
+@unary_batches
+def _(ctx, obj, field, low, high, discard=False):
+    index = obj.fields.index(field)
+
+    if high is None and low is not None:
+        predicate = lambda value: low <= value
+    elif low is None and high is not None:
+        predicate = lambda value: value <= high
+    else:
+        predicate = lambda value: low <= value <= high
+
+    for batch in obj.batches():
+        yield [row for row in batch if predicate(row[index]) != discard]
+
+@filter_not_empty.register("batches")
+@unary_batches
+def _(ctx, obj, field):
+    index = obj.fields.index(field)
+
+    for batch in obj.batches():
+        yield [row for row in batch if row[index] is not None]
+
+@filter_empty.register("batches")
+@unary_batches
+def _(ctx, obj, field):
+    index = obj.fields.index(field)
+
+    for batch in obj.batches():
+        yield [row for row in batch if row[index] is None or row[index] == ""]
+
+
+#############################################################################
+# Field Operations
+
+@append_constant_fields.register("batches")
+def _(ctx, obj, fields, value):
+    if not isinstance(value, (list, tuple)):
+        constants = [value]
+    else:
+        constants = list(value)
+
+    batches = ([list(row) + constants for row in batch]
+               for batch in obj.batches())
+
+    result = IterableBatchesDataSource(batches, obj.fields + fields)
+    result.ordering = obj.ordering
+    return result
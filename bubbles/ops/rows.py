@@ -2,9 +2,11 @@
 """Iterator composing operations."""
 import itertools
 import functools
+import heapq
 import operator
+import random
 import sys
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict, deque
 from ..metadata import *
 from ..common import get_logger
 from ..errors import *
@@ -13,6 +15,10 @@ from ..objects import *
 from ..dev import experimental
 from ..prototypes import *
 from ..datautil import to_bool
+from ..fusion import row_kernel
+from ..buffers import sorted_rows, hash_groups, hash_join
+from ..aggregates import compile_aggregates, aggregate_kernel
+from ..sketches import Reservoir, reservoir_sample
 
 from datetime import datetime
 from time import strptime
@@ -34,6 +40,21 @@ def unary_iterator(func):
 
     return decorator
 
+def unary_filter(func):
+    """Wraps a function that provides an operation returning an iterator of
+    some of the rows of the first argument object in their original order.
+    Assumes return fields are the same fields as the object, ordering of the
+    object is kept."""
+    iterator_func = unary_iterator(func)
+
+    @functools.wraps(func)
+    def decorator(ctx, obj, *args, **kwargs):
+        result = iterator_func(ctx, obj, *args, **kwargs)
+        result.ordering = obj.ordering
+        return result
+
+    return decorator
+
 #############################################################################
 # Metadata Operations
 
@@ -50,7 +71,35 @@ _default_type_converters = {
     "array": ValueError
 }
 
+def _retype_converters(fields, typemap):
+    """Returns tuple (`converters`, `fields`) with list of value converters
+    (``None`` if value is kept) and retyped `fields`."""
+    new_fields = FieldList()
+    converters = []
+    for field in fields:
+        new_type = typemap.get(field.name)
+        if new_type and new_type != field.storage_type:
+            conv = _default_type_converters[new_type]
+        else:
+            conv = None
+        converters.append(conv)
+
+        field = field.clone(storage_type=new_type or field.storage_type)
+        new_fields.append(field)
+
+    return (converters, new_fields)
+
+def _retype_kernel(compiler, typemap):
+    converters, fields = _retype_converters(compiler.fields, typemap)
+    for index, conv in enumerate(converters):
+        if conv:
+            expression = "%s(%s)" % (compiler.constant(conv),
+                                     compiler.value(index))
+            compiler.assign(index, expression)
+    return fields
+
 @retype.register("rows")
+@row_kernel(_retype_kernel)
 def _(ctx, obj, typemap):
     def converter(converters, iterator):
         for row in iterator:
@@ -62,49 +111,61 @@ def _(ctx, obj, typemap):
                     result.append(value)
             yield result
 
-    fields = FieldList()
-    converters = []
-    for field in obj.fields:
-        new_type = typemap.get(field.name)
-        if new_type and new_type != field.storage_type:
-            conv = _default_type_converters[new_type]
-        else:
-            conv = None
-        converters.append(conv)
-
-        field = field.clone(storage_type=new_type or field.storage_type)
-        fields.append(field)
+    converters, fields = _retype_converters(obj.fields, typemap)
 
     return IterableDataSource(converter(converters, obj), fields)
 
-@field_filter.register("rows")
-def _(ctx, iterator, keep=None, drop=None, rename=None, filter=None):
-    """Filters fields in `iterator` according to the `field_filter`.
-    `iterator` should be a rows iterator and `fields` is list of iterator's
-    fields."""
+def _field_filter(keep=None, drop=None, rename=None, filter=None):
+    """Returns a `FieldFilter` from `field_filter` operation arguments."""
     if filter:
         if keep or drop or rename:
             raise OperationError("Either filter or keep, drop, rename should "
                                  "be used")
-        else:
-            field_filter = filter
+        return filter
     else:
-        field_filter = FieldFilter(keep=keep, drop=drop, rename=rename)
+        return FieldFilter(keep=keep, drop=drop, rename=rename)
 
-    row_filter = field_filter.row_filter(iterator.fields)
+def _field_filter_kernel(compiler, keep=None, drop=None, rename=None,
+                         filter=None):
+    fields = compiler.fields
+    field_filter = _field_filter(keep, drop, rename, filter)
+    compiler.project(field_filter.field_indexes(fields))
+    return field_filter.filter(fields)
+
+@field_filter.register("rows")
+@row_kernel(_field_filter_kernel)
+def _(ctx, iterator, keep=None, drop=None, rename=None, filter=None):
+    """Filters fields in `iterator` according to the `field_filter`.
+    `iterator` should be a rows iterator and `fields` is list of iterator's
+    fields."""
+    field_filter = _field_filter(keep, drop, rename, filter)
+
+    indexes = field_filter.field_indexes(iterator.fields)
+    row_filter = lambda row: tuple(row[i] for i in indexes)
 
     new_iterator = map(row_filter, iterator)
     new_fields = field_filter.filter(iterator.fields)
 
-    return IterableDataSource(new_iterator, new_fields)
+    result = IterableDataSource(new_iterator, new_fields)
+    result.ordering = field_filter.filter_ordering(iterator.ordering)
+    return result
 
 
 #############################################################################
 # Row Operations
 
 
+def _filter_by_value_kernel(compiler, key, value, discard=False):
+    fields = compiler.fields
+    index = fields.index(str(key))
+    op = "!=" if discard else "=="
+    compiler.require("%s %s %s" % (compiler.value(index), op,
+                                   compiler.constant(value)))
+    return fields
+
 @filter_by_value.register("rows")
-@unary_iterator
+@row_kernel(_filter_by_value_kernel)
+@unary_filter
 def _(ctx, iterator, key, value, discard=False):
     """Select rows where value of `field` belongs to the set of `values`. If
     `discard` is ``True`` then the matching rows are discarded instead
@@ -120,8 +181,17 @@ def _(ctx, iterator, key, value, discard=False):
 
     return filter(predicate, iterator)
 
+def _filter_by_set_kernel(compiler, field, values, discard=False):
+    fields = compiler.fields
+    index = fields.index(field)
+    op = "not in" if discard else "in"
+    compiler.require("%s %s %s" % (compiler.value(index), op,
+                                   compiler.constant(set(values))))
+    return fields
+
 @filter_by_set.register("rows")
-@unary_iterator
+@row_kernel(_filter_by_set_kernel)
+@unary_filter
 def _(ctx, iterator, field, values, discard=False):
     """Select rows where value of `field` belongs to the set of `values`. If
     `discard` is ``True`` then the matching rows are discarded instead
@@ -139,8 +209,28 @@ def _(ctx, iterator, field, values, discard=False):
 
     return filter(predicate, iterator)
 
+def _filter_by_range_kernel(compiler, field, low, high,
+                            discard=False):
+    fields = compiler.fields
+    index = fields.index(field)
+    value = compiler.value(index)
+
+    if high is None and low is not None:
+        condition = "%s <= %s" % (compiler.constant(low), value)
+    elif low is None and high is not None:
+        condition = "%s <= %s" % (value, compiler.constant(high))
+    else:
+        condition = "%s <= %s <= %s" % (compiler.constant(low), value,
+                                         compiler.constant(high))
+    if discard:
+        condition = "not (%s)" % condition
+
+    compiler.require(condition)
+    return fields
+
 @filter_by_range.register("rows")
-@unary_iterator
+@row_kernel(_filter_by_range_kernel)
+@unary_filter
 def _(ctx, iterator, field, low, high, discard=False):
     """Select rows where value `low` <= `field` <= `high`. If
     `discard` is ``True`` then the matching rows are discarded instead
@@ -167,8 +257,15 @@ def _(ctx, iterator, field, low, high, discard=False):
 
     return filter(predicate, iterator)
 
+def _filter_not_empty_kernel(compiler, field):
+    fields = compiler.fields
+    value = compiler.value(fields.index(field))
+    compiler.require("%s is not None" % value)
+    return fields
+
 @filter_not_empty.register("rows")
-@unary_iterator
+@row_kernel(_filter_not_empty_kernel)
+@unary_filter
 def _(ctx, iterator, field):
     """Select rows where value of `field` is not None"""
 
@@ -179,8 +276,15 @@ def _(ctx, iterator, field):
 
     return filter(predicate, iterator)
 
+def _filter_empty_kernel(compiler, field):
+    fields = compiler.fields
+    value = compiler.value(fields.index(field))
+    compiler.require("%s is None or %s == ''" % (value, value))
+    return fields
+
 @filter_empty.register("rows")
-@unary_iterator
+@row_kernel(_filter_empty_kernel)
+@unary_filter
 def _(ctx, iterator, field):
     """Select rows where value of `field` is None or empty string"""
 
@@ -192,7 +296,7 @@ def _(ctx, iterator, field):
     return filter(predicate, iterator)
 
 @filter_by_predicate.register("rows")
-@unary_iterator
+@unary_filter
 def _(ctx, obj, predicate, fields, discard=False,
                         **kwargs):
     """Returns an interator selecting fields where `predicate` is true.
@@ -213,6 +317,41 @@ def _(ctx, obj, predicate, fields, discard=False,
     return iterator(indexes)
 
 
+def _expression_source(compiler, expression):
+    """Returns Python source of `expression` over the values of a row
+    function compiler."""
+    from ..expression import PythonExpressionCompiler
+
+    variables = dict((field.name, compiler.value(i))
+                     for i, field in enumerate(compiler.fields))
+    expression_compiler = PythonExpressionCompiler(variables,
+                                                   constant=compiler.constant)
+    return expression_compiler.compile(expression)
+
+def _filter_by_expression_kernel(compiler, expression, discard=False):
+    condition = _expression_source(compiler, expression)
+    if discard:
+        condition = "not %s" % condition
+    compiler.require(condition)
+    return compiler.fields
+
+@filter_by_expression.register("rows")
+@row_kernel(_filter_by_expression_kernel)
+@unary_filter
+def _(ctx, obj, expression, discard=False):
+    """Selects rows where `expression` is true, or false if `discard` is
+    ``True``. The expression is compiled into a Python function of a row,
+    see `bubbles.expression`."""
+    from ..expression import row_function
+
+    predicate = row_function(expression, obj.fields)
+
+    if discard:
+        return itertools.filterfalse(predicate, obj.rows())
+    else:
+        return filter(predicate, obj.rows())
+
+
 @filter_by_predicate.register("records")
 def _(ctx, iterator, predicate, fields, discard=False,
                         **kwargs):
@@ -230,30 +369,10 @@ def _(ctx, iterator, predicate, fields, discard=False,
 
 @distinct.register("rows")
 def _(ctx, obj, key=None, is_sorted=False):
-    """Return distinct `keys` from `iterator`. `iterator` does
-    not have to be sorted. If iterator is sorted by the keys and
-    `is_sorted` is ``True`` then more efficient version is used."""
-    # TODO: remove is_sorted hint, objects should store metadata about
-    # that
-
-    def iterator(row_filter):
-        if is_sorted:
-            last_key = object()
-
-            # FIXME: use itertools equivalent
-            for row in obj:
-                key_tuple = (row_filter(row))
-                if key_tuple != last_key:
-                    yield key_tuple
-
-        else:
-            distinct_values = set()
-            for row in obj:
-                # Construct key tuple from distinct fields
-                key_tuple = tuple(row_filter(row))
-                if key_tuple not in distinct_values:
-                    distinct_values.add(key_tuple)
-                    yield key_tuple
+    """Return distinct `keys` from `iterator`. `iterator` does not have to
+    be sorted. If the object is sorted by the keys (see `is_sorted_by()`) or
+    `is_sorted` is ``True`` then only boundaries of groups of equal keys are
+    checked, instead of keeping a set of all distinct keys."""
 
     fields = obj.fields
     if key:
@@ -264,18 +383,36 @@ def _(ctx, obj, key=None, is_sorted=False):
 
     # Retain original order of fields
     fields = FieldList(*row_filter(obj.fields))
+    is_sorted = is_sorted or is_sorted_by(obj, fields.names())
 
-    return IterableDataSource(iterator(row_filter), fields)
+    def iterator():
+        key_tuples = (tuple(row_filter(row)) for row in obj.rows())
+
+        if is_sorted:
+            for key_tuple, group in itertools.groupby(key_tuples):
+                yield key_tuple
+
+        else:
+            distinct_values = set()
+            for key_tuple in key_tuples:
+                if key_tuple not in distinct_values:
+                    distinct_values.add(key_tuple)
+                    yield key_tuple
+
+    # Keys are in the order of their first occurrence
+    result = IterableDataSource(iterator(), fields)
+    result.ordering = FieldFilter(keep=fields.names()) \
+                            .filter_ordering(obj.ordering)
+    return result
 
 
 @distinct_rows.register("rows")
-@unary_iterator
+@unary_filter
 def _(ctx, obj, key=None, is_sorted=False):
     """Return distinct rows based on `key` from `iterator`. `iterator`
-    does not have to be sorted. If iterator is sorted by the keys and
-    `is_sorted` is ``True`` then more efficient version is used."""
-    # TODO: remove is_sorted hint, objects should store metadata about
-    # that
+    does not have to be sorted. If the object is sorted by the keys (see
+    `is_sorted_by()`) or `is_sorted` is ``True`` then only boundaries of
+    groups of equal keys are checked."""
 
     fields = obj.fields
     if key:
@@ -284,41 +421,52 @@ def _(ctx, obj, key=None, is_sorted=False):
     else:
         row_filter = FieldFilter().row_filter(fields)
 
-    if is_sorted:
-        last_key = object()
+    names = FieldList(*row_filter(obj.fields)).names()
+    key_getter = lambda row: tuple(row_filter(row))
 
-        # FIXME: use itertools equivalent
-        for value in obj:
-            key_tuple = (row_filter(row))
-            if key_tuple != last_key:
-                yield row
+    if is_sorted or is_sorted_by(obj, names):
+        for key_tuple, group in itertools.groupby(obj.rows(), key_getter):
+            yield next(group)
 
     else:
         distinct_values = set()
-        for row in obj:
+        for row in obj.rows():
             # Construct key tuple from distinct fields
-            key_tuple = tuple(row_filter(row))
+            key_tuple = key_getter(row)
             if key_tuple not in distinct_values:
                 distinct_values.add(key_tuple)
                 yield row
 
 
 @first_unique.register("rows")
-@unary_iterator
+@unary_filter
 def _(ctx, iterator, keys=None, discard=False):
     """Return rows that are unique by `keys`. If `discard` is `True` then the
-    action is reversed and duplicate rows are returned."""
+    action is reversed and duplicate rows are returned. If the object is
+    sorted by the keys, only boundaries of groups of equal keys are
+    checked."""
 
-    # FIXME: add is_sorted version
     # FIXME: use prepare key
 
     row_filter = FieldFilter(keep=keys).row_filter(iterator.fields)
+    key_getter = lambda row: tuple(row_filter(row))
+    names = FieldList(*row_filter(iterator.fields)).names()
+
+    if is_sorted_by(iterator, names):
+        for key_tuple, group in itertools.groupby(iterator.rows(),
+                                                  key_getter):
+            first = next(group)
+            if discard:
+                yield from group
+            else:
+                yield first
+        return
 
     distinct_values = set()
 
     for row in iterator:
         # Construct key tuple from distinct fields
-        key_tuple = tuple(row_filter(row))
+        key_tuple = key_getter(row)
 
         if key_tuple not in distinct_values:
             distinct_values.add(key_tuple)
@@ -332,11 +480,19 @@ def _(ctx, iterator, keys=None, discard=False):
 
 
 @sample.register("rows")
-@unary_iterator
-def _(ctx, iterator, value, discard=False, mode="first"):
+@unary_filter
+def _(ctx, obj, value, discard=False, mode="first", seed=None, key=None):
     """Returns sample from the iterator. If `mode` is ``first`` (default),
     then `value` is number of first records to be returned. If `mode` is
-    ``nth`` then one in `value` records is returned."""
+    ``nth`` then one in `value` records is returned.
+
+    If `mode` is ``random`` then `value` rows are selected uniformly at
+    random in one pass with memory only for the sample (reservoir sampling,
+    see `reservoir_sample()`), `seed` makes the sample reproducible. If
+    `key` is specified, then `value` rows are sampled for every distinct
+    key (stratified sample). Sampled rows are in their original order."""
+
+    iterator = obj.rows()
 
     if mode == "first":
         if discard:
@@ -345,16 +501,48 @@ def _(ctx, iterator, value, discard=False, mode="first"):
             return itertools.islice(iterator, value)
     elif mode == "nth":
         if discard:
-            return discard_nth(iterator, value)
+            return (row for i, row in enumerate(iterator) if i % value != 0)
         else:
             return itertools.islice(iterator, None, None, value)
     elif mode == "random":
-        raise NotImplementedError("random sampling is not yet implemented")
+        if discard:
+            raise ArgumentError("Random sample can not be discarded")
+        if value == 0:
+            return iter([])
+        if key:
+            return _stratified_sample(obj.fields, iterator, value, seed, key)
+        else:
+            return iter(reservoir_sample(iterator, value, seed))
     else:
-        raise Exception("Unknown sample mode '%s'" % mode)
+        raise ArgumentError("Unknown sample mode '%s'" % mode)
 
 
-@unary_iterator
+def _stratified_sample(fields, iterator, size, seed, key):
+    """Returns iterator of random samples of `size` rows for every distinct
+    `key` in the original order of the rows."""
+
+    indexes = fields.indexes(prepare_key(key))
+    key_getter = operator.itemgetter(*indexes) if indexes else lambda row: ()
+
+    rng = random.Random(seed)
+    reservoirs = {}
+
+    for item in enumerate(iterator):
+        key_value = key_getter(item[1])
+        try:
+            reservoir = reservoirs[key_value]
+        except KeyError:
+            reservoir = reservoirs[key_value] = Reservoir(size, rng)
+        reservoir.add(item)
+
+    items = [item for reservoir in reservoirs.values()
+                  for item in reservoir.sample()]
+    items.sort(key=operator.itemgetter(0))
+
+    return (row for i, row in items)
+
+
+@unary_filter
 def discard_nth_base(ctx, iterator, step):
     """Discards every step-th item from `iterator`"""
     for i, value in enumerate(iterator):
@@ -364,49 +552,170 @@ def discard_nth_base(ctx, iterator, step):
 discard_nth.register("rows")(discard_nth_base)
 discard_nth.register("records")(discard_nth_base)
 
+def _order_key(fields, orderby):
+    """Returns a tuple (`key`, `reverse`) for sorting rows with `fields` by
+    `orderby` – a list of tuples (`field`, `order`) – in one pass. If all
+    fields have the same order, then the key is a tuple of the values,
+    otherwise the values are compared field by field."""
+
+    indexes = []
+    descending = []
+
+    for field, order in orderby:
+        order = order.lower()
+        if order.startswith("asc"):
+            descending.append(False)
+        elif order.startswith("desc"):
+            descending.append(True)
+        else:
+            raise ValueError("Unknown order %s for column %s"
+                             % (order, field))
+
+        indexes.append(fields.index(field))
+
+    if not indexes:
+        return (None, False)
+
+    if all(descending) or not any(descending):
+        return (operator.itemgetter(*indexes), descending[0])
+
+    keys = list(zip(indexes, descending))
+
+    def compare(row, other):
+        for index, desc in keys:
+            value = row[index]
+            other_value = other[index]
+
+            if value < other_value:
+                return 1 if desc else -1
+            elif other_value < value:
+                return -1 if desc else 1
+
+        return 0
+
+    return (functools.cmp_to_key(compare), False)
+
 @sort.register("rows")
-@unary_iterator
 def _(ctx, obj, orderby):
-    iterator = obj.rows()
+    """Sorts rows by composite key of `orderby` fields. Inputs longer than
+    `bubbles.buffers.DEFAULT_SORT_RUN_SIZE` rows are sorted externally –
+    sorted runs are spilled into temporary files and merged."""
 
     orderby = prepare_order_list(orderby)
+    key, reverse = _order_key(obj.fields, orderby)
 
-    for field, order in reversed(orderby):
-        index = obj.fields.index(field)
+    if key is None:
+        return obj
 
-        if order.startswith("asc"):
-            reverse = False
-        elif order.startswith("desc"):
-            reverse = True
-        else:
-            raise ValueError("Unknown order %s for column %s") % (order, column)
+    rows = sorted_rows(obj.rows(), key=key, reverse=reverse)
+
+    result = IterableDataSource(rows, obj.fields.clone())
+    result.ordering = prepare_ordering(orderby)
+    return result
+
+
+class _Descending(object):
+    """Sort key wrapper with reversed comparison."""
+    __slots__ = ("key", )
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+class _TopRows(object):
+    def __init__(self, n, key, reverse):
+        """Keeps first `n` of added rows sorted by `key`, the same as
+        ``sorted(rows, key=key, reverse=reverse)[:n]``. The rows are kept in
+        a heap of at most `n` rows with the worst of them on the top."""
+        self.n = n
+        self.wrap = key if reverse else lambda row: _Descending(key(row))
+        self.heap = []
+
+    def add(self, number, row):
+        """Adds `row`, `number` is position of the row in the input."""
+        # Earlier of equal rows is better, as in a stable sort
+        entry = (self.wrap(row), -number, row)
+        if len(self.heap) < self.n:
+            heapq.heappush(self.heap, entry)
+        elif self.heap and self.heap[0] < entry:
+            heapq.heapreplace(self.heap, entry)
+
+    def rows(self):
+        """Returns list of the kept rows, sorted."""
+        return [row for _, _, row in sorted(self.heap, reverse=True)]
+
+
+@top.register("rows")
+def _(ctx, obj, orderby, n, partition=None):
+    """Returns first `n` rows sorted by `orderby`, or first `n` rows of
+    every distinct `partition` key. Only `n` rows of each partition are
+    kept in memory in a bounded heap, the input is not sorted. Rows are
+    ordered by `orderby` within partitions, partitions are in order of
+    their first row. Input ordered by `orderby` is just sliced, partitions
+    of input sorted by the `partition` are processed one at a time."""
+
+    if n < 0:
+        raise ArgumentError("Number of top rows should not be negative")
+
+    orderby = prepare_order_list(orderby)
+    ordering = prepare_ordering(orderby)
+    partition = prepare_key(partition) if partition else []
+
+    key, reverse = _order_key(obj.fields, orderby)
+    if key is None:
+        raise ArgumentError("No fields to order top rows by")
 
-        iterator = sorted(iterator, key=operator.itemgetter(index),
-                                    reverse=reverse)
+    current = [tuple(item) for item in obj.ordering or ()]
 
-    return iterator
+    if not partition and current[:len(ordering)] == ordering:
+        result = IterableDataSource(itertools.islice(obj.rows(), n),
+                                    obj.fields.clone())
+        result.ordering = ordering
+        return result
 
+    indexes = obj.fields.indexes(partition) if partition else []
+    partition_key = lambda row: tuple(row[i] for i in indexes)
 
-###
-# Simple and naive aggregation in Python
+    grouped = is_sorted_by(obj, partition)
 
-def agg_sum(a, value):
-    return a+value
+    def iterator():
+        rows = enumerate(obj.rows())
+
+        # Partitions of sorted input are adjacent, one heap is kept
+        if grouped:
+            group_key = lambda item: partition_key(item[1])
+            for _, group in itertools.groupby(rows, group_key):
+                heap = _TopRows(n, key, reverse)
+                for number, row in group:
+                    heap.add(number, row)
+                yield from heap.rows()
+            return
+
+        heaps = OrderedDict()
+        for number, row in rows:
+            value = partition_key(row)
+            try:
+                heap = heaps[value]
+            except KeyError:
+                heap = heaps[value] = _TopRows(n, key, reverse)
+            heap.add(number, row)
 
-def agg_average(a, value):
-    return (a[0]+1, a[1]+value)
+        for heap in heaps.values():
+            yield from heap.rows()
 
-def agg_average_finalize(a):
-    return a[1]/a[0]
+    result = IterableDataSource(iterator(), obj.fields.clone())
+    if not partition:
+        result.ordering = ordering
+    elif grouped:
+        result.ordering = current[:len(partition)] + ordering
+    return result
 
-AggregationFunction = namedtuple("AggregationFunction",
-                            ["func", "start", "finalize"])
-aggregation_functions = {
-            "sum": AggregationFunction(agg_sum, 0, None),
-            "min": AggregationFunction(min, 0, None),
-            "max": AggregationFunction(max, 0, None),
-            "average": AggregationFunction(agg_average, (0,0), agg_average_finalize)
-        }
 
 @aggregate.register("rows")
 def _(ctx, obj, key, measures=None, include_count=True,
@@ -417,13 +726,20 @@ def _(ctx, obj, key, measures=None, include_count=True,
 
     `measures` should be a list of tuples in form (`measure`, `aggregate`).
     See `distill_measure_aggregates()` for how to convert from arbitrary list
-    of measures into this form.
+    of measures into this form. Aggregation functions are kernels registered
+    in `bubbles.aggregates`, all of them are compiled into one update
+    function.
 
     Output of this iterator is an iterator that yields rows with fields that
     contain: key fields, measures (as specified in the measures list) and
     optional record count if `include_count` is ``True`` (default).
 
-    Result is not ordered even the input was ordered.
+    If the object is sorted by the keys (see `is_sorted_by()`), groups of
+    adjacent rows are aggregated one at a time and the result is ordered by
+    the keys. Otherwise the groups are kept in a hash table and the result
+    is not ordered. When there are more than
+    `bubbles.buffers.DEFAULT_GROUP_LIMIT` groups, partial aggregates are
+    spilled into temporary files and merged partition by partition.
 
     .. note:
 
@@ -432,98 +748,308 @@ def _(ctx, obj, key, measures=None, include_count=True,
         large datasets.
     """
 
-    def aggregation_result(keys, aggregates, measure_aggregates):
-        # Pass results to output
-        for key in keys:
-            row = list(key[:])
-
-            key_aggregate = aggregates[key]
-            for i, (measure, index, function) in enumerate(measure_aggregates):
-                aggregate = key_aggregate[i]
-                finalize = aggregation_functions[function].finalize
-                if finalize:
-                    row.append(finalize(aggregate))
-                else:
-                    row.append(aggregate)
-
-            if include_count:
-                row.append(key_aggregate[-1])
-
-            yield row
-
-    # TODO: create sorted version
-    # TODO: include SQL style COUNT(field) to count non-NULL values
-
     # Coalesce to a list if just one is specified
-    keys = prepare_key(key)
+    keys = prepare_key(key) if key else []
 
     measures = prepare_aggregation_list(measures)
 
-    # Prepare output fields
     out_fields = FieldList()
     out_fields += obj.fields.fields(keys)
+    out_fields += obj.fields.aggregated_fields(
+        measures, include_count, count_field)
 
-    measure_fields = set()
-    measure_aggregates = []
-    for measure in measures:
-        name = measure[0]
-        index = obj.fields.index(name)
-        aggregate = measure[1]
-
-        measure_aggregates.append( (name, index, aggregate) )
-        measure_fields.add(name)
-
-        field = obj.fields.field(name)
-        field = field.clone(name="%s_%s" % (name, aggregate),
-                            analytical_type="measure")
-        out_fields.append(field)
-
+    aggregates = [(function, obj.fields.index(name))
+                  for name, function in measures]
     if include_count:
-        out_fields.append(Field(count_field,
-                            storage_type="integer",
-                            analytical_type="measure"))
+        aggregates.append(("count", None))
 
     if keys:
         key_selectors = obj.fields.indexes(keys)
     else:
         key_selectors = []
 
-    keys = set()
+    compiled = compile_aggregates(aggregates)
 
-    # key -> list of aggregates
-    aggregates = {}
+    def aggregation_result(groups):
+        for key, state in groups:
+            yield list(key) + compiled.finalize(state)
 
-    for row in obj.rows():
-        # Create aggregation key
-        key = tuple(row[s] for s in key_selectors)
+    key_getter = lambda row: tuple(row[s] for s in key_selectors)
 
-        # Create new aggregate record for key if it does not exist
-        #
-        try:
-            key_aggregate = aggregates[key]
-        except KeyError:
-            keys.add(key)
-            key_aggregate = []
-            for measure, index, function in measure_aggregates:
-                start = aggregation_functions[function].start
-                key_aggregate.append(start)
-            if include_count:
-                key_aggregate.append(0)
+    if is_sorted_by(obj, keys):
+        def sorted_aggregation():
+            for key, rows in itertools.groupby(obj.rows(), key_getter):
+                state = compiled.new()
+                for row in rows:
+                    compiled.update(state, row)
 
-            aggregates[key] = key_aggregate
+                yield list(key) + compiled.finalize(state)
 
-        for i, (measure, index, function) in enumerate(measure_aggregates):
-            func = aggregation_functions[function].func
-            key_aggregate[i] = func(key_aggregate[i], row[index])
+        result = IterableDataSource(sorted_aggregation(), out_fields)
+        result.ordering = FieldFilter(keep=keys).filter_ordering(obj.ordering)
+        return result
 
-        if include_count:
-            key_aggregate[-1] += 1
+    items = ((key_getter(row), row) for row in obj.rows())
+    groups = hash_groups(items, compiled.new, compiled.update,
+                         compiled.merge)
 
-    iterator = aggregation_result(keys, aggregates, measure_aggregates)
+    iterator = aggregation_result(groups)
 
     return IterableDataSource(iterator, out_fields)
 
 
+def _check_frame(frame):
+    """Raises `ArgumentError` if `frame` of a window is not valid."""
+    if frame is None or frame == "partition":
+        return
+    if not isinstance(frame, int) or frame < 1:
+        raise ArgumentError("Window frame should be a number of rows or "
+                            "'partition', not %r" % (frame, ))
+
+
+def _window_input(obj, partition, ordering):
+    """Returns a tuple (`rows`, `ordering`) with rows of `obj` grouped by
+    `partition` fields and sorted by `ordering` within the groups. The rows
+    are sorted only if the ordering of `obj` does not match."""
+
+    current = [tuple(item) for item in obj.ordering or ()]
+    grouped = not partition or is_sorted_by(obj, partition)
+    following = current[len(partition):len(partition) + len(ordering)]
+
+    if grouped and following == ordering:
+        return (obj.rows(), obj.ordering)
+
+    required = [(field, "asc") for field in partition] + ordering
+    key, reverse = _order_key(obj.fields, required)
+
+    return (sorted_rows(obj.rows(), key=key, reverse=reverse), required)
+
+
+def _frame_aggregates(aggregates, frame):
+    """Returns a function that creates a sliding frame of `frame` rows for
+    one partition. The frame is a function of a row: it adds the row,
+    removes the row that left the frame and returns values of `aggregates`
+    (list of tuples (`function`, `index`)) over the frame."""
+
+    removable = []
+    extremes = []
+    recomputed = []
+
+    for position, (function, index) in enumerate(aggregates):
+        if function in ("min", "max"):
+            extremes.append((position, function == "min", index))
+        elif aggregate_kernel(function).remove is not None:
+            removable.append(position)
+        else:
+            recomputed.append(position)
+
+    def compile_positions(positions):
+        if not positions:
+            return None
+        return compile_aggregates([aggregates[i] for i in positions])
+
+    sliding = compile_positions(removable)
+    whole = compile_positions(recomputed)
+
+    def new_frame():
+        frame_rows = deque()
+        state = sliding.new() if sliding else None
+        # (row number, value) with increasing values for min, decreasing
+        # for max – the first one is the aggregated value
+        queues = [deque() for _ in extremes]
+        number = 0
+
+        def push(row):
+            nonlocal number
+            number += 1
+
+            frame_rows.append(row)
+            if sliding:
+                sliding.update(state, row)
+            if len(frame_rows) > frame:
+                left = frame_rows.popleft()
+                if sliding:
+                    sliding.remove(state, left)
+
+            values = [None] * len(aggregates)
+
+            if sliding:
+                for i, value in zip(removable, sliding.finalize(state)):
+                    values[i] = value
+
+            for (i, is_min, index), queue in zip(extremes, queues):
+                value = row[index]
+                if value is not None:
+                    # Values that can not be the extreme any more
+                    while queue and (queue[-1][1] >= value if is_min
+                                     else queue[-1][1] <= value):
+                        queue.pop()
+                    queue.append((number, value))
+                if queue and queue[0][0] <= number - frame:
+                    queue.popleft()
+                values[i] = queue[0][1] if queue else None
+
+            if whole:
+                other = whole.new()
+                for frame_row in frame_rows:
+                    whole.update(other, frame_row)
+                for i, value in zip(recomputed, whole.finalize(other)):
+                    values[i] = value
+
+            return values
+
+        return push
+
+    return new_frame
+
+
+@window.register("rows")
+def _(ctx, obj, functions, partition=None, orderby=None, frame=None):
+    """Appends fields with window `functions` computed over rows with the
+    same `partition` fields ordered by `orderby`. See
+    `prepare_window_functions()` for the list of functions. Aggregations
+    are computed over the rows from the start of the partition to the
+    current row, over the last `frame` rows if `frame` is a number or over
+    the whole partition if `frame` is ``"partition"`` – rows of one
+    partition are kept in memory in that case.
+
+    A `frame` of rows slides: aggregations that can be reverted, such as
+    ``count``, ``sum`` or ``average``, remove the row leaving the frame,
+    ``min`` and ``max`` keep a monotonic queue of candidate values. Other
+    aggregations, such as ``stddev`` or ``median``, are recomputed from all
+    rows of the frame for every row.
+
+    Rows are processed in one pass. If the object is not sorted by the
+    partition and the order, it is sorted first (see `sort`); the result
+    is ordered.
+    """
+
+    partition = prepare_key(partition) if partition else []
+    ordering = prepare_ordering(orderby) if orderby else []
+    functions = prepare_window_functions(functions)
+
+    _check_frame(frame)
+
+    out_fields = obj.fields.clone()
+    out_fields += obj.fields.window_fields(functions)
+
+    rows, result_ordering = _window_input(obj, partition, ordering)
+
+    # Columns of the output row for every kind of function
+    width = len(obj.fields)
+    ranks = []
+    lags = []
+    leads = []
+    aggregates = []
+    agg_columns = []
+
+    for i, (field, function, argument, name) in enumerate(functions):
+        column = width + i
+        if function in RANKING_FUNCTIONS:
+            ranks.append((column, function))
+        elif function == "lag":
+            lags.append((column, obj.fields.index(field), argument))
+        elif function == "lead":
+            leads.append((column, obj.fields.index(field), argument))
+        else:
+            aggregates.append((function, obj.fields.index(field)))
+            agg_columns.append(column)
+
+    if aggregates and isinstance(frame, int):
+        push_frame = _frame_aggregates(aggregates, frame)
+        compiled = None
+    else:
+        push_frame = None
+        compiled = compile_aggregates(aggregates) if aggregates else None
+
+    history_size = max(offset for _, _, offset in lags) if lags else 0
+    lookahead = max(offset for _, _, offset in leads) if leads else 0
+
+    order_indexes = [obj.fields.index(field) for field, _ in ordering]
+    partition_indexes = obj.fields.indexes(partition) if partition else []
+
+    def window_rows(rows):
+        """Yields output rows of one partition."""
+        history = deque(maxlen=history_size)
+        state = compiled.new() if compiled else None
+        push = push_frame() if push_frame else None
+        partition_values = None
+
+        if frame == "partition":
+            rows = list(rows)
+            if compiled:
+                for row in rows:
+                    compiled.update(state, row)
+                partition_values = compiled.finalize(state)
+        # Rows waiting for values of `lead`
+        pending = deque()
+
+        number = rank = dense_rank = 0
+        last_key = None
+
+        for row in rows:
+            number += 1
+            out = list(row)
+            out += [None] * len(functions)
+
+            if ranks:
+                key = tuple(row[i] for i in order_indexes)
+                if number == 1 or key != last_key:
+                    rank = number
+                    dense_rank += 1
+                    last_key = key
+
+                for column, function in ranks:
+                    if function == "row_number":
+                        out[column] = number
+                    elif function == "rank":
+                        out[column] = rank
+                    else:
+                        out[column] = dense_rank
+
+            if lags:
+                for column, index, offset in lags:
+                    if len(history) >= offset:
+                        out[column] = history[-offset][index]
+                history.append(row)
+
+            if partition_values is not None:
+                for column, value in zip(agg_columns, partition_values):
+                    out[column] = value
+            elif push:
+                for column, value in zip(agg_columns, push(row)):
+                    out[column] = value
+            elif compiled:
+                compiled.update(state, row)
+                values = compiled.finalize(state)
+                for column, value in zip(agg_columns, values):
+                    out[column] = value
+
+            if leads:
+                pending.append(out)
+                for column, index, offset in leads:
+                    if len(pending) > offset:
+                        pending[-1 - offset][column] = row[index]
+                if len(pending) > lookahead:
+                    yield pending.popleft()
+            else:
+                yield out
+
+        yield from pending
+
+    def iterator():
+        if partition_indexes:
+            key = lambda row: tuple(row[i] for i in partition_indexes)
+            for _, group in itertools.groupby(rows, key):
+                yield from window_rows(group)
+        else:
+            yield from window_rows(rows)
+
+    result = IterableDataSource(iterator(), out_fields)
+    result.ordering = result_ordering
+    return result
+
+
 #############################################################################
 # Transpose
 
@@ -565,13 +1091,39 @@ def _(ctx, obj, fields, value):
             yield list(row) + constants
 
     if not isinstance(value, (list, tuple)):
-        constants = (value, )
+        constants = [value]
     else:
-        constants = value
+        constants = list(value)
 
     output_fields = obj.fields + fields
 
-    return IterableDataSource(iterator(constants), output_fields)
+    result = IterableDataSource(iterator(constants), output_fields)
+    result.ordering = obj.ordering
+    return result
+
+
+def _derive_kernel(compiler, field, expression):
+    compiler.append(_expression_source(compiler, expression))
+    return compiler.fields + FieldList(field)
+
+@derive.register("rows")
+@row_kernel(_derive_kernel)
+def _(ctx, obj, field, expression):
+    """Appends `field` with values of `expression` computed from the other
+    fields of the row, see `bubbles.expression`."""
+    from ..expression import row_function
+
+    function = row_function(expression, obj.fields)
+
+    def iterator():
+        for row in obj.rows():
+            row = list(row)
+            row.append(function(row))
+            yield row
+
+    result = IterableDataSource(iterator(), obj.fields + FieldList(field))
+    result.ordering = obj.ordering
+    return result
 
 
 @dates_to_dimension.register("rows")
@@ -688,24 +1240,35 @@ def _(ctx, iterator, field, substitutions):
 
         yield row
 
-@empty_to_missing.register("rows")
-@unary_iterator
-@experimental
-def _(ctx, iterator, fields=None, strict=False):
-    """Converts empty strings into `None` values."""
+def _empty_to_missing_indexes(all_fields, fields=None, strict=False):
+    """Returns indexes of `fields` that are converted by `empty_to_missing`"""
     if fields:
         if strict:
-            fields = iterator.fields.fields(fields)
+            fields = all_fields.fields(fields)
         else:
             array = []
             for field in fields:
-                if field in iterator.fields:
+                if field in all_fields:
                     array.append(field)
             fields = array
     else:
-        fields = iterator.fields.fields(storage_type="string")
+        fields = all_fields.fields(storage_type="string")
+
+    return all_fields.indexes(fields)
 
-    indexes = iterator.fields.indexes(fields)
+def _empty_to_missing_kernel(compiler, fields=None, strict=False):
+    indexes = _empty_to_missing_indexes(compiler.fields, fields, strict)
+    for index in indexes:
+        compiler.assign(index, "%s or None" % compiler.value(index))
+    return compiler.fields.clone()
+
+@empty_to_missing.register("rows")
+@row_kernel(_empty_to_missing_kernel)
+@unary_iterator
+@experimental
+def _(ctx, iterator, fields=None, strict=False):
+    """Converts empty strings into `None` values."""
+    indexes = _empty_to_missing_indexes(iterator.fields, fields, strict)
 
     for row in iterator:
         row = list(row)
@@ -713,21 +1276,33 @@ def _(ctx, iterator, fields=None, strict=False):
             row[index] = row[index] if row[index] else None
         yield row
 
+def _string_strip_indexes(fields, strip_fields=None):
+    """Returns indexes of fields stripped by `string_strip`."""
+    if not strip_fields:
+        strip_fields = []
+        for field in fields:
+            if field.storage_type =="string" or field.storage_type == "text":
+                strip_fields.append(field)
+
+    return fields.indexes(strip_fields)
+
+def _string_strip_kernel(compiler, strip_fields=None, chars=None):
+    fields = compiler.fields
+    chars = compiler.constant(chars)
+    for index in _string_strip_indexes(fields, strip_fields):
+        var = compiler.assign(index, compiler.value(index))
+        compiler.statement("if %s: %s = %s.strip(%s)" % (var, var, var, chars))
+    return fields.clone()
+
 @string_strip.register("rows")
+@row_kernel(_string_strip_kernel)
 @unary_iterator
 def _(ctx, iterator, strip_fields=None, chars=None):
     """Strip characters from `strip_fields` in the iterator. If no
     `strip_fields` is provided, then it strips all `string` or `text` storage
     type objects."""
 
-    fields = iterator.fields
-    if not strip_fields:
-        strip_fields = []
-        for field in fields:
-            if field.storage_type =="string" or field.storage_type == "text":
-                strip_fields.append(field)
-
-    indexes = fields.indexes(strip_fields)
+    indexes = _string_strip_indexes(iterator.fields, strip_fields)
 
     for row in iterator:
         row = list(row)
@@ -756,55 +1331,189 @@ def _(ctx, objects):
 
 
 
-@join_details.register("rows", "rows")
-def _(self, master, detail, master_key, detail_key):
-    """"Simple master-detail join"""
+JOIN_MODES = ("inner", "left", "semi", "anti")
 
-    def _join_detail_iterator(master, detail, master_key, detail_key):
-        """Simple iterator implementation of the left inner join"""
 
-        djoins = []
-        detail_map = {}
+def _key_getter(indexes):
+    """Returns a function that returns tuple of values at `indexes` of a
+    row or ``None`` if any of the values is ``None``."""
+    def key(row):
+        key = tuple(row[i] for i in indexes)
+        return None if None in key else key
+    return key
 
-        # TODO: support compound keys
-        detail_index = detail.fields.index(detail_key[0])
-        detail_dict = {}
 
-        for row in detail:
-            row = list(row)
-            key = row.pop(detail_index)
-            detail_dict[key] = row
+def _detail_values(indexes, width):
+    """Returns a function that returns values of a detail row without the
+    key values at `indexes`."""
+    keep = [i for i in range(width) if i not in indexes]
+    return lambda row: [row[i] for i in keep]
 
-        for master_row in master:
-            row = list(master_row)
 
-            master_index = master.fields.index(master_key[0])
-            key = master_row[master_index]
-            try:
-                detail_row = detail_dict[key]
-            except KeyError:
-                continue
-            else:
-                yield row + detail_row
+def _hash_join_iterator(master, detail, master_key, detail_key, values):
+    """Yields tuples (`master_row`, `matches`) where `matches` are detail
+    rows with the same key. Detail rows are the build side of a hash join,
+    see `bubbles.buffers.hash_join()`."""
+
+    build = ((detail_key(row), values(row)) for row in detail.rows())
+    probe = ((master_key(row), row) for row in master.rows())
+
+    return hash_join(build, probe)
+
+
+def _merge_join_iterator(master, detail, master_key, detail_key, values,
+                         descending=False):
+    """Yields tuples (`master_row`, `matches`) where `matches` are detail
+    rows with the same key. Both objects have to be sorted by the key in the
+    same direction. Only the detail rows of the current key are kept in
+    memory."""
+
+    details = ((key, row) for key, row in
+               ((detail_key(row), row) for row in detail.rows())
+               if key is not None)
+
+    if descending:
+        precedes = lambda value, key: key < value
+    else:
+        precedes = lambda value, key: value < key
+
+    detail_item = next(details, None)
+    current_key = None
+    current = ()
+
+    for master_row in master.rows():
+        key = master_key(master_row)
+        if key is None:
+            yield (master_row, ())
+            continue
+
+        if key != current_key:
+            # Skip details of keys that are not in the master
+            while detail_item is not None \
+                    and precedes(detail_item[0], key):
+                detail_item = next(details, None)
+
+            current = []
+            while detail_item is not None and detail_item[0] == key:
+                current.append(values(detail_item[1]))
+                detail_item = next(details, None)
+
+            current_key = key
+
+        yield (master_row, current)
+
+
+def _merge_join_order(master, detail, master_key, detail_key):
+    """Returns ``"asc"`` or ``"desc"`` if `master` and `detail` are sorted
+    by their keys in the same direction, otherwise ``None``."""
+
+    master_order = [tuple(item) for item in master.ordering or ()]
+    detail_order = [tuple(item) for item in detail.ordering or ()]
+    size = len(master_key)
+
+    if len(master_order) < size or len(detail_order) < size:
+        return None
+
+    orders = set()
+    for i in range(size):
+        if master_order[i][0] != master_key[i] \
+                or detail_order[i][0] != detail_key[i] \
+                or master_order[i][1] != detail_order[i][1]:
+            return None
+        orders.add(master_order[i][1])
+
+    return orders.pop() if len(orders) == 1 else None
+
+
+@join_details.register("rows", "rows")
+def _(self, master, detail, master_key, detail_key, mode="inner"):
+    """"Master-detail join on simple or compound keys. Every master row is
+    joined with all detail rows with the same key, rows with a ``None`` key
+    value are not joined. `mode` is:
+
+    * ``inner`` – only master rows with a detail row
+    * ``left`` – all master rows, detail values of master rows without
+      detail are ``None``
+    * ``semi`` – master rows that have a detail row, only master fields
+    * ``anti`` – master rows that have no detail row, only master fields
+
+    If both objects are sorted by the keys in the same direction, then they
+    are merged. Otherwise detail rows are kept in a hash table, larger
+    detail than `bubbles.buffers.DEFAULT_JOIN_BUILD_LIMIT` is joined
+    partition by partition. Order of master rows is kept, except for an
+    ``inner`` join with master estimated to be smaller than the detail –
+    the master is hashed then and the result is in order of the detail.
+    """
+
+    if mode not in JOIN_MODES:
+        raise ArgumentError("Unknown join mode '%s'" % (mode, ))
 
     master_key = prepare_key(master_key)
     detail_key = prepare_key(detail_key)
 
-    if len(master_key) > 1 or len(detail_key) > 1:
-        raise ArgumentError("Compound keys are not supported yet")
+    if len(master_key) != len(detail_key):
+        raise ArgumentError("Master key %s and detail key %s have different "
+                            "number of fields" % (master_key, detail_key))
 
-    result = _join_detail_iterator(master, detail, master_key, detail_key)
+    master_getter = _key_getter(master.fields.indexes(master_key))
+    detail_indexes = detail.fields.indexes(detail_key)
+    detail_getter = _key_getter(detail_indexes)
+    if mode in ("inner", "left"):
+        values = _detail_values(detail_indexes, len(detail.fields))
+    else:
+        # Only presence of a detail row matters
+        values = lambda row: True
 
-    # Prepare output fields and columns selection - the selection skips detail
-    # columns that are used as key, because they are already present in the
-    # master table.
+    # Prepare output fields - the key fields of the detail are skipped,
+    # because they are already present in the master.
 
     out_fields = master.fields.clone()
-    for field in detail.fields:
-        if str(field) not in detail_key:
-            out_fields.append(field)
+    if mode in ("inner", "left"):
+        for field in detail.fields:
+            if str(field) not in detail_key:
+                out_fields.append(field)
+
+    direction = _merge_join_order(master, detail, master_key, detail_key)
+
+    if direction:
+        pairs = _merge_join_iterator(master, detail, master_getter,
+                                     detail_getter, values,
+                                     descending=direction == "desc")
+    elif mode == "inner" \
+            and estimated_size(master) < estimated_size(detail):
+        # Build on the master side
+        build = ((master_getter(row), row) for row in master.rows())
+        probe = ((detail_getter(row), values(row)) for row in detail.rows())
+
+        def iterator():
+            for detail_values, matches in hash_join(build, probe):
+                for master_row in matches:
+                    yield list(master_row) + detail_values
+
+        return IterableDataSource(iterator(), out_fields)
+    else:
+        pairs = _hash_join_iterator(master, detail, master_getter,
+                                    detail_getter, values)
+
+    empty = [None] * (len(detail.fields) - len(detail_key))
 
-    return IterableDataSource(result, out_fields)
+    def iterator():
+        for master_row, matches in pairs:
+            if mode == "inner":
+                for detail_values in matches:
+                    yield list(master_row) + detail_values
+            elif mode == "left":
+                if not matches:
+                    yield list(master_row) + empty
+                for detail_values in matches:
+                    yield list(master_row) + detail_values
+            elif (mode == "semi") == bool(matches):
+                yield master_row
+
+    # Order of master rows is kept
+    result = IterableDataSource(iterator(), out_fields)
+    result.ordering = master.ordering
+    return result
 
 
 #############################################################################
@@ -812,15 +1521,27 @@ def _(self, master, detail, master_key, detail_key):
 
 
 @pretty_print.register("records")
-def _(ctx, obj, target=None):
+def _(ctx, obj, target=None, limit=None, buffer_size=None):
+    """Prints rows of `obj` as a table into `target` (default is standard
+    output). If `limit` is specified, then only the first `limit` rows are
+    read and printed. Column widths are computed from all printed rows,
+    which are kept in memory. If `buffer_size` is specified, then the
+    widths are computed from the first `buffer_size` rows and the rest is
+    printed as it is read – longer values exceed their columns."""
+
     if not target:
         target = sys.stdout
 
+    rows = iter(obj.rows())
+    if limit is not None:
+        rows = itertools.islice(rows, limit)
+
     names = obj.fields.names()
     widths = [len(field.name) for field in obj.fields]
+
     # Consume data to be pretty-printed
     text_rows = []
-    for row in obj.rows():
+    for row in itertools.islice(rows, buffer_size):
         line = [str(value) for value in row]
         widths = [max(w, len(val)) for w,val in zip(widths, line)]
         text_rows.append(line)
@@ -847,6 +1568,11 @@ def _(ctx, obj, target=None):
 
     for row in text_rows:
         target.write(format_str.format(*row))
+
+    # Rows after the buffer are streamed
+    for row in rows:
+        target.write(format_str.format(*[str(value) for value in row]))
+
     target.write(border)
 
     target.flush()
@@ -58,6 +58,10 @@ def filter_by_predicate(ctx, obj, predicate, fields, discard=False,
                         **kwargs):
     raise NotImplementedError
 
+@operation
+def filter_by_expression(ctx, obj, expression, discard=False):
+    raise NotImplementedError
+
 @operation
 def distinct(ctx, obj, key=None, is_sorted=False):
     raise NotImplementedError
@@ -71,7 +75,8 @@ def first_unique(ctx, iterator, keys=None, discard=False):
     raise NotImplementedError
 
 @operation
-def sample(ctx, iterator, value, discard=False, mode="first"):
+def sample(ctx, iterator, value, discard=False, mode="first", seed=None,
+           key=None):
     raise NotImplementedError
 
 @operation
@@ -86,6 +91,10 @@ def discard_nth(ctx, iterator, step):
 def sort(ctx, obj, orderby):
     raise NotImplementedError
 
+@operation
+def top(ctx, obj, orderby, n, partition=None):
+    raise NotImplementedError
+
 
 #############################################################################
 # Aggregate
@@ -95,6 +104,10 @@ def aggregate(ctx, obj, key, measures=None, include_count=True,
       count_field="record_count"):
     raise NotImplementedError
 
+@operation
+def window(ctx, obj, functions, partition=None, orderby=None, frame=None):
+    raise NotImplementedError
+
 
 #############################################################################
 # Field Operations
@@ -103,6 +116,10 @@ def aggregate(ctx, obj, key, measures=None, include_count=True,
 def append_constant_fields(ctx, obj, fields, value):
     raise NotImplementedError
 
+@operation
+def derive(ctx, obj, field, expression):
+    raise NotImplementedError
+
 @operation
 def dates_to_dimension(ctx, obj, fields=None, unknown_date=0):
     raise NotImplementedError
@@ -149,7 +166,7 @@ def append(ctx, objects):
     raise NotImplementedError
 
 @operation(2)
-def join_details(self, master, detail, master_key, detail_key):
+def join_details(self, master, detail, master_key, detail_key, mode="inner"):
     raise NotImplementedError
 
 
@@ -183,7 +200,7 @@ def nonempty_count(ctx, obj, fields=None):
     raise NotImplementedError
 
 @operation
-def distinct_count(ctx, obj, fields=None):
+def distinct_count(ctx, obj, fields=None, approximate=False):
     raise NotImplementedError
 
 #############################################################################
@@ -215,7 +232,7 @@ def load_versioned_dimension(ctx, dim, source, dim_key, fields,
 # Misc
 
 @operation
-def pretty_print(ctx, obj, target=None):
+def pretty_print(ctx, obj, target=None, limit=None, buffer_size=None):
     raise NotImplementedError
 
 #############################################################################
@@ -229,6 +246,14 @@ def as_records(ctx, obj):
 def fetch_all(ctx, obj):
     raise NotImplementedError
 
+@operation
+def as_batches(ctx, obj, size=None):
+    raise NotImplementedError
+
+@operation
+def as_columns(ctx, obj, chunk_size=None):
+    raise NotImplementedError
+
 @operation
 def as_dict(ctx, obj, key=None, value=None):
     raise NotImplementedError
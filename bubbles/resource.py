@@ -7,11 +7,13 @@ import urllib.request
 import urllib.parse
 import codecs
 import json
+import os
 
 __all__ = (
     "Resource",
     "is_local",
     "read_json",
+    "local_file_fingerprint",
 )
 
 
@@ -77,6 +79,11 @@ class Resource(ContextDecorator):
 
         return self.handle
 
+    def fingerprint(self):
+        """Returns fingerprint of the resource, see
+        :func:`local_file_fingerprint`."""
+        return local_file_fingerprint(self.url)
+
     def close(self):
         if self.should_close:
             self.handle.close()
@@ -106,3 +113,19 @@ def read_json(url):
             raise Exception("Unable to read JSON from %s: %s"
                             % (url, str(e)))
     return data
+
+def local_file_fingerprint(url):
+    """Returns a tuple (`path`, `modification time`, `size`) of a local file
+    `url`. Returns `None` if the `url` is not a local file."""
+
+    if not isinstance(url, str) or not is_local(url):
+        return None
+
+    path = urllib.parse.urlparse(url).path if url.startswith("file:") \
+                else url
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
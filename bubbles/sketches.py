@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""Approximate streaming summaries of values.
+
+Sketches keep a bounded amount of memory regardless of the number of values
+and can be merged, therefore they can be used as states of aggregate kernels
+that are spilled or computed in chunks.
+
+* `HyperLogLog` – approximate number of distinct values
+* `QuantileSketch` – approximate quantiles (KLL sketch)
+* `BloomFilter` – approximate set membership without false negatives
+* `Reservoir` and `reservoir_sample()` – uniform random sample of a stream
+"""
+
+import itertools
+import math
+import random
+
+from .errors import *
+
+__all__ = (
+    "HyperLogLog",
+    "QuantileSketch",
+    "BloomFilter",
+    "Reservoir",
+    "reservoir_sample",
+    "hll_precision",
+    "DEFAULT_HLL_PRECISION",
+    "DEFAULT_QUANTILE_K",
+)
+
+# 2^12 registers, standard error about 1.6 %
+DEFAULT_HLL_PRECISION = 12
+
+# Size parameter of the quantile sketch, rank error about 1 %
+DEFAULT_QUANTILE_K = 200
+
+_MASK64 = (1 << 64) - 1
+
+_missing = object()
+
+
+def _hash64(value):
+    """Returns 64 bit hash of `value`: the Python hash mixed with the
+    finalizer of SplitMix64, as hashes of small integers are the integers
+    themselves.
+
+    .. note::
+
+        Hashes of strings differ between Python processes unless
+        ``PYTHONHASHSEED`` is set. Sketches of strings created in different
+        processes should not be merged.
+    """
+    x = hash(value) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+
+def hll_precision(error):
+    """Returns the smallest `HyperLogLog` precision with standard error of
+    the estimate at most `error`, for example ``0.01`` for 1 %."""
+    registers = (1.04 / error) ** 2
+    return min(max(int(math.ceil(math.log2(registers))), 4), 18)
+
+
+class HyperLogLog(object):
+    def __init__(self, precision=None):
+        """Creates a HyperLogLog counter of distinct values with
+        2^`precision` registers (4 to 18). Standard error of the count is
+        about ``1.04 / sqrt(2 ** precision)``, see `hll_precision()`.
+
+        Small counters keep the hashes of the values and are exact; the
+        registers are allocated when the number of hashes would need more
+        memory than the registers."""
+
+        precision = precision or DEFAULT_HLL_PRECISION
+        if not 4 <= precision <= 18:
+            raise ArgumentError("HyperLogLog precision should be between 4 "
+                                "and 18, not %s" % (precision, ))
+
+        self.precision = precision
+        self.registers = None
+        self.hashes = set()
+        self._sparse_limit = (1 << precision) // 16
+
+    def add(self, value):
+        """Adds `value` to the counter."""
+        self._add_hash(_hash64(value))
+
+    def _add_hash(self, x):
+        if self.registers is None:
+            self.hashes.add(x)
+            if len(self.hashes) > self._sparse_limit:
+                self._densify()
+            return
+
+        p = self.precision
+        index = x >> (64 - p)
+        rank = (64 - p) - (x & ((1 << (64 - p)) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def _densify(self):
+        self.registers = bytearray(1 << self.precision)
+        hashes = self.hashes
+        self.hashes = None
+        for x in hashes:
+            self._add_hash(x)
+
+    def merge(self, other):
+        """Merges counter `other` of the same precision into the receiver."""
+        if other.precision != self.precision:
+            raise ArgumentError("Can not merge HyperLogLog of precision %s "
+                                "into precision %s"
+                                % (other.precision, self.precision))
+
+        if other.registers is None:
+            for x in other.hashes:
+                self._add_hash(x)
+            return
+
+        if self.registers is None:
+            self._densify()
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """Returns estimated number of distinct values."""
+        if self.registers is None:
+            return len(self.hashes)
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small range correction
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * m:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+
+class QuantileSketch(object):
+    def __init__(self, k=None, seed=None):
+        """Creates a KLL quantile sketch. Values are kept in levels of
+        compactors, the capacity of a level decreases geometrically from
+        `k` at the top. A full level is sorted and every other value is
+        promoted to the next level with double weight. Rank error is about
+        ``1.7 / k``, memory is about ``3 * k`` values. `seed` makes the
+        selection of promoted values reproducible."""
+
+        self.k = k or DEFAULT_QUANTILE_K
+        self.compactors = [[]]
+        self.count = 0
+        self._random = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1
+
+    def _grow(self):
+        self.compactors.append([])
+        self._max_size = sum(self._capacity(level)
+                             for level in range(len(self.compactors)))
+
+    def add(self, value):
+        """Adds `value` to the sketch."""
+        self.compactors[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for level, items in enumerate(self.compactors):
+            if len(items) >= self._capacity(level):
+                if level + 1 >= len(self.compactors):
+                    self._grow()
+
+                items.sort()
+                offset = self._random.randint(0, 1)
+                self.compactors[level + 1].extend(items[offset::2])
+                del items[:]
+
+                self._size = sum(len(c) for c in self.compactors)
+                if self._size < self._max_size:
+                    break
+
+    def merge(self, other):
+        """Merges sketch `other` into the receiver."""
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+
+        self.count += other.count
+        self._size = sum(len(c) for c in self.compactors)
+        while self._size >= self._max_size:
+            self._compress()
+
+    def quantile(self, q):
+        """Returns approximate `q`-quantile of the values, `q` is between 0
+        and 1. Returns ``None`` if the sketch is empty."""
+        if not 0 <= q <= 1:
+            raise ArgumentError("Quantile should be between 0 and 1, not %s"
+                                % (q, ))
+
+        weighted = sorted((value, 1 << level)
+                          for level, items in enumerate(self.compactors)
+                          for value in items)
+        if not weighted:
+            return None
+
+        total = sum(weight for _, weight in weighted)
+        rank = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= rank:
+                return value
+
+        return weighted[-1][0]
+
+
+class BloomFilter(object):
+    def __init__(self, capacity, error=0.01):
+        """Creates a Bloom filter for `capacity` values with probability of
+        a false positive `error` when the filter is full. The filter takes
+        about ``-1.44 * log2(error)`` bits per value, 10 bits for 1 %.
+        Values that were added are always reported as present."""
+
+        if not 0 < error < 1:
+            raise ArgumentError("Bloom filter error should be between 0 "
+                                "and 1, not %s" % (error, ))
+
+        capacity = max(capacity, 1)
+        size = int(math.ceil(-capacity * math.log(error) / math.log(2) ** 2))
+        self.size = max(size, 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))),
+                              1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: positions are h1 + i * h2
+        x = _hash64(value)
+        h1 = x & 0xffffffff
+        h2 = (x >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        """Adds `value` to the filter."""
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        """Returns ``False`` if `value` was not added, ``True`` if it
+        probably was."""
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+    def merge(self, other):
+        """Merges filter `other` of the same size into the receiver."""
+        if (other.size, other.hash_count) != (self.size, self.hash_count):
+            raise ArgumentError("Can not merge Bloom filters of different "
+                                "size")
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+
+
+def _uniform(rng):
+    """Returns random number from interval (0, 1]."""
+    return 1.0 - rng.random()
+
+
+class Reservoir(object):
+    def __init__(self, size, rng=None):
+        """Creates a reservoir of uniform random sample of `size` items from
+        items added one by one. Uses Algorithm L (Li, 1994): the number of
+        items to skip until the next replacement is drawn at once, therefore
+        random numbers are generated only for the replaced items. `rng` is
+        a `random.Random` instance.
+
+        `items` of the reservoir are tuples (`number`, `item`) where
+        `number` is the position of the item in the stream."""
+
+        if size < 1:
+            raise ArgumentError("Reservoir size should be at least 1, not %s"
+                                % (size, ))
+
+        self.size = size
+        self.items = []
+        self.count = 0
+        self._random = rng or random.Random()
+        self._weight = None
+        self._skip = 0
+
+    def _next(self):
+        self._weight *= math.exp(math.log(_uniform(self._random)) / self.size)
+        self._skip = int(math.log(_uniform(self._random))
+                         / math.log1p(-self._weight))
+
+    def add(self, item):
+        """Adds `item` to the stream."""
+        number = self.count
+        self.count += 1
+
+        if len(self.items) < self.size:
+            self.items.append((number, item))
+            if len(self.items) == self.size:
+                self._weight = 1.0
+                self._next()
+        elif self._skip:
+            self._skip -= 1
+        else:
+            self.items[self._random.randrange(self.size)] = (number, item)
+            self._next()
+
+    def sample(self):
+        """Returns list of the sampled items in the order of the stream."""
+        return [item for number, item in sorted(self.items,
+                                                key=lambda pair: pair[0])]
+
+
+def reservoir_sample(iterable, size, seed=None):
+    """Returns list of uniform random sample of `size` items of `iterable`
+    in their original order, in one pass with memory for `size` items.
+    Skipped items are consumed without a Python call per item. `seed`
+    makes the sample reproducible."""
+
+    reservoir = Reservoir(size, random.Random(seed))
+    iterator = iter(iterable)
+
+    for item in itertools.islice(iterator, size):
+        reservoir.add(item)
+
+    while len(reservoir.items) == size:
+        skip = reservoir._skip
+        item = next(itertools.islice(iterator, skip, None), _missing)
+        if item is _missing:
+            break
+
+        reservoir.count += skip
+        reservoir._skip = 0
+        reservoir.add(item)
+
+    return reservoir.sample()
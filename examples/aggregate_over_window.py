@@ -33,13 +33,12 @@ p.source_object("iterable_data_source", iterable=data, fields=fields)
 # Uncomment this to get SQL operations instead of python iterator
 p.create("default", "data")
 
-# Find last purchase date
-last_purchase = p.fork()
-last_purchase.aggregate(["customer_id"],
-                        [["year", "max"]],
-                        include_count=False)
-last_purchase.rename_fields({"year_max": "last_purchase_year"})
-p.join_details(last_purchase, "customer_id", "customer_id")
+# Find last purchase date of the customer and running total of the amount in
+# one pass over the data
+p.window([["year", "max"]], partition="customer_id", frame="partition")
+p.rename_fields({"year_max": "last_purchase_year"})
+p.window([["amount", "sum"], "row_number"],
+         partition="customer_id", orderby="year")
 
 p.pretty_print()
 
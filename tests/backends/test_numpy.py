@@ -0,0 +1,93 @@
+import unittest
+
+from bubbles import *
+from bubbles.backends.numpy import ColumnsDataObject
+import bubbles.backends.numpy.ops
+import bubbles.ops.rows
+
+class ColumnsBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = OperationContext()
+        self.context.add_operations_from(bubbles.ops.rows)
+        self.context.add_operations_from(bubbles.backends.numpy.ops)
+
+        self.fields = FieldList(("id", "integer"), ("name", "string"),
+                                ("amount", "number"))
+        self.rows = [
+            [1, "apple", 10.0],
+            [2, "pear", None],
+            [3, "apple", 5.0],
+            [4, None, 1.0],
+            [5, "pear", 2.5],
+        ]
+        source = RowListDataObject(self.rows, self.fields)
+        self.obj = self.context.op.as_columns(source, chunk_size=2)
+
+    def ids(self, obj):
+        return [row[0] for row in obj.rows()]
+
+    def test_conversion(self):
+        self.assertIsInstance(self.obj, ColumnsDataObject)
+        self.assertEqual("int64", self.obj.column("id").dtype)
+        self.assertFalse(hasattr(self.obj.column("id"), "mask"))
+        self.assertTrue(self.obj.column("amount").mask[1])
+
+        self.assertEqual(self.rows, [list(row) for row in self.obj.rows()])
+
+    def test_filters(self):
+        op = self.context.op
+        self.assertEqual([1, 3], self.ids(op.filter_by_value(self.obj, "name",
+                                                             "apple")))
+        self.assertEqual([4], self.ids(op.filter_by_value(self.obj, "name",
+                                                          None)))
+        self.assertEqual([2, 4, 5],
+                         self.ids(op.filter_by_set(self.obj, "name",
+                                                   ["pear", None])))
+        self.assertEqual([1, 3],
+                         self.ids(op.filter_by_set(self.obj, "name",
+                                                   ["pear", None],
+                                                   discard=True)))
+        self.assertEqual([3, 5],
+                         self.ids(op.filter_by_range(self.obj, "amount",
+                                                     2, 5)))
+        self.assertEqual([1],
+                         self.ids(op.filter_by_range(self.obj, "amount",
+                                                     6, None)))
+
+    def test_sort_distinct(self):
+        result = self.context.op.sort(self.obj, [("name", "desc"),
+                                                 ("amount", "asc")])
+        # None is the smallest value
+        self.assertEqual([2, 5, 3, 1, 4], self.ids(result))
+
+        result = self.context.op.distinct(self.obj, "name")
+        self.assertEqual(["name"], result.fields.names())
+        self.assertEqual([("apple", ), ("pear", ), (None, )],
+                         list(result.rows()))
+
+    def test_aggregate(self):
+        result = self.context.op.aggregate(self.obj, "name",
+                                           [("amount", "sum"),
+                                            ("amount", "min"),
+                                            ("amount", "max"),
+                                            ("amount", "average")])
+
+        self.assertEqual(["name", "amount_sum", "amount_min", "amount_max",
+                          "amount_average", "record_count"],
+                         result.fields.names())
+        self.assertEqual([("name", "asc")], result.ordering)
+        self.assertEqual([(None, 1.0, 1.0, 1.0, 1.0, 1),
+                          ("apple", 15.0, 5.0, 10.0, 7.5, 2),
+                          ("pear", 2.5, 2.5, 2.5, 2.5, 2)],
+                         list(result.rows()))
+
+        result = self.context.op.aggregate(self.obj, [], ["id"])
+        self.assertEqual([(15, 5)], list(result.rows()))
+
+        # Field types are the same as of the rows aggregation
+        result = self.context.op.aggregate(self.obj, [], [("id", "average")])
+        expected = self.obj.fields.aggregated_fields([("id", "average")])
+        self.assertEqual(["float", "integer"],
+                         [field.storage_type for field in result.fields])
+        self.assertEqual(expected.names(), result.fields.names())
+        self.assertEqual([(3.0, 5)], list(result.rows()))
@@ -1,6 +1,8 @@
 import unittest
 
-from bubbles import FieldList, OperationContext
+from bubbles import FieldList, OperationContext, IterableBatchesDataSource
+from bubbles import RowListDataObject, Operation, ExecutionEngine
+from bubbles.execution.graph import Graph, Node, StoreObjectNode
 from bubbles.errors import ProbeAssertionError
 from bubbles.backends.sql.objects import SQLDataStore
 import bubbles.backends.sql.ops
@@ -34,6 +36,17 @@ class SQLBackendTestCase(unittest.TestCase):
         result = self.context.op.field_filter(self.table, keep=['b', 'a'])
         self.assertListEqual(['b', 'a'], result.fields.names())
 
+    def test_batches(self):
+        batches = list(self.table.batches(2))
+        self.assertEqual([2, 1], [len(batch) for batch in batches])
+
+        target = self.sql_data_store.create('target', self.table.fields,
+                                            replace=True)
+        source = IterableBatchesDataSource(batches, self.table.fields)
+        self.context.op.insert(source, target)
+        self.assertEqual(sorted(self.data),
+                         sorted(tuple(row) for row in target.rows()))
+
     def test_filter_by_value(self):
         result = self.context.op.filter_by_value(self.table, 'b', 2)
         self.assertTrue(all(b == 2 for (_, b, _) in result.rows()))
@@ -64,6 +77,34 @@ class SQLBackendTestCase(unittest.TestCase):
         result = self.context.op.sample(self.table, 2)
         self.assertEqual(2, len(list(result.rows())))
 
+        result = self.context.op.sample(self.table, 2, mode="random")
+        self.assertIn("sql", result.representations())
+        rows = [tuple(row) for row in result.rows()]
+        self.assertEqual(2, len(rows))
+        self.assertTrue(set(rows) <= set(self.data))
+
+        # One row for every value of b
+        result = self.context.op.sample(self.table, 1, mode="random",
+                                        key="b")
+        self.assertIn("sql", result.representations())
+        self.assertEqual([2, 3], sorted(row[1] for row in result.rows()))
+
+    def test_tablesample(self):
+        import bubbles.backends.sql.ops as ops
+        from sqlalchemy.dialects import postgresql
+
+        limit = ops.TABLESAMPLE_MIN_ROWS
+        try:
+            ops.TABLESAMPLE_MIN_ROWS = 1
+            self.assertIsNone(ops._tablesample(self.table, 2))
+
+            self.table.append_from_iterable([(2, 2, i) for i in range(1000)])
+            sampled = ops._tablesample(self.table, 2)
+            statement = str(sampled.compile(dialect=postgresql.dialect()))
+            self.assertIn("TABLESAMPLE bernoulli", statement)
+        finally:
+            ops.TABLESAMPLE_MIN_ROWS = limit
+
     def test_sort(self):
         result = self.context.op.sort(self.table, 'a')
         self.assertListEqual(
@@ -73,6 +114,51 @@ class SQLBackendTestCase(unittest.TestCase):
         self.assertListEqual(
             sorted(self.data, key=lambda x: x[2]), list(result.rows()))
 
+        result = self.context.op.sort(self.table, [('b', 'desc'), 'c'])
+        self.assertEqual([('b', 'desc'), ('c', 'asc')], result.ordering)
+        # Order of a sub-query is not kept
+        result = self.context.op.filter_by_value(result, 'a', 1)
+        self.assertFalse(result.ordering)
+
+    def test_collated_ordering(self):
+        import bubbles.ops.rows
+        self.context.add_operations_from(bubbles.ops.rows)
+
+        store = SQLDataStore('sqlite:///')
+        for name, values in (('master', ['a', 'B', 'c']),
+                             ('detail', ['B', 'c'])):
+            store.connectable.execute("CREATE TABLE %s (name VARCHAR "
+                                      "COLLATE NOCASE, id INTEGER)" % name)
+            for i, value in enumerate(values):
+                store.connectable.execute("INSERT INTO %s VALUES ('%s', %d)"
+                                          % (name, value, i))
+
+        master = self.context.op.sort(store.get_object('master'), 'name')
+        detail = self.context.op.sort(store.get_object('detail'),
+                                      ['name', 'id'])
+        detail = self.context.op.field_filter(detail, rename={'id': 'other'})
+
+        # SQL collation is not Python comparison, strings are not declared
+        # as ordered and the rows are not merged
+        self.assertEqual([], master.ordering)
+        result = self.context.op.join_details(master, detail, 'name', 'name')
+        self.assertEqual([['B', 1, 0], ['c', 2, 1]],
+                         [list(row) for row in result.rows()])
+
+        result = self.context.op.sort(store.get_object('master'),
+                                      ['id', 'name'])
+        self.assertEqual([('id', 'asc')], result.ordering)
+
+    def test_top(self):
+        result = self.context.op.top(self.table, [('c', 'desc')], 2)
+        self.assertIn("sql", result.representations())
+        self.assertEqual([('c', 'desc')], result.ordering)
+        self.assertEqual([5, 4], [row[2] for row in result.rows()])
+
+        result = self.context.op.top(self.table, 'c', 1, partition='b')
+        self.assertEqual([(1, 2, 3), (1, 3, 5)],
+                         [tuple(row) for row in result.rows()])
+
     def test_aggregate(self):
         result = self.context.op.aggregate(self.table, 'b', [('c', 'sum')])
         b_val, c_sum, record_count = list(result.rows())[0]
@@ -82,6 +168,59 @@ class SQLBackendTestCase(unittest.TestCase):
         self.assertEqual(
             sum(1 for (_, b, _) in self.data if b == b_val), record_count)
 
+    def test_aggregate_functions(self):
+        self.table.append_from_iterable([(1, 2, None)])
+        measures = [('c', 'count'), ('c', 'count_nonnull'), ('c', 'average')]
+        result = self.context.op.aggregate(self.table, 'b', measures,
+                                           include_count=False)
+        self.assertEqual([(2, 3, 2, 3.5), (3, 1, 1, 5)],
+                         sorted(tuple(row) for row in result.rows()))
+
+        # Not available in SQLite, aggregated as rows
+        import bubbles.ops.rows
+        self.context.add_operations_from(bubbles.ops.rows)
+        result = self.context.op.aggregate(self.table, 'a', [('c', 'stddev')])
+        self.assertNotIn("sql", result.representations())
+        (a, stddev, count), = result.rows()
+        self.assertEqual(4, count)
+        self.assertAlmostEqual(1.0, stddev)
+
+    def test_window(self):
+        functions = ['row_number', ('c', 'sum'), ('c', 'lag')]
+        result = self.context.op.window(self.table, functions,
+                                        partition='b', orderby='c')
+        self.assertIn("sql", result.representations())
+        self.assertEqual([('b', 'asc'), ('c', 'asc')], result.ordering)
+        self.assertEqual([(1, 2, 3, 1, 3, None), (1, 2, 4, 2, 7, 3),
+                          (1, 3, 5, 1, 5, None)],
+                         [tuple(row) for row in result.rows()])
+
+        result = self.context.op.window(self.table, [('c', 'max')],
+                                        partition='a', frame='partition')
+        self.assertEqual([5, 5, 5], [row[3] for row in result.rows()])
+
+    def test_join_modes(self):
+        detail = self.sql_data_store.create(
+            'detail', FieldList(('c', 'integer'), ('label', 'string')))
+        detail.append_from_iterable([(3, 'three'), (4, 'four'),
+                                     (4, 'four again')])
+
+        result = self.context.op.join_details(self.table, detail, 'c', 'c',
+                                              mode='left')
+        self.assertIn('sql', result.representations())
+        self.assertEqual([(3, 'three'), (4, 'four'), (4, 'four again'),
+                          (5, None)],
+                         sorted((row[2], row[3]) for row in result.rows()))
+
+        result = self.context.op.join_details(self.table, detail, 'c', 'c',
+                                              mode='semi')
+        self.assertEqual(['a', 'b', 'c'], result.fields.names())
+        self.assertEqual([3, 4], sorted(row[2] for row in result.rows()))
+
+        result = self.context.op.join_details(self.table, detail, 'c', 'c',
+                                              mode='anti')
+        self.assertEqual([5], [row[2] for row in result.rows()])
+
     def test_count_duplicates(self):
         # add a duplicate row
         self.table.append_from_iterable([(1,2,3)])
@@ -106,6 +245,11 @@ class SQLBackendTestCase(unittest.TestCase):
         self.assertEqual(2, b_count)
         self.assertEqual(3, c_count)
 
+        # SQLite has no approximate count, the exact one is used
+        result = self.context.op.distinct_count(self.table, 'c',
+                                                approximate=True)
+        self.assertEqual([(3, )], [tuple(row) for row in result.rows()])
+
     def test_assert_unique(self):
         self.context.op.assert_unique(self.table, 'c')
 
@@ -123,3 +267,101 @@ class SQLBackendTestCase(unittest.TestCase):
 
         with self.assertRaises(ProbeAssertionError):
             self.context.op.assert_missing(self.table, 'a', 1)
+
+    def test_added_rows(self):
+        source = RowListDataObject([[1, 2, 4], [2, 2, 7]], self.table.fields)
+        result = self.context.op.added_rows(source, self.table, "c")
+        self.assertEqual([[2, 2, 7]], [list(row) for row in result.rows()])
+
+        # Statements from another database can not be composed, the rows
+        # are probed without trying the composition first
+        other = SQLDataStore('sqlite:///').create('other', self.table.fields)
+        other.append_from_iterable([(1, 2, 4), (2, 2, 7)])
+        result = self.context.op.added_rows(other, self.table, "c")
+        self.assertEqual([[2, 2, 7]], [list(row) for row in result.rows()])
+
+        statement = self.context.op.filter_by_value(self.table, "a", 1)
+        result = self.context.op.added_rows(statement, self.table, "c")
+        self.assertIn("sql", result.representations())
+        self.assertEqual([], list(result.rows()))
+
+    def test_added_rows_strategies(self):
+        import bubbles.backends.sql.ops as ops
+
+        source = RowListDataObject([[1, 2, 4], [2, 2, 7], [None, 3, 5],
+                                    [1, 3, 5], [1, 2, None]],
+                                   self.table.fields)
+        limits = (ops.KEY_SET_LIMIT, ops.BLOOM_FILTER_LIMIT,
+                  ops.PROBE_CHUNK_SIZE)
+        try:
+            ops.PROBE_CHUNK_SIZE = 2
+            # Key set, Bloom filter and queries only
+            for key_set, bloom in ((10, 10), (0, 10), (0, 0)):
+                ops.KEY_SET_LIMIT = key_set
+                ops.BLOOM_FILTER_LIMIT = bloom
+
+                result = self.context.op.added_rows(source, self.table, "c")
+                self.assertEqual([[2, 2, 7], [1, 2, None]],
+                                 [list(row) for row in result.rows()])
+
+                result = self.context.op.added_rows(source, self.table,
+                                                    ["a", "c"])
+                self.assertEqual([[2, 2, 7], [None, 3, 5], [1, 2, None]],
+                                 [list(row) for row in result.rows()])
+
+                # Keys are compared as values of the target type
+                strings = RowListDataObject([["1", "2", "4"], ["x", "2", "x"],
+                                             ["1", "3", "6"]],
+                                            FieldList("a", "b", "c"))
+                result = self.context.op.added_rows(strings, self.table,
+                                                    ["a", "c"])
+                self.assertEqual([["x", "2", "x"], ["1", "3", "6"]],
+                                 [list(row) for row in result.rows()])
+        finally:
+            (ops.KEY_SET_LIMIT, ops.BLOOM_FILTER_LIMIT,
+             ops.PROBE_CHUNK_SIZE) = limits
+
+    def test_insert(self):
+        other = SQLDataStore('sqlite:///').create('other', self.table.fields)
+        self.context.op.insert(self.table, other)
+        self.assertEqual(3, len(other))
+
+        copy = self.sql_data_store.create('copy', self.table.fields)
+        self.context.op.insert(self.table, copy)
+        self.assertEqual(3, len(copy))
+
+    def test_fingerprint(self):
+        self.assertIsNone(self.table.fingerprint())
+
+        table = self.sql_data_store.get_object(
+                    'test', version_query='SELECT count(*) FROM test')
+        fingerprint = table.fingerprint()
+        self.assertEqual(fingerprint, table.fingerprint())
+
+        self.table.append_from_iterable([(2, 2, 6)])
+        self.assertNotEqual(fingerprint, table.fingerprint())
+
+    def test_thread_executor(self):
+        # Every thread has its own in-memory database
+        self.assertTrue(self.table.is_thread_bound())
+
+        rows = []
+        collect = Operation("collect")
+        @collect.register("rows")
+        def _(ctx, obj):
+            rows.extend(tuple(row) for row in obj.rows())
+        self.context.add_operation(collect)
+
+        graph = Graph()
+        graph.add(StoreObjectNode("default", "test"), "source")
+        graph.add(Node("filter_by_value", "b", 2), "filter")
+        graph.add(Node("collect"), "collect")
+        graph.connect("source", "filter")
+        graph.connect("filter", "collect")
+
+        engine = ExecutionEngine(self.context,
+                                 stores={"default": self.sql_data_store},
+                                 executor="thread")
+        engine.run(graph)
+
+        self.assertEqual([(1, 2, 3), (1, 2, 4)], sorted(rows))
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from bubbles import *
+from bubbles.backends.text.objects import CSVSource
+import bubbles.ops.rows
+import bubbles.ops.batches
+
+class BatchesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = OperationContext()
+        self.context.add_operations_from(bubbles.ops.rows)
+        self.fields = FieldList(("id", "integer"), ("name", "string"))
+        self.rows = [[i, "name %d" % (i % 3)] for i in range(10)]
+
+    def test_objects(self):
+        obj = IterableDataSource(iter(self.rows), self.fields)
+        batches = list(obj.batches(4))
+        self.assertEqual([4, 4, 2], [len(batch) for batch in batches])
+
+        obj = IterableBatchesDataSource(batches, self.fields)
+        self.assertEqual(self.rows, list(obj.rows()))
+        self.assertEqual(batches, list(obj.batches()))
+        self.assertEqual({"id": 0, "name": "name 0"}, next(obj.records()))
+
+    def test_dispatch(self):
+        op = self.context.operation("filter_by_value")
+
+        # Batches are used only when chosen explicitly
+        obj = IterableDataSource(iter(self.rows), self.fields)
+        order = op.resolution_order(get_representations(obj))
+        self.assertEqual([Signature("rows"), Signature("batches")], order[:2])
+        obj = IterableBatchesDataSource(iter_batches(self.rows, 4),
+                                        self.fields)
+        order = op.resolution_order(get_representations(obj))
+        self.assertEqual(Signature("batches"), order[0])
+
+        # Rows are converted to batches, but rows are preferred
+        obj = RowListDataObject(self.rows, self.fields)
+        self.assertEqual(["rows", "records"], obj.representations())
+        order = op.resolution_order(get_representations(obj))
+        self.assertEqual([Signature("rows"), Signature("batches")], order[:2])
+
+        result = self.context.op.as_batches(obj, 3)
+        self.assertEqual([3, 3, 3, 1], [len(b) for b in result.batches()])
+
+    def test_operations(self):
+        def run(obj):
+            obj = self.context.op.filter_by_set(obj, "name",
+                                                ["name 0", "name 1"])
+            obj = self.context.op.filter_by_range(obj, "id", 2, 8)
+            obj = self.context.op.field_filter(obj, keep=["name", "id"])
+            obj = self.context.op.append_constant_fields(obj, ["flag"], 1)
+            return [list(row) for row in obj.rows()]
+
+        expected = run(RowListDataObject(self.rows, self.fields))
+        batches = IterableBatchesDataSource(iter_batches(self.rows, 4),
+                                            self.fields)
+
+        self.assertEqual(expected, run(batches))
+        self.assertEqual(["name 0", 3, 1], expected[0])
+
+    def test_csv(self):
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w") as f:
+            f.write("id,name\n1,apple\n2,\n3,pear\n")
+
+        try:
+            source = CSVSource(path)
+            batches = list(source.batches(2))
+            source.release()
+        finally:
+            os.remove(path)
+
+        self.assertEqual([[["1", "apple"], ["2", None]], [["3", "pear"]]],
+                         batches)
+
+if __name__ == "__main__":
+    unittest.main()
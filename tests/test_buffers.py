@@ -0,0 +1,165 @@
+import unittest
+from bubbles import *
+from bubbles.buffers import RowBuffer, RowTee, RowQueue, sorted_rows
+from bubbles.buffers import hash_groups, hash_join
+import random
+
+class RowBufferTestCase(unittest.TestCase):
+    def test_memory(self):
+        buffer = RowBuffer(chunk_size=3)
+        rows = [[i, str(i)] for i in range(10)]
+        buffer.extend(rows)
+
+        self.assertFalse(buffer.is_spilled)
+        self.assertEqual(10, len(buffer))
+        self.assertEqual(rows, list(buffer.rows()))
+        # Buffer can be replayed
+        self.assertEqual(rows, list(buffer.rows()))
+
+    def test_spill(self):
+        buffer = RowBuffer(budget=100, chunk_size=10)
+        rows = [[i, "value %d" % i] for i in range(1000)]
+        buffer.extend(rows)
+        buffer.flush()
+
+        self.assertTrue(buffer.is_spilled)
+        self.assertLessEqual(buffer.memory_size, 100)
+        self.assertEqual(rows, list(buffer.rows()))
+        self.assertEqual(rows, list(buffer.rows()))
+
+        buffer.release()
+        self.assertEqual([], list(buffer.rows()))
+
+    def test_retained(self):
+        rows = [[i] for i in range(100)]
+        obj = IterableDataSource(iter(rows), FieldList("id"))
+
+        retained = obj.retained(budget=10)
+        self.assertFalse(retained.is_consumable())
+        self.assertTrue(retained.buffer.is_spilled)
+        self.assertEqual(rows, list(retained.rows()))
+        self.assertEqual(rows, list(retained.rows()))
+
+        records = list(retained.records())
+        self.assertEqual({"id": 0}, records[0])
+
+class RowTeeTestCase(unittest.TestCase):
+    def test_lockstep(self):
+        rows = [[i] for i in range(1000)]
+        tee = RowTee(iter(rows), 2, max_lag=300)
+        first = tee.cursor(0)
+        second = tee.cursor(1)
+
+        result = [[], []]
+        for row in first:
+            result[0].append(row)
+            result[1].append(next(second))
+            self.assertLessEqual(len(tee._rows), 300)
+
+        self.assertEqual(rows, result[0])
+        self.assertEqual(rows, result[1])
+        self.assertFalse(tee.is_spilled)
+
+    def test_lagging_cursor(self):
+        rows = [[i, "value %d" % i] for i in range(1000)]
+        tee = RowTee(iter(rows), 3, max_lag=100, budget=100)
+
+        self.assertEqual(rows, list(tee.cursor(0)))
+        self.assertTrue(tee.is_spilled)
+        self.assertLessEqual(len(tee._rows), 100)
+
+        self.assertEqual(rows, list(tee.cursor(1)))
+        self.assertEqual(rows, list(tee.cursor(2)))
+        self.assertFalse(tee.is_spilled)
+
+class RowQueueTestCase(unittest.TestCase):
+    def test_rows(self):
+        rows = [[i] for i in range(1000)]
+        self.assertEqual(rows, list(RowQueue(iter(rows), size=2,
+                                             batch_size=10)))
+
+    def test_error(self):
+        def produce():
+            yield [1]
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            list(RowQueue(produce()))
+
+    def test_close(self):
+        produced = []
+        def produce():
+            for i in range(1000):
+                produced.append(i)
+                yield [i]
+
+        queue = RowQueue(produce(), size=1, batch_size=10)
+        iterator = iter(queue)
+        self.assertEqual([0], next(iterator))
+        iterator.close()
+
+        # Producer is stopped and holds at most two batches ahead
+        self.assertFalse(queue._thread.is_alive())
+        self.assertLessEqual(len(produced), 30)
+
+class SortedRowsTestCase(unittest.TestCase):
+    def test_external(self):
+        rows = [[random.randint(0, 50), i] for i in range(1000)]
+        key = lambda row: row[0]
+
+        self.assertEqual(sorted(rows, key=key),
+                         list(sorted_rows(rows, key=key, run_size=64)))
+        self.assertEqual(sorted(rows, key=key, reverse=True),
+                         list(sorted_rows(rows, key=key, reverse=True,
+                                          run_size=64)))
+        # Input shorter than a run is sorted in memory
+        self.assertEqual(sorted(rows), list(sorted_rows(rows)))
+
+        with self.assertRaises(ArgumentError):
+            sorted_rows(rows, run_size=-1)
+
+class HashGroupsTestCase(unittest.TestCase):
+    def groups(self, items, **kwargs):
+        def update(state, value):
+            state[0] += value
+        def merge(state, other):
+            state[0] += other[0]
+
+        groups = hash_groups(items, lambda: [0], update, merge, **kwargs)
+        return {key: state[0] for key, state in groups}
+
+    def test_spill(self):
+        items = [(random.randint(0, 300), i) for i in range(2000)]
+        expected = self.groups(items)
+
+        self.assertEqual(expected, self.groups(items, max_groups=10,
+                                               partition_count=4))
+        self.assertEqual(expected, self.groups(items, max_groups=1,
+                                               partition_count=2))
+
+
+class HashJoinTestCase(unittest.TestCase):
+    def join(self, build, probe, **kwargs):
+        return [(value, sorted(matches))
+                for value, matches in hash_join(build, probe, **kwargs)]
+
+    def test_join(self):
+        build = [(1, "a"), (2, "b"), (1, "c"), (None, "x")]
+        probe = [(1, 10), (3, 11), (None, 12), (2, 13)]
+
+        self.assertEqual([(10, ["a", "c"]), (11, []), (12, []), (13, ["b"])],
+                         self.join(build, probe))
+
+    def test_spill(self):
+        build = [(random.randint(0, 300), i) for i in range(2000)]
+        probe = [(random.choice([None, random.randint(0, 400)]), i)
+                 for i in range(1000)]
+        expected = self.join(build, probe)
+
+        self.assertEqual(expected, self.join(build, probe, max_rows=50,
+                                             partition_count=4))
+        self.assertEqual(expected, self.join(build, probe, max_rows=1,
+                                             partition_count=2))
+
+if __name__ == "__main__":
+    unittest.main()
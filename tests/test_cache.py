@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import unittest
+from bubbles import *
+from bubbles.backends.text.objects import CSVSource
+from bubbles.execution.cache import ResultCache, CachedDataObject
+from bubbles.execution.cache import node_fingerprint
+import bubbles.ops.rows
+
+_LIMIT = 1
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.path, "data.csv")
+        self.write_csv([["1", "apple"], ["2", "pear"]])
+
+        self.context = OperationContext()
+        self.context.add_operations_from(bubbles.ops.rows)
+
+        self.calls = 0
+        self.collected = []
+
+        count_calls = Operation("count_calls")
+        @count_calls.register("rows")
+        def _(ctx, obj):
+            self.calls += 1
+            return IterableDataSource(obj.rows(), obj.fields)
+
+        collect = Operation("collect")
+        @collect.register("rows")
+        def _(ctx, obj):
+            self.collected.append([list(row) for row in obj.rows()])
+
+        self.context.add_operation(count_calls)
+        self.context.add_operation(collect)
+
+        self.cache = ResultCache(os.path.join(self.path, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_csv(self, rows):
+        with open(self.csv_path, "w") as f:
+            f.write("id,name\n")
+            for row in rows:
+                f.write(",".join(row) + "\n")
+
+    def graph(self, source=None):
+        graph = Graph()
+        graph.add(ObjectNode(source or CSVSource(self.csv_path)), "source")
+        graph.add(Node("count_calls"), "count")
+        graph.add(Node("filter_by_value", "name", "pear", discard=True),
+                  "filter")
+        graph.add(Node("collect"), "collect")
+        graph.connect("source", "count")
+        graph.connect("count", "filter")
+        graph.connect("filter", "collect")
+        return graph
+
+    def test_reuse(self):
+        engine = ExecutionEngine(self.context, cache=self.cache)
+
+        engine.run(self.graph())
+        engine.run(self.graph())
+
+        self.assertEqual(1, self.calls)
+        self.assertEqual([[["1", "apple"]], [["1", "apple"]]], self.collected)
+
+    def test_changed_source(self):
+        engine = ExecutionEngine(self.context, cache=self.cache)
+        engine.run(self.graph())
+
+        self.write_csv([["1", "apple"], ["2", "pear"], ["3", "plum"]])
+        engine.run(self.graph())
+
+        self.assertEqual(2, self.calls)
+        self.assertEqual([["1", "apple"], ["3", "plum"]], self.collected[-1])
+
+    def test_changed_arguments(self):
+        engine = ExecutionEngine(self.context, cache=self.cache)
+        engine.run(self.graph())
+
+        graph = self.graph()
+        graph.node("filter").kwargs["discard"] = False
+        engine.run(graph)
+
+        # Only the filter is evaluated again
+        self.assertEqual(1, self.calls)
+        self.assertEqual([["2", "pear"]], self.collected[-1])
+
+    def test_cache_nodes(self):
+        engine = ExecutionEngine(self.context, cache=self.cache,
+                                 cache_nodes=["filter"])
+        engine.run(self.graph())
+        self.assertEqual(1, len(os.listdir(self.cache.path)))
+
+        engine.run(self.graph())
+        self.assertEqual(1, self.calls)
+
+        # Results that were not read to the end are not cached
+        self.cache.clear()
+        source = CSVSource(self.csv_path)
+        result = self.cache.write_through("partial", source)
+        next(result.rows())
+        result.rows().close()
+        self.assertEqual([], os.listdir(self.cache.path))
+
+    def test_function_fingerprint(self):
+        def fingerprint(function):
+            node = Node("filter_by_predicate", ["id"], function)
+            return node_fingerprint(node, ["input"])
+
+        self.assertIsNotNone(fingerprint(lambda value: value > 1))
+        self.assertEqual(fingerprint(lambda value: value > 1),
+                         fingerprint(lambda value: value > 1))
+        self.assertNotEqual(fingerprint(lambda value: value > 1),
+                            fingerprint(lambda value: value > 2))
+
+        # Defaults and globals might change without changing the code
+        self.assertIsNone(fingerprint(lambda value, limit=1: value > limit))
+        self.assertIsNone(fingerprint(lambda value: value > _LIMIT))
+
+    def test_ordering(self):
+        graph = Graph()
+        graph.add(ObjectNode(CSVSource(self.csv_path)), "source")
+        graph.add(Node("sort", "name"), "sort")
+        graph.add(Node("collect"), "collect")
+        graph.connect("source", "sort")
+        graph.connect("sort", "collect")
+
+        engine = ExecutionEngine(self.context, cache=self.cache)
+        engine.run(graph)
+
+        # Second run reads the sorted rows from the cache
+        plan = engine.execution_plan(graph)
+        engine.apply_cache(plan)
+        step = [step for step in plan.steps if step.name == "sort"][0]
+        self.assertIsInstance(step.result, CachedDataObject)
+        self.assertEqual([("name", "asc")], step.result.ordering)
+
+    def test_sql_not_cached(self):
+        from bubbles.backends.sql.objects import SQLDataStore
+        import bubbles.backends.sql.ops
+        self.context.add_operations_from(bubbles.backends.sql.ops)
+
+        store = SQLDataStore("sqlite:///")
+        table = store.create("test", FieldList(("id", "integer"),
+                                               ("name", "string")))
+        table.append_from_iterable([(1, "apple"), (2, "pear")])
+        table = store.get_object("test", version_query="SELECT 1")
+
+        graph = Graph()
+        graph.add(ObjectNode(table), "source")
+        graph.add(Node("filter_by_value", "name", "pear"), "filter")
+        graph.add(Node("aggregate", [], ["id"]), "aggregate")
+        graph.connect("source", "filter")
+        graph.connect("filter", "aggregate")
+
+        engine = ExecutionEngine(self.context, cache=self.cache)
+        plan = engine.execution_plan(graph)
+        engine._run_sequentially(engine.apply_cache(plan))
+
+        # Statements are composed, not materialized
+        self.assertIn("sql", plan.steps[-1].result.representations())
+        self.assertEqual([], os.listdir(self.cache.path))
+
+    def test_no_fingerprint(self):
+        engine = ExecutionEngine(self.context, cache=self.path)
+        fields = FieldList("id", "name")
+
+        for i in range(2):
+            source = RowListDataObject([["1", "apple"]], fields)
+            engine.run(self.graph(source))
+
+        self.assertEqual(2, self.calls)
+        self.assertIsNone(node_fingerprint(Node("collect"), [None]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -400,5 +400,73 @@ class OperationTestCase(unittest.TestCase):
         self.assertEqual("sql", c.op.meditate(objsql))
         self.assertEqual("rows", c.op.meditate(objrows))
 
+    def test_dispatch_cache(self):
+        obj = DummyDataObject(["sql", "rows"])
+
+        walk = Operation("walk", ["obj"])
+        @walk.register("rows")
+        def _(ctx, obj):
+            return "rows"
+
+        c = OperationContext()
+        c.add_operation(walk)
+
+        self.assertEqual("rows", c.op.walk(obj))
+        self.assertEqual(1, len(c._dispatch_cache))
+        self.assertEqual("rows", c.op.walk(obj))
+        self.assertEqual(1, len(c._dispatch_cache))
+
+        # Registering a function invalidates the cached order
+        @walk.register("sql")
+        def _(ctx, obj):
+            return "sql"
+
+        self.assertEqual("sql", c.op.walk(obj))
+
+        # Replaced operation is not taken from the cache
+        run = Operation("walk", ["obj"])
+        @run.register("rows")
+        def _(ctx, obj):
+            return "run"
+
+        c.add_operation(run)
+        self.assertEqual(0, len(c._dispatch_cache))
+        self.assertEqual("run", c.op.walk(obj))
+
+    def test_cost(self):
+        obj = DummyDataObject(["sql", "text", "rows"])
+
+        size = Operation("size", ["obj"])
+        @size.register("sql", cost=lambda ctx, obj, cost: cost)
+        def _(ctx, obj, cost):
+            return "sql"
+
+        @size.register("text")
+        def _(ctx, obj, cost):
+            return "text"
+
+        @size.register("rows", cost=lambda ctx, obj, cost: 10)
+        def _(ctx, obj, cost):
+            return "rows"
+
+        c = OperationContext()
+        c.add_operation(size)
+
+        self.assertEqual("sql", c.op.size(obj, 1))
+        # Equal cost keeps the resolution order
+        self.assertEqual("sql", c.op.size(obj, 10))
+        # Signature without estimator keeps its position
+        self.assertEqual(["rows", "text", "sql"],
+                         [str(sig) for sig in
+                          size.order_by_cost(size.signatures(), c, obj, 20)])
+        self.assertEqual("rows", c.op.size(obj, 20))
+
+        # Unusable signatures are tried last
+        signatures = [Signature("sql"), Signature("text")]
+        self.assertEqual(["text", "sql"],
+                         [str(sig) for sig in
+                          size.order_by_cost(signatures, c, obj,
+                                             INFINITE_COST)])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,203 @@
+import threading
+import unittest
+from bubbles import *
+import bubbles.ops.rows
+import bubbles.ops.batches
+
+class ExecutionEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = OperationContext()
+        self.barrier = threading.Barrier(3, timeout=5)
+        self.log = []
+
+        wait = Operation("wait")
+        @wait.register("rows")
+        def _(ctx, obj, label):
+            self.barrier.wait()
+            self.log.append(label)
+            return obj
+
+        touch = Operation("touch")
+        @touch.register("rows")
+        def _(ctx, obj, label):
+            self.log.append(label)
+            return obj
+
+        fail = Operation("fail")
+        @fail.register("rows")
+        def _(ctx, obj):
+            raise ValueError("failed")
+
+        collect = Operation("collect")
+        @collect.register("rows")
+        def _(ctx, obj, label):
+            self.log.append((label, list(obj.rows())))
+
+        self.context.add_operation(collect)
+        self.context.add_operation(wait)
+        self.context.add_operation(touch)
+        self.context.add_operation(fail)
+
+        self.source = RowListDataObject([[1], [2]], FieldList("id"))
+
+    def fork_graph(self, opname):
+        graph = Graph()
+        graph.add(ObjectNode(self.source), "src")
+
+        for label in ("a", "b", "c"):
+            graph.add(Node(opname, label), label)
+            graph.connect("src", label)
+
+        graph.add(Node("touch", "end"), "end")
+        graph.connect("a", "end")
+
+        return graph
+
+    def test_sequential(self):
+        engine = ExecutionEngine(self.context)
+        engine.run(self.fork_graph("touch"))
+
+        self.assertEqual(["a", "b", "c", "end"], sorted(self.log))
+        self.assertLess(self.log.index("a"), self.log.index("end"))
+
+    def test_concurrent(self):
+        # The barrier is passed only if all three branches run at once
+        engine = ExecutionEngine(self.context, executor="thread",
+                                 max_workers=3)
+        engine.run(self.fork_graph("wait"))
+
+        # Branches b and c might finish after the end node
+        self.assertEqual(["a", "b", "c", "end"], sorted(self.log))
+        self.assertLess(self.log.index("a"), self.log.index("end"))
+
+    def test_concurrent_error(self):
+        graph = self.fork_graph("touch")
+        graph.add(Node("fail"), "fail")
+        graph.connect("b", "fail")
+
+        engine = ExecutionEngine(self.context, executor="thread")
+        with self.assertRaises(ValueError):
+            engine.run(graph)
+
+    def test_tee_retention(self):
+        rows = [[i] for i in range(100)]
+        graph = Graph()
+        source = IterableDataSource(iter(rows), FieldList("id"))
+        graph.add(ObjectNode(source), "src")
+
+        for label in ("a", "b"):
+            graph.add(Node("collect", label), label)
+            graph.connect("src", label)
+
+        engine = ExecutionEngine(self.context, retention="tee", max_lag=10)
+        engine.run(graph)
+
+        self.assertEqual([("a", rows), ("b", rows)], sorted(self.log))
+
+    def test_profile(self):
+        picky = Operation("picky")
+        @picky.register("rows")
+        def _(ctx, obj):
+            raise RetryOperation(["records"])
+        @picky.register("records")
+        def _(ctx, obj):
+            return IterableDataSource(obj.rows(), obj.fields)
+
+        self.context.add_operation(picky)
+        self.context.add_operations_from(bubbles.ops.rows)
+
+        rows = [[i % 2] for i in range(100)]
+        graph = Graph()
+        graph.add(ObjectNode(RowListDataObject(rows, FieldList("id"))), "src")
+        graph.add(Node("picky"), "picky")
+        graph.add(Node("filter_by_value", "id", 1), "filter")
+        graph.add(Node("collect", "end"), "end")
+        graph.connect("src", "picky")
+        graph.connect("picky", "filter")
+        graph.connect("filter", "end")
+
+        engine = ExecutionEngine(self.context, profile=True)
+        profile = engine.run(graph)
+
+        self.assertIs(profile, engine.last_profile)
+        steps = dict((step.node, step) for step in profile.steps)
+
+        picky = steps["operation picky"]
+        self.assertEqual("records", picky.signature)
+        self.assertEqual(1, picky.retries)
+        self.assertEqual(100, picky.rows_out)
+
+        filter_step = steps["operation filter_by_value"]
+        self.assertEqual("rows", filter_step.signature)
+        self.assertEqual(100, filter_step.rows_in)
+        self.assertEqual(50, filter_step.rows_out)
+        self.assertLessEqual(filter_step.consumption_time,
+                             filter_step.inclusive_time)
+
+        self.assertEqual(50, steps["operation collect"].rows_in)
+        self.assertEqual(4, len(profile.as_dict()["steps"]))
+        self.assertIn("filter_by_value", str(profile))
+        # Original observer is restored
+        self.assertNotIsInstance(self.context.observer,
+                                 bubbles.execution.profile.ProfilingContextObserver)
+
+        # Source objects are not left wrapped
+        source = graph.node("src").obj
+        self.assertNotIn("rows", vars(source))
+        first = [step.rows_out for step in profile.steps]
+        engine.run(graph)
+        ExecutionEngine(self.context).run(graph)
+        self.assertEqual(first, [step.rows_out for step in profile.steps])
+        self.assertEqual(first, [step.rows_out
+                                 for step in engine.last_profile.steps])
+
+    def test_threaded(self):
+        threads = set()
+
+        def produce():
+            for i in range(1000):
+                threads.add(threading.current_thread())
+                yield [i]
+
+        graph = Graph()
+        source = IterableDataSource(produce(), FieldList("id"))
+        graph.add(ObjectNode(source), "src")
+        graph.add(Node("collect", "a"), "a")
+        graph.connect("src", "a")
+
+        engine = ExecutionEngine(self.context, threaded="io",
+                                 queue_sizes={"src": 2})
+        engine.run(graph)
+
+        self.assertEqual([("a", [[i] for i in range(1000)])], self.log)
+        self.assertNotIn(threading.current_thread(), threads)
+
+        engine = ExecutionEngine(self.context, threaded=["unknown"])
+        with self.assertRaises(ArgumentError):
+            engine.run(graph)
+
+    def test_threaded_error(self):
+        def produce():
+            yield [1]
+            raise ValueError("failed")
+
+        graph = Graph()
+        source = IterableDataSource(produce(), FieldList("id"))
+        graph.add(ObjectNode(source), "src")
+        graph.add(Node("collect", "a"), "a")
+        graph.connect("src", "a")
+
+        engine = ExecutionEngine(self.context, threaded=["src"])
+        with self.assertRaises(ValueError):
+            engine.run(graph)
+
+    def test_invalid_executor(self):
+        with self.assertRaises(ArgumentError):
+            ExecutionEngine(self.context, executor="process")
+        with self.assertRaises(ArgumentError):
+            ExecutionEngine(self.context, retention="copy")
+        with self.assertRaises(ArgumentError):
+            ExecutionEngine(self.context, threaded="all")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from bubbles import *
+from bubbles.fusion import compile_kernels
+from bubbles.common import MissingPackage
+from bubbles.expression import *
+import bubbles.expression
+import bubbles.ops.rows
+
+missing = isinstance(bubbles.expression.expressions, MissingPackage)
+
+
+@unittest.skipIf(missing, "expressions package is not available")
+class ExpressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = OperationContext()
+        self.context.add_operations_from(bubbles.ops.rows)
+
+        self.fields = FieldList(("id", "integer"), ("name", "string"),
+                                ("amount", "integer"))
+        self.rows = [[1, "b", 10], [2, "a", 20], [3, "b", 30],
+                     [4, None, 10]]
+
+    def source(self):
+        return RowListDataObject(list(self.rows), self.fields)
+
+    def test_row_function(self):
+        function = row_function("amount * 2 > 30 and name = 'b'",
+                                self.fields)
+        self.assertEqual([False, False, True, False],
+                         [function(row) for row in self.rows])
+        self.assertIs(function, row_function("amount * 2 > 30 and "
+                                             "name = 'b'", self.fields))
+
+        function = row_function("upper(coalesce(name, 'none')) + 'x'",
+                                self.fields)
+        self.assertEqual("NONEx", function(self.rows[3]))
+
+        function = row_function("name is null", self.fields)
+        self.assertEqual([4], [row[0] for row in self.rows
+                               if function(row)])
+
+        with self.assertRaises(ExpressionError):
+            row_function("unknown > 1", self.fields)
+
+        predicate = lambda_from_predicate("a + b = 3", ["a", "b"])
+        self.assertTrue(predicate(1, 2))
+        self.assertEqual({"amount", "name"},
+                         expression_variables("amount > 1 or name is null"))
+
+    def test_operations(self):
+        result = self.context.op.filter_by_expression(self.source(),
+                                                      "amount > 15")
+        self.assertEqual([2, 3], [row[0] for row in result.rows()])
+
+        result = self.context.op.filter_by_expression(self.source(),
+                                                      "amount > 15",
+                                                      discard=True)
+        self.assertEqual([1, 4], [row[0] for row in result.rows()])
+
+        result = self.context.op.derive(self.source(),
+                                        ("double", "integer"),
+                                        "amount * 2")
+        self.assertEqual("double", result.fields[-1].name)
+        self.assertEqual([20, 40, 60, 20], [row[3] for row in result.rows()])
+
+    def test_kernels(self):
+        kernels = []
+        ops = [("derive", ["total", "id + amount"], {}),
+               ("filter_by_expression", ["total > 20"], {})]
+
+        for opname, args, kwargs in ops:
+            function = default_context.operation(opname).function(
+                                                        Signature("rows"))
+            kernels.append((function._bubbles_row_kernel, args, kwargs))
+
+        function, fields = compile_kernels(self.fields, kernels)
+        self.assertEqual(["id", "name", "amount", "total"], fields.names())
+        self.assertEqual([[2, "a", 20, 22], [3, "b", 30, 33]],
+                         list(function(self.rows)))
+
+    def test_sql(self):
+        from bubbles.backends.sql.objects import SQLDataStore
+        import bubbles.backends.sql.ops
+
+        self.context.add_operations_from(bubbles.backends.sql.ops)
+        store = SQLDataStore("sqlite:///")
+        table = store.create("test", self.fields)
+        table.append_from_iterable(self.rows)
+
+        result = self.context.op.filter_by_expression(table,
+                            "amount > 15 or name is null")
+        self.assertIn("sql", result.representations())
+        self.assertEqual([2, 3, 4], [row[0] for row in result.rows()])
+
+        result = self.context.op.derive(table, "total",
+                                        "coalesce(length(name), 0) + amount")
+        self.assertIn("sql", result.representations())
+        self.assertEqual([11, 21, 31, 10], [row[3] for row in result.rows()])
+
+        # SQL and rows give the same results
+        for discard in (False, True):
+            expected = self.context.op.filter_by_expression(self.source(),
+                                "name = 'b'", discard=discard)
+            result = self.context.op.filter_by_expression(table,
+                                "name = 'b'", discard=discard)
+            self.assertIn("sql", result.representations())
+            self.assertEqual([row[0] for row in expected.rows()],
+                             [row[0] for row in result.rows()])
+
+        expected = self.context.op.derive(self.source(), "half", "amount / 4")
+        result = self.context.op.derive(table, "half", "amount / 4")
+        self.assertEqual([2.5, 5.0, 7.5, 2.5],
+                         [row[3] for row in expected.rows()])
+        self.assertEqual([2.5, 5.0, 7.5, 2.5],
+                         [row[3] for row in result.rows()])
+
+        # Bit shift is not compiled into SQL, evaluated as rows
+        result = self.context.op.derive(table, "shifted", "amount << 1")
+        self.assertNotIn("sql", result.representations())
+        self.assertEqual([20, 40, 60, 20], [row[3] for row in result.rows()])
+
+
+if __name__ == "__main__":
+    unittest.main()
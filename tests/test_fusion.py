@@ -0,0 +1,115 @@
+import unittest
+from bubbles import *
+from bubbles.fusion import compile_kernels
+from bubbles.execution.graph import FusedNode
+import bubbles.ops.rows
+
+class FusionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fields = FieldList(("id", "string"), ("name", "string"),
+                                ("note", "string"), ("amount", "string"))
+        self.rows = [
+            ["1", " apple ", "", "10"],
+            ["2", "banana", "x", "20"],
+            ["3", "  ", "y", "30"],
+            ["4", " cherry", "", "40"],
+        ]
+
+    def cleaning_graph(self):
+        source = IterableDataSource(iter(self.rows), self.fields)
+        self.result = []
+
+        graph = Graph()
+        graph.add(ObjectNode(source), "source")
+        nodes = [
+            Node("field_filter", drop=["note"]),
+            Node("retype", {"id": "integer", "amount": "integer"}),
+            Node("string_strip"),
+            Node("empty_to_missing"),
+            Node("filter_not_empty", "name"),
+            Node("filter_by_range", "amount", 15, None),
+            Node("filter_by_value", "id", 2, discard=True),
+        ]
+        previous = "source"
+        for i, node in enumerate(nodes):
+            name = "step%d" % i
+            graph.add(node, name)
+            graph.connect(previous, name)
+            previous = name
+
+        return graph
+
+    def test_compile(self):
+        context = default_context
+        kernels = []
+        ops = [("field_filter", [], {"keep": ["name", "id"]}),
+               ("string_strip", [], {}),
+               ("filter_by_set", ["name", ["apple"]], {})]
+
+        for opname, args, kwargs in ops:
+            function = context.operation(opname).function(Signature("rows"))
+            kernels.append((function._bubbles_row_kernel, args, kwargs))
+
+        function, fields = compile_kernels(self.fields, kernels)
+
+        self.assertEqual(["name", "id"], fields.names())
+        self.assertEqual([["apple", "1"]], list(function(self.rows)))
+
+    def test_plan(self):
+        engine = ExecutionEngine(default_context, fuse=True)
+        plan = engine.execution_plan(self.cleaning_graph())
+
+        self.assertEqual(2, len(plan.steps))
+        fused = plan.steps[1]
+        self.assertIsInstance(fused.node, FusedNode)
+        self.assertEqual(7, len(fused.node.nodes))
+        self.assertEqual([plan.steps[0]], fused.outlets)
+
+    def test_same_result(self):
+        results = []
+
+        for fuse in (False, True):
+            engine = ExecutionEngine(default_context, fuse=fuse)
+            graph = self.cleaning_graph()
+            plan = engine.execution_plan(graph)
+            engine._run_sequentially(plan)
+
+            results.append(plan.steps[-1].result)
+
+        unfused, fused = results
+        self.assertEqual(["id", "name", "amount"], fused.fields.names())
+        self.assertEqual(unfused.fields.names(), fused.fields.names())
+        self.assertEqual(["integer", "string", "integer"],
+                         [f.storage_type for f in fused.fields])
+
+        expected = [[4, "cherry", 40]]
+        self.assertEqual(expected, [list(row) for row in unfused.rows()])
+        self.assertEqual(expected, [list(row) for row in fused.rows()])
+
+    def test_ordering(self):
+        source = RowListDataObject(self.rows, self.fields)
+        source.ordering = [("note", "asc"), ("name", "asc"), ("id", "asc")]
+
+        node = FusedNode([Node("field_filter", rename={"note": "label"}),
+                          Node("filter_by_value", "id", "2", discard=True),
+                          Node("string_strip", ["name"])])
+        result = node.evaluate(None, default_context, [source])
+
+        # The stripped field ends the ordering
+        self.assertEqual([("label", "asc")], result.ordering)
+
+    def test_not_shared(self):
+        # Node with two consumers is not merged into its consumers
+        graph = self.cleaning_graph()
+        graph.add(Node("field_filter", keep=["id"]), "other")
+        graph.connect("step3", "other")
+
+        engine = ExecutionEngine(default_context, fuse=True)
+        plan = engine.execution_plan(graph)
+
+        fused = [step.node for step in plan.steps
+                 if isinstance(step.node, FusedNode)]
+        self.assertEqual([3, 4], sorted(len(node.nodes) for node in fused))
+
+if __name__ == "__main__":
+    unittest.main()
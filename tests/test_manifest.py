@@ -0,0 +1,44 @@
+import os.path
+import subprocess
+import sys
+import unittest
+from bubbles import *
+from bubbles.execution.manifest import build_manifest, load_manifest
+from bubbles.prototypes import as_records
+
+class ManifestTestCase(unittest.TestCase):
+    def test_manifest_is_current(self):
+        """Regenerate with bubbles.execution.manifest.write_manifest()"""
+        self.assertEqual(build_manifest(), load_manifest())
+
+    def test_lazy_loading(self):
+        """Default context does not import modules of unused backends."""
+
+        script = "\n".join([
+            "import sys",
+            "from bubbles import *",
+            "obj = IterableDataSource([[1, 'a'], [2, 'b']], FieldList('id', 'name'))",
+            "result = default_context.op.filter_by_value(obj, 'id', 2)",
+            "assert [list(row) for row in result.rows()] == [[2, 'b']]",
+            "loaded = [name for name in ('sqlalchemy', 'pymongo',"
+            " 'bubbles.backends.sql.ops') if name in sys.modules]",
+            "print(','.join(loaded))",
+        ])
+
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, "-c", script],
+                                         cwd=path)
+        self.assertEqual("", output.decode("utf-8").strip())
+
+    def test_load_implementations(self):
+        context = OperationContext(manifest=load_manifest())
+        context.add_operation(as_records)
+        context.load_implementations(as_records, [["rows"]])
+        self.assertIn("bubbles.ops.rows", context._loaded_modules)
+        self.assertNotIn("bubbles.backends.sql.ops", context._loaded_modules)
+
+        context.load_operations()
+        self.assertIn("bubbles.backends.sql.ops", context._loaded_modules)
+
+if __name__ == "__main__":
+    unittest.main()
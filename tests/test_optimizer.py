@@ -0,0 +1,185 @@
+import unittest
+from bubbles import *
+from bubbles.execution.optimizer import optimize_graph
+from bubbles.backends.sql.objects import SQLDataStore
+
+class GraphOptimizerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fields = FieldList(("id", "integer"), ("name", "string"),
+                                ("amount", "string"))
+        self.source = ObjectNode(RowListDataObject([], self.fields))
+
+    def chain(self, *nodes, source=None):
+        """Returns a graph with `nodes` connected in a chain."""
+        graph = Graph()
+        graph.add(source or self.source, "source")
+        previous = "source"
+        for i, node in enumerate(nodes):
+            name = "n%d" % i
+            graph.add(node, name)
+            graph.connect(previous, name)
+            previous = name
+        return graph
+
+    def order(self, graph, start="source"):
+        """Returns list of operation names from the source down."""
+        node = graph.node(start)
+        names = []
+        while True:
+            targets = [c.target for c in graph.connections if c.source == node]
+            if not targets:
+                return names
+            node = targets[0]
+            names.append(node.opname)
+
+    def test_filter_past_retype(self):
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("filter_by_value", "name", "apple"))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["filter_by_value", "retype"], self.order(graph))
+
+        # Retyped field changes the compared values
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("filter_by_value", "amount", 10))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["retype", "filter_by_value"], self.order(graph))
+
+    def test_filter_past_projection(self):
+        graph = self.chain(Node("field_filter", rename={"name": "title"}),
+                           Node("append_constant_fields", ["flag"], [1]),
+                           Node("filter_by_set", "title", ["a", "b"]))
+        graph = optimize_graph(graph, default_context)
+
+        self.assertEqual(["filter_by_set", "field_filter",
+                          "append_constant_fields"], self.order(graph))
+        node = graph.node("n2")
+        self.assertEqual("name", node.args[0])
+
+    def test_shared_upstream(self):
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("filter_by_value", "name", "apple"))
+        graph.add(Node("pretty_print"), "other")
+        graph.connect("n0", "other")
+
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual({"default": graph.node("n0")},
+                         graph.sources(graph.node("n1")))
+
+    def test_projection_past_retype(self):
+        graph = self.chain(Node("retype", {"amount": "integer",
+                                           "name": "text"}),
+                           Node("field_filter", drop=["name"],
+                                rename={"amount": "value"}))
+        graph = optimize_graph(graph, default_context)
+
+        self.assertEqual(["field_filter", "retype"], self.order(graph))
+        retype = [node for node in graph.nodes.values()
+                  if getattr(node, "opname", None) == "retype"][0]
+        self.assertEqual({"value": "integer"}, retype.args[0])
+
+    def test_limit_past_row_maps(self):
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("keep_fields", ["id", "amount"]),
+                           Node("sample", 10))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["sample", "field_filter", "retype"],
+                         self.order(graph))
+
+        # Filters change the number of rows
+        graph = self.chain(Node("filter_by_value", "name", "apple"),
+                           Node("sample", 10))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["filter_by_value", "sample"], self.order(graph))
+
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("sample", 10, mode="random"))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["retype", "sample"], self.order(graph))
+
+    def test_sort_limit(self):
+        graph = self.chain(Node("sort", ["amount"]),
+                           Node("retype", {"amount": "integer"}),
+                           Node("sample", 3),
+                           Node("pretty_print"))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["top", "retype", "pretty_print"],
+                         self.order(graph))
+        top = graph.node("n0")
+        self.assertEqual((["amount"], 3), top.args)
+
+    def test_limit_output(self):
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("pretty_print", limit=5))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["sample", "retype", "pretty_print"],
+                         self.order(graph))
+
+        # Sufficient limit is already there
+        graph = self.chain(Node("sample", 2),
+                           Node("retype", {"amount": "integer"}),
+                           Node("pretty_print", limit=5))
+        graph = optimize_graph(graph, default_context)
+        self.assertEqual(["sample", "retype", "pretty_print"],
+                         self.order(graph))
+
+    def test_join_master(self):
+        detail = ObjectNode(RowListDataObject([], FieldList("code", "label")))
+        graph = Graph()
+        graph.add(self.source, "master")
+        graph.add(detail, "detail")
+        graph.add(Node("join_details", "id", "code"), "join")
+        graph.connect("master", "join", "master")
+        graph.connect("detail", "join", "detail")
+        graph.add(Node("filter_by_value", "name", "apple"), "by_name")
+        graph.connect("join", "by_name")
+        graph.add(Node("filter_by_value", "label", "x"), "by_label")
+        graph.connect("by_name", "by_label")
+
+        graph = optimize_graph(graph, default_context)
+
+        self.assertEqual(["filter_by_value", "join_details",
+                          "filter_by_value"], self.order(graph, "master"))
+        self.assertEqual(["join_details", "filter_by_value"],
+                         self.order(graph, "detail"))
+        self.assertEqual("label", graph.node("by_label").args[0])
+
+    def test_sql_source(self):
+        store = SQLDataStore("sqlite:///")
+        table = store.create("test", self.fields)
+        table.append_from_iterable([(1, "apple", "10"), (2, "pear", "20")])
+
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("filter_by_value", "name", "pear"),
+                           source=ObjectNode(table))
+
+        engine = ExecutionEngine(default_context, optimize=True)
+        plan = engine.execution_plan(graph)
+        engine._run_sequentially(plan)
+
+        # The filter is evaluated as a SQL statement
+        self.assertEqual("filter_by_value", plan.steps[1].node.opname)
+        self.assertIn("sql", plan.steps[1].result.representations())
+        self.assertEqual([[2, "pear", 20]],
+                         [list(row) for row in plan.steps[2].result.rows()])
+
+    def test_sql_limit(self):
+        store = SQLDataStore("sqlite:///")
+        table = store.create("test", self.fields)
+        table.append_from_iterable([(i, "apple", str(i)) for i in range(10)])
+
+        graph = self.chain(Node("retype", {"amount": "integer"}),
+                           Node("sample", 3),
+                           source=ObjectNode(table))
+
+        engine = ExecutionEngine(default_context, optimize=True)
+        plan = engine.execution_plan(graph)
+        engine._run_sequentially(plan)
+
+        # The limit is a part of the SQL statement
+        self.assertEqual("sample", plan.steps[1].node.opname)
+        self.assertIn("sql", plan.steps[1].result.representations())
+        self.assertEqual([0, 1, 2],
+                         [row[2] for row in plan.steps[2].result.rows()])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,360 @@
+import unittest
+from bubbles import *
+import bubbles.ops.rows
+import bubbles.buffers
+import bubbles.aggregates
+
+class RowsOperationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = OperationContext()
+        self.context.add_operations_from(bubbles.ops.rows)
+
+        self.fields = FieldList(("id", "integer"), ("name", "string"),
+                                ("amount", "integer"))
+        self.rows = [[1, "b", 10], [2, "a", 20], [3, "b", 30],
+                     [4, "a", 10], [5, "c", 20]]
+
+    def source(self, rows=None):
+        return RowListDataObject(list(rows or self.rows), self.fields)
+
+    def ids(self, obj):
+        return [row[0] for row in obj.rows()]
+
+    def test_sort(self):
+        result = self.context.op.sort(self.source(), ["name", "amount"])
+        self.assertEqual([4, 2, 1, 3, 5], self.ids(result))
+
+        # Sort is stable
+        result = self.context.op.sort(self.source(), [("name", "desc")])
+        self.assertEqual([5, 1, 3, 2, 4], self.ids(result))
+
+        result = self.context.op.sort(self.source(), [("name", "asc"),
+                                                      ("amount", "desc")])
+        self.assertEqual([2, 4, 3, 1, 5], self.ids(result))
+
+        with self.assertRaises(ValueError):
+            self.context.op.sort(self.source(), [("name", "up")])
+
+    def test_external_sort(self):
+        run_size = bubbles.buffers.DEFAULT_SORT_RUN_SIZE
+        bubbles.buffers.DEFAULT_SORT_RUN_SIZE = 2
+        try:
+            result = self.context.op.sort(self.source(),
+                                          [("name", "asc"),
+                                           ("amount", "desc")])
+            self.assertEqual([2, 4, 3, 1, 5], self.ids(result))
+        finally:
+            bubbles.buffers.DEFAULT_SORT_RUN_SIZE = run_size
+
+    def test_ordering(self):
+        result = self.context.op.sort(self.source(), ["name",
+                                                      ("amount", "desc")])
+        self.assertEqual([("name", "asc"), ("amount", "desc")],
+                         result.ordering)
+
+        result = self.context.op.filter_by_value(result, "name", "b")
+        self.assertEqual([("name", "asc"), ("amount", "desc")],
+                         result.ordering)
+
+        renamed = self.context.op.field_filter(result,
+                                               rename={"name": "label"})
+        self.assertEqual([("label", "asc"), ("amount", "desc")],
+                         renamed.ordering)
+
+        # Ordering ends with the first dropped field
+        dropped = self.context.op.field_filter(result, drop=["name"])
+        self.assertEqual([], dropped.ordering)
+
+        retyped = self.context.op.retype(result, {"amount": "number"})
+        self.assertFalse(retyped.ordering)
+
+    def test_sorted_distinct(self):
+        source = self.source()
+        source.ordering = [("name", "asc")]
+
+        # Declared ordering is trusted – only adjacent keys are compared
+        result = self.context.op.distinct(source, "name")
+        self.assertEqual([("b", ), ("a", ), ("b", ), ("a", ), ("c", )],
+                         list(result.rows()))
+
+        source = self.context.op.sort(self.source(), "name")
+        result = self.context.op.distinct(source, "name")
+        self.assertEqual([("a", ), ("b", ), ("c", )], list(result.rows()))
+        self.assertEqual([("name", "asc")], result.ordering)
+
+        source = self.context.op.sort(self.source(), "name")
+        result = self.context.op.distinct_rows(source, "name")
+        self.assertEqual([2, 1, 5], self.ids(result))
+
+        source = self.context.op.sort(self.source(), "name")
+        result = self.context.op.first_unique(source, ["name"],
+                                              discard=True)
+        self.assertEqual([4, 3], self.ids(result))
+
+    def test_sorted_aggregate(self):
+        source = self.context.op.sort(self.source(), [("name", "desc")])
+        result = self.context.op.aggregate(source, "name",
+                                           [("amount", "sum")])
+
+        self.assertEqual([["c", 20, 1], ["b", 40, 2], ["a", 30, 2]],
+                         list(result.rows()))
+        self.assertEqual([("name", "desc")], result.ordering)
+
+    def test_spilled_aggregate(self):
+        rows = [[i, "k%d" % (i % 37), i % 5] for i in range(500)]
+        measures = [("amount", "sum"), ("amount", "max"),
+                    ("amount", "min"), ("amount", "count_nonnull"),
+                    ("amount", "average")]
+
+        result = self.context.op.aggregate(self.source(rows), "name",
+                                           measures)
+        expected = sorted(result.rows())
+
+        limit = bubbles.buffers.DEFAULT_GROUP_LIMIT
+        bubbles.buffers.DEFAULT_GROUP_LIMIT = 4
+        try:
+            result = self.context.op.aggregate(self.source(rows), "name",
+                                               measures)
+            self.assertEqual(expected, sorted(result.rows()))
+        finally:
+            bubbles.buffers.DEFAULT_GROUP_LIMIT = limit
+
+    def test_aggregate_functions(self):
+        rows = [[1, "a", -10], [2, "a", None], [3, "a", -20],
+                [4, "b", None]]
+        measures = [("amount", "min"), ("amount", "max"),
+                    ("amount", "count"), ("amount", "count_nonnull"),
+                    ("amount", "first"), ("amount", "last"),
+                    ("amount", "average")]
+        source = self.context.op.sort(self.source(rows), "name")
+        result = self.context.op.aggregate(source, "name", measures)
+
+        self.assertEqual([["a", -20, -10, 3, 2, -10, -20, -15, 3],
+                          ["b", None, None, 1, 0, None, None, None, 1]],
+                         list(result.rows()))
+        self.assertEqual("integer",
+                         result.fields.field("amount_count").storage_type)
+
+        result = self.context.op.aggregate(self.source(), None,
+                                           [("amount", "stddev")],
+                                           include_count=False)
+        (stddev, ), = result.rows()
+        self.assertAlmostEqual(8.3666, stddev, places=4)
+
+        with self.assertRaises(ArgumentError):
+            self.context.op.aggregate(self.source(), "name",
+                                      [("amount", "mode")])
+
+    def test_merge_aggregates(self):
+        compiled = bubbles.aggregates.compile_aggregates(
+                        [("stddev", 0), ("first", 0), ("last", 0)])
+        values = [4, 8, 15, 16, 23, 42]
+
+        whole = compiled.new()
+        for value in values:
+            compiled.update(whole, [value])
+
+        merged = compiled.new()
+        for chunk in (values[:2], values[2:3], [], values[3:]):
+            partial = compiled.new()
+            for value in chunk:
+                compiled.update(partial, [value])
+            compiled.merge(merged, partial)
+
+        whole = compiled.finalize(whole)
+        merged = compiled.finalize(merged)
+        self.assertAlmostEqual(whole[0], merged[0])
+        self.assertEqual([4, 42], whole[1:])
+        self.assertEqual([4, 42], merged[1:])
+
+    def test_window(self):
+        functions = ["row_number", "rank", ("amount", "sum"),
+                     ("amount", "lag"), ("amount", "lead", 1)]
+        result = self.context.op.window(self.source(), functions,
+                                        partition="name", orderby="amount")
+
+        self.assertEqual(["id", "name", "amount", "row_number", "rank",
+                          "amount_sum", "amount_lag", "amount_lead"],
+                         result.fields.names())
+        self.assertEqual([[4, "a", 10, 1, 1, 10, None, 20],
+                          [2, "a", 20, 2, 2, 30, 10, None],
+                          [1, "b", 10, 1, 1, 10, None, 30],
+                          [3, "b", 30, 2, 2, 40, 10, None],
+                          [5, "c", 20, 1, 1, 20, None, None]],
+                         list(result.rows()))
+        self.assertEqual([("name", "asc"), ("amount", "asc")],
+                         result.ordering)
+
+        # Sorted input is not sorted again
+        source = self.context.op.sort(self.source(), [("amount", "desc")])
+        result = self.context.op.window(source, ["rank", "dense_rank",
+                                                 ("amount", "max")],
+                                        orderby=[("amount", "desc")],
+                                        frame=2)
+        self.assertEqual([[3, 1, 1, 30], [2, 2, 2, 30], [5, 2, 2, 20],
+                          [1, 4, 3, 20], [4, 4, 3, 10]],
+                         [[row[0]] + row[3:] for row in result.rows()])
+
+        result = self.context.op.window(self.source(), [("amount", "max")],
+                                        partition="name",
+                                        frame="partition")
+        self.assertEqual([[2, 20], [4, 20], [1, 30], [3, 30], [5, 20]],
+                         [[row[0], row[3]] for row in result.rows()])
+
+        # Sliding frame gives the values aggregated over the frame rows
+        rows = self.rows + [[6, "c", None], [7, "c", 5], [8, "c", 40]]
+        aggregates = [(function, 2) for function in
+                      ("sum", "count", "count_nonnull", "average", "min",
+                       "max", "stddev", "first")]
+        compiled = bubbles.aggregates.compile_aggregates(aggregates)
+        functions = [("amount", function) for function, _ in aggregates]
+
+        for frame in (1, 2, 3):
+            result = self.context.op.window(self.source(rows), functions,
+                                            orderby="id", frame=frame)
+            for i, row in enumerate(result.rows()):
+                state = compiled.new()
+                for frame_row in rows[max(0, i + 1 - frame):i + 1]:
+                    compiled.update(state, frame_row)
+                self.assertEqual(compiled.finalize(state), row[3:])
+
+        with self.assertRaises(ArgumentError):
+            self.context.op.window(self.source(), [("amount", "sum")],
+                                   frame=0)
+
+    def test_sample(self):
+        result = self.context.op.sample(self.source(), 2)
+        self.assertEqual([1, 2], self.ids(result))
+
+        result = self.context.op.sample(self.source(), 2, mode="nth")
+        self.assertEqual([1, 3, 5], self.ids(result))
+        result = self.context.op.sample(self.source(), 2, mode="nth",
+                                        discard=True)
+        self.assertEqual([2, 4], self.ids(result))
+
+        result = self.context.op.sample(self.source(), 3, mode="random",
+                                        seed=1)
+        ids = self.ids(result)
+        self.assertEqual(3, len(ids))
+        self.assertEqual(sorted(ids), ids)
+        result = self.context.op.sample(self.source(), 3, mode="random",
+                                        seed=1)
+        self.assertEqual(ids, self.ids(result))
+        result = self.context.op.sample(self.source(), 0, mode="random")
+        self.assertEqual([], self.ids(result))
+
+        with self.assertRaises(ArgumentError):
+            self.context.op.sample(self.source(), 2, mode="any")
+
+    def test_stratified_sample(self):
+        result = self.context.op.sample(self.source(), 1, mode="random",
+                                        key="name", seed=1)
+        rows = list(result.rows())
+        self.assertEqual(["a", "b", "c"], sorted(row[1] for row in rows))
+        self.assertEqual(sorted(row[0] for row in rows),
+                         [row[0] for row in rows])
+
+        result = self.context.op.sample(self.source(), 5, mode="random",
+                                        key=["name", "amount"])
+        self.assertEqual([1, 2, 3, 4, 5], self.ids(result))
+
+    def test_top(self):
+        result = self.context.op.top(self.source(), [("amount", "desc")], 3)
+        self.assertEqual([3, 2, 5], self.ids(result))
+        self.assertEqual([("amount", "desc")], result.ordering)
+
+        result = self.context.op.top(self.source(),
+                                     ["amount", ("id", "desc")], 2)
+        self.assertEqual([4, 1], self.ids(result))
+
+        result = self.context.op.top(self.source(), "amount", 1,
+                                     partition="name")
+        self.assertEqual([1, 4, 5], self.ids(result))
+
+        # Sorted input is sliced, partitions are processed one by one
+        ordered = self.context.op.sort(self.source(), "name")
+        result = self.context.op.top(ordered, [("id", "desc")], 1,
+                                     partition="name")
+        self.assertEqual([4, 3, 5], self.ids(result))
+        self.assertEqual([("name", "asc"), ("id", "desc")], result.ordering)
+
+        result = self.context.op.top(self.source(), "amount", 0)
+        self.assertEqual([], self.ids(result))
+
+    def test_pretty_print(self):
+        import io
+
+        target = io.StringIO()
+        self.context.op.pretty_print(self.source(), target, limit=2)
+        lines = target.getvalue().splitlines()
+        self.assertEqual(6, len(lines))
+        self.assertEqual("|id|name|amount|", lines[1])
+        self.assertEqual("| 1|b   |    10|", lines[3])
+
+        target = io.StringIO()
+        self.context.op.pretty_print(self.source(), target, buffer_size=1)
+        lines = target.getvalue().splitlines()
+        self.assertEqual(9, len(lines))
+        self.assertEqual("| 5|c   |    20|", lines[7])
+
+    def test_merge_join(self):
+        detail_fields = FieldList("code", "label")
+        detail = RowListDataObject([["a", "first"], ["b", "x"],
+                                    ["b", "second"], ["d", "fourth"]],
+                                   detail_fields)
+        expected = [[2, "a", 20, "first"], [4, "a", 10, "first"],
+                    [1, "b", 10, "x"], [1, "b", 10, "second"],
+                    [3, "b", 30, "x"], [3, "b", 30, "second"]]
+
+        master = self.context.op.sort(self.source(), "name")
+        detail.ordering = [("code", "asc")]
+
+        result = self.context.op.join_details(master, detail, "name", "code")
+        self.assertEqual(expected, [list(row) for row in result.rows()])
+        self.assertEqual(master.ordering, result.ordering)
+
+        # Same result without the ordering
+        detail.ordering = ()
+        master = self.context.op.sort(self.source(), "name")
+        result = self.context.op.join_details(master, detail, "name", "code")
+        self.assertEqual(expected, [list(row) for row in result.rows()])
+
+    def test_join_modes(self):
+        detail_fields = FieldList("code", "amount", "label")
+        detail = RowListDataObject([["a", 20, "a20"], ["b", 10, "b10"],
+                                    ["b", 10, "b10 again"], [None, 10, "-"]],
+                                   detail_fields)
+        key = ["name", "amount"]
+        detail_key = ["code", "amount"]
+
+        result = self.context.op.join_details(self.source(), detail, key,
+                                              detail_key, mode="left")
+        self.assertEqual(["id", "name", "amount", "label"],
+                         result.fields.names())
+        self.assertEqual([[1, "b10"], [1, "b10 again"], [2, "a20"],
+                          [3, None], [4, None], [5, None]],
+                         [[row[0], row[3]] for row in result.rows()])
+
+        result = self.context.op.join_details(self.source(), detail, key,
+                                              detail_key, mode="semi")
+        self.assertEqual(["id", "name", "amount"], result.fields.names())
+        self.assertEqual([1, 2], self.ids(result))
+
+        result = self.context.op.join_details(self.source(), detail, key,
+                                              detail_key, mode="anti")
+        self.assertEqual([3, 4, 5], self.ids(result))
+
+        with self.assertRaises(ArgumentError):
+            self.context.op.join_details(self.source(), detail, key,
+                                         detail_key, mode="outer")
+
+        # Master smaller than the detail is the build side
+        detail = RowListDataObject([["b", 10, "b%d" % i] for i in range(20)],
+                                   detail_fields)
+        result = self.context.op.join_details(self.source(), detail, key,
+                                              detail_key)
+        self.assertEqual(20, len(list(result.rows())))
+        self.assertFalse(result.ordering)
+
+if __name__ == "__main__":
+    unittest.main()
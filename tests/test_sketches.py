@@ -0,0 +1,167 @@
+import pickle
+import random
+import unittest
+from bubbles import *
+from bubbles.sketches import *
+import bubbles.ops.rows
+import bubbles.ops.audit
+
+class HyperLogLogTestCase(unittest.TestCase):
+    def test_small_count_is_exact(self):
+        hll = HyperLogLog()
+        for value in ["a", "b", "a", None, 3, 3]:
+            hll.add(value)
+        self.assertEqual(4, hll.count())
+        self.assertIsNone(hll.registers)
+
+    def test_estimate(self):
+        hll = HyperLogLog(precision=hll_precision(0.02))
+        for i in range(50000):
+            hll.add(i % 20000)
+        self.assertAlmostEqual(20000, hll.count(), delta=20000 * 0.06)
+
+    def test_merge(self):
+        first = HyperLogLog()
+        second = HyperLogLog()
+        for i in range(30000):
+            first.add(i)
+        for i in range(20000, 40000):
+            second.add(i)
+        second.add("extra")
+
+        first.merge(pickle.loads(pickle.dumps(second)))
+        self.assertAlmostEqual(40001, first.count(), delta=40001 * 0.06)
+
+        with self.assertRaises(ArgumentError):
+            first.merge(HyperLogLog(precision=10))
+
+    def test_precision(self):
+        self.assertEqual(14, hll_precision(0.01))
+        with self.assertRaises(ArgumentError):
+            HyperLogLog(precision=20)
+
+
+class QuantileSketchTestCase(unittest.TestCase):
+    def test_quantiles(self):
+        sketch = QuantileSketch(seed=1)
+        self.assertIsNone(sketch.quantile(0.5))
+
+        values = list(range(100000))
+        random.Random(2).shuffle(values)
+        for value in values:
+            sketch.add(value)
+
+        self.assertEqual(100000, sketch.count)
+        self.assertLess(sum(len(c) for c in sketch.compactors), 1000)
+        for q in (0.1, 0.5, 0.95, 0.99):
+            self.assertAlmostEqual(q * 100000, sketch.quantile(q),
+                                   delta=100000 * 0.02)
+
+        with self.assertRaises(ArgumentError):
+            sketch.quantile(95)
+
+    def test_merge(self):
+        first = QuantileSketch(seed=1)
+        second = QuantileSketch(seed=2)
+        for value in range(0, 50000):
+            first.add(value)
+        for value in range(50000, 60000):
+            second.add(value)
+
+        first.merge(second)
+        self.assertEqual(60000, first.count)
+        self.assertAlmostEqual(30000, first.quantile(0.5), delta=60000 * 0.02)
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def test_membership(self):
+        bloom = BloomFilter(1000, error=0.01)
+        for i in range(1000):
+            bloom.add((i, "key"))
+
+        self.assertTrue(all((i, "key") in bloom for i in range(1000)))
+        false_positives = sum((i, "key") in bloom
+                              for i in range(1000, 11000))
+        self.assertLess(false_positives, 300)
+
+        with self.assertRaises(ArgumentError):
+            BloomFilter(10, error=0)
+
+
+class ReservoirTestCase(unittest.TestCase):
+    def test_uniform_sample(self):
+        counts = [0] * 20
+        for seed in range(2000):
+            sample = reservoir_sample(range(20), 5, seed=seed)
+            self.assertEqual(5, len(sample))
+            self.assertEqual(sorted(sample), sample)
+            for item in sample:
+                counts[item] += 1
+
+        # Every item is sampled with probability 1/4
+        for count in counts:
+            self.assertAlmostEqual(500, count, delta=100)
+
+    def test_reservoir(self):
+        self.assertEqual([0, 1, 2], reservoir_sample(range(3), 5))
+        self.assertEqual(reservoir_sample(range(1000), 10, seed=1),
+                         reservoir_sample(range(1000), 10, seed=1))
+
+        reservoir = Reservoir(10, random.Random(1))
+        for i in range(1000):
+            reservoir.add(i)
+        self.assertEqual(1000, reservoir.count)
+        self.assertEqual(reservoir_sample(range(1000), 10, seed=1),
+                         reservoir.sample())
+
+
+class ApproximateOperationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = OperationContext()
+        self.context.add_operations_from(bubbles.ops.rows)
+        self.context.add_operations_from(bubbles.ops.audit)
+
+        self.fields = FieldList(("group", "string"), ("value", "integer"))
+        self.rows = [["a" if i % 2 else "b", i % 1000] for i in range(10000)]
+
+    def test_aggregate(self):
+        source = RowListDataObject(self.rows, self.fields)
+        measures = [("value", "count_distinct_approx"), ("value", "median"),
+                    ("value", "p99")]
+        result = self.context.op.aggregate(source, "group", measures)
+        self.assertEqual("integer", result.fields.field(
+                            "value_count_distinct_approx").storage_type)
+
+        result = {row[0]: row[1:] for row in result.rows()}
+        self.assertAlmostEqual(500, result["a"][0], delta=25)
+        self.assertAlmostEqual(500, result["a"][1], delta=20)
+        self.assertAlmostEqual(990, result["b"][2], delta=20)
+        self.assertEqual(5000, result["b"][3])
+
+    def test_distinct_count(self):
+        source = RowListDataObject(self.rows, self.fields)
+        result = self.context.op.distinct_count(source)
+        self.assertEqual([[2, 1000]], [list(row) for row in result.rows()])
+
+        result = self.context.op.distinct_count(source, "value",
+                                                approximate=True)
+        (count, ), = result.rows()
+        self.assertAlmostEqual(1000, count, delta=50)
+
+        # None is not a distinct value, as in SQL
+        source = RowListDataObject([["a"], [None], ["a"], [None]],
+                                   FieldList("group"))
+        for approximate in (False, True):
+            result = self.context.op.distinct_count(source,
+                                                    approximate=approximate)
+            self.assertEqual([[1]], [list(row) for row in result.rows()])
+
+    def test_audit(self):
+        source = RowListDataObject(self.rows, self.fields)
+        result = self.context.op.basic_audit(source, distinct_threshold=10)
+        stats = {record["field"]: record for record in result.records()}
+        self.assertFalse(stats["group"]["distinct_overflow"])
+        self.assertEqual(2, stats["group"]["distinct_count"])
+        self.assertTrue(stats["value"]["distinct_overflow"])
+        self.assertAlmostEqual(1000, stats["value"]["distinct_count"],
+                               delta=50)